@@ -0,0 +1,65 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Bit array set membership filter with no false negatives
+    -- Used to reject ISBNs that cannot exist without asking the database
+    """
+    __slots__ = ["__bits", "__num_bits", "__num_hashes", "__count"]
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        :param capacity: Expected number of items
+        :param error_rate: Target false positive rate at capacity
+        """
+        capacity = max(capacity, 1)
+
+        self.__num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.__num_hashes = max(1, round(self.__num_bits / capacity * math.log(2)))
+        self.__bits = bytearray((self.__num_bits + 7) // 8)
+        self.__count = 0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __positions(self, item: str):
+        """
+        Bit positions of an item using double hashing of one 128 bit digest
+
+        :param item: Item to hash
+        :return: Generator of bit positions
+        """
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        for i in range(self.__num_hashes):
+            yield (first + i * second) % self.__num_bits
+
+    def add(self, item: str) -> None:
+        for position in self.__positions(item):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+
+        self.__count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.__bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(item))
+
+    @classmethod
+    def build(cls, items: list[str], error_rate: float = 0.01, headroom: float = 1.5):
+        """
+        Bulk build a filter from every known item
+
+        :param items: Items to add
+        :param error_rate: Target false positive rate
+        :param headroom: Extra capacity for items added later
+        :return: BloomFilter
+        """
+        bloom = cls(int(len(items) * headroom), error_rate)
+
+        for item in items:
+            bloom.add(item)
+
+        return bloom
@@ -0,0 +1,175 @@
+from array import array
+import math
+import sys
+
+import numpy as np
+
+AUDIENCES = ("Kids", "Teens", "Adults", "Unknown")
+
+_AUDIENCE_CODES = dict((audience, code) for code, audience in enumerate(AUDIENCES))
+
+
+def _audience_code(audience: str) -> int:
+    return _AUDIENCE_CODES.get(audience, len(AUDIENCES) - 1)
+
+
+class BookRow:
+    """
+    One book of a result, indexable and iterable like the tuple(name, authors, publisher, length, audience, rating,
+    isbn) rows it replaces
+    """
+    __slots__ = ["title", "authors", "publisher", "length", "audience", "rating", "isbn"]
+
+    def __init__(self, title: str, authors: str, publisher: str, length: int, audience: str, rating: float | None,
+                 isbn: str | None = None):
+        self.title = title
+        self.authors = authors
+        self.publisher = publisher
+        self.length = length
+        self.audience = audience
+        self.rating = rating
+        self.isbn = isbn
+
+    @property
+    def author_names(self) -> list[str]:
+        return self.authors.split(", ") if self.authors else []
+
+    def __iter__(self):
+        return iter((self.title, self.authors, self.publisher, self.length, self.audience, self.rating, self.isbn))
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        return tuple(self) == tuple(other) if isinstance(other, (BookRow, tuple)) else NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        return f"BookRow{tuple(self)!r}"
+
+
+class BookResultSet:
+    """
+    Column store of the books a query returned
+    -- Repeated author lists and publishers are interned so equal strings are kept once
+    -- Lengths, audiences and ratings are packed into arrays, missing ratings as NaN
+    -- BookRow objects are only built when a row is accessed
+    """
+    __slots__ = ["__titles", "__authors", "__publishers", "__lengths", "__audiences", "__ratings", "__isbns"]
+
+    def __init__(self, rows = ()):
+        """
+        :param rows: Rows as tuple(name, authors, publisher, length, audience, rating[, isbn])
+        """
+        self.__titles = []
+        self.__authors = []
+        self.__publishers = []
+        self.__lengths = array("l")
+        self.__audiences = array("b")
+        self.__ratings = array("d")
+        self.__isbns = []
+
+        self.extend(rows)
+
+    def extend(self, rows) -> None:
+        """
+        Append rows as returned by the book queries, top lists have no isbn column
+        """
+        for row in rows:
+            title, authors, publisher, length, audience, rating = row[:6]
+
+            self.__titles.append(title)
+            self.__authors.append(sys.intern(authors) if authors is not None else None)
+            self.__publishers.append(sys.intern(publisher) if publisher is not None else None)
+            self.__lengths.append(length if length is not None else 0)
+            self.__audiences.append(_audience_code(audience))
+            self.__ratings.append(float(rating) if rating is not None else math.nan)
+            self.__isbns.append(row[6] if len(row) > 6 else None)
+
+    def __len__(self) -> int:
+        return len(self.__titles)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        rating = self.__ratings[index]
+
+        # User ratings are whole stars, only averages keep their fraction
+        if math.isnan(rating):
+            rating = None
+        elif rating.is_integer():
+            rating = int(rating)
+
+        return BookRow(
+            self.__titles[index], self.__authors[index], self.__publishers[index], self.__lengths[index],
+            AUDIENCES[self.__audiences[index]], rating, self.__isbns[index]
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self) -> str:
+        return f"BookResultSet({len(self)} books)"
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Page counts of every book
+        """
+        return np.array(self.__lengths, dtype=np.int64)
+
+    @property
+    def ratings(self) -> np.ndarray:
+        """
+        Ratings of every book, NaN where unrated
+        """
+        return np.array(self.__ratings, dtype=np.float64)
+
+    def byte_size(self) -> int:
+        """
+        Approximate memory held by the result, e.g. to charge it against a cache budget
+        -- Interned strings shared by several rows are counted once
+
+        :return: Size in bytes
+        """
+        size = sys.getsizeof(self)
+        seen = set()
+
+        for column in (self.__titles, self.__authors, self.__publishers, self.__isbns):
+            size += sys.getsizeof(column)
+
+            for text in column:
+                if text is not None and id(text) not in seen:
+                    seen.add(id(text))
+                    size += sys.getsizeof(text)
+
+        for column in (self.__lengths, self.__audiences, self.__ratings):
+            size += sys.getsizeof(column)
+
+        return size
+
+    def to_list(self) -> list[tuple]:
+        """
+        :return: Rows as plain tuples
+        """
+        return [tuple(row) for row in self]
+
+
+def json_default(value):
+    """
+    json.dumps default encoding book results as lists of rows and anything else as its string
+    """
+    if isinstance(value, BookResultSet):
+        return value.to_list()
+
+    if isinstance(value, BookRow):
+        return list(value)
+
+    return str(value)
@@ -0,0 +1,185 @@
+import hashlib
+import random
+
+# Mersenne prime used for the universal hash family (a * x + b) mod p
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+
+
+class BookSimilarityIndex:
+    """
+    MinHash signatures of every book's genre, author and publisher sets stored in a banded LSH index
+    -- Similar books land in the same bucket in at least one band, so lookups never scan the catalog
+    """
+    __slots__ = ["__features", "__signatures", "__buckets", "__permutations", "__rows_per_band"]
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, num_bands: int = NUM_BANDS, seed: int = 13):
+        if num_permutations % num_bands != 0:
+            raise ValueError("Number of permutations must be divisible by the number of bands")
+
+        generator = random.Random(seed)
+
+        self.__permutations = [
+            (generator.randint(1, MERSENNE_PRIME - 1), generator.randint(0, MERSENNE_PRIME - 1))
+            for _ in range(num_permutations)
+        ]
+        self.__rows_per_band = num_permutations // num_bands
+
+        # isbn -> feature set and isbn -> MinHash signature
+        self.__features = dict()
+        self.__signatures = dict()
+
+        # One bucket table per band: band values -> set of ISBNs
+        self.__buckets = [dict() for _ in range(num_bands)]
+
+    def __len__(self) -> int:
+        return len(self.__features)
+
+    def __contains__(self, isbn: str) -> bool:
+        return isbn in self.__features
+
+    @staticmethod
+    def __hash_feature(feature: str) -> int:
+        """
+        Stable 32 bit hash of a feature (python's hash() is salted per process)
+
+        :param feature: Feature to hash
+        :return: Hash value
+        """
+        return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little")
+
+    def __signature(self, features: frozenset[str]) -> tuple[int, ...]:
+        """
+        Compute the MinHash signature of a feature set
+
+        :param features: Features of the book
+        :return: Signature with one minimum per permutation
+        """
+        hashes = [self.__hash_feature(feature) for feature in features]
+
+        return tuple(
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self.__permutations
+        )
+
+    def __bands(self, signature: tuple[int, ...]):
+        """
+        Split a signature into its bands
+
+        :param signature: Signature to split
+        :return: Generator of tuple(band number, band values)
+        """
+        rows = self.__rows_per_band
+
+        for band in range(len(self.__buckets)):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    @staticmethod
+    def jaccard(first: frozenset[str], second: frozenset[str]) -> float:
+        """
+        Exact Jaccard similarity of two feature sets
+
+        :param first: First feature set
+        :param second: Second feature set
+        :return: |A & B| / |A | B|
+        """
+        if not first and not second:
+            return 0.0
+
+        return len(first & second) / len(first | second)
+
+    def add(self, isbn: str, features) -> None:
+        """
+        Insert or replace a book in the index
+
+        :param isbn: ISBN of the book
+        :param features: Iterable of features, e.g. "genre:3", "author:12", "publisher:7"
+        """
+        self.remove(isbn)
+
+        features = frozenset(features)
+
+        if len(features) == 0:
+            return
+
+        signature = self.__signature(features)
+
+        self.__features[isbn] = features
+        self.__signatures[isbn] = signature
+
+        for band, values in self.__bands(signature):
+            self.__buckets[band].setdefault(values, set()).add(isbn)
+
+    def remove(self, isbn: str) -> bool:
+        """
+        Remove a book from the index
+
+        :param isbn: ISBN of the book
+        :return: If the book was indexed
+        """
+        signature = self.__signatures.pop(isbn, None)
+
+        if signature is None:
+            return False
+
+        del self.__features[isbn]
+
+        for band, values in self.__bands(signature):
+            bucket = self.__buckets[band].get(values)
+
+            if bucket is not None:
+                bucket.discard(isbn)
+
+                if len(bucket) == 0:
+                    del self.__buckets[band][values]
+
+        return True
+
+    def build(self, rows) -> None:
+        """
+        Bulk build the index, replacing anything already stored
+
+        :param rows: Iterable of tuple(isbn, feature)
+        """
+        grouped = dict()
+
+        for isbn, feature in rows:
+            grouped.setdefault(isbn, set()).add(feature)
+
+        self.__features.clear()
+        self.__signatures.clear()
+
+        for bucket in self.__buckets:
+            bucket.clear()
+
+        for isbn, features in grouped.items():
+            self.add(isbn, features)
+
+    def query(self, isbn: str, limit: int = 10) -> list[tuple[str, float]]:
+        """
+        Find the books most similar to a given book
+
+        :param isbn: ISBN of the book to compare against
+        :param limit: Maximum number of neighbours to return
+        :return: List of tuple(isbn, jaccard similarity) in descending similarity
+        """
+        signature = self.__signatures.get(isbn)
+
+        if signature is None:
+            return []
+
+        candidates = set()
+
+        for band, values in self.__bands(signature):
+            candidates |= self.__buckets[band].get(values, set())
+
+        candidates.discard(isbn)
+
+        features = self.__features[isbn]
+        ranked = [(other, self.jaccard(features, self.__features[other])) for other in candidates]
+        ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+
+        return ranked[:limit]
@@ -0,0 +1,238 @@
+from data_interaction.ChangeListener import ChangeListener
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME, CollectionOperations
+from data_interaction.QueryCache import QueryCache
+from data_interaction.Session import Session
+
+# Seconds each cached method's results stay valid
+# Per-user entries are invalidated by change notifications so their TTLs only bound missed events
+CACHE_TTLS = {
+    "get_book_by_isbn": 3600,
+    "list_collections": 3600,
+    "get_collection_contents": 3600,
+    "get_top_books": 3600,
+    "get_profile_summary": 3600,
+    "get_reading_stats": 3600,
+    "get_top_recent_books": 300,
+    "get_top_new_releases": 300,
+}
+
+# Cached methods whose results are the same for every user, shared by all sessions
+SHARED_RESULTS = {"get_top_recent_books", "get_top_new_releases"}
+
+
+class CachedDataInteraction(DataInteraction):
+    """
+    Read-through cache in front of DataInteraction
+    -- Results are keyed by method, arguments and the session's user, so sessions of the same user share entries
+    -- Results of SHARED_RESULTS methods are keyed without the user and shared by every session
+    -- Write methods invalidate exactly the entries they can change through tags:
+       ("isbn", isbn), ("user", username) and ("collections", username)
+    -- Writes made by other processes and catalog changes arrive as the same tags through LISTEN/NOTIFY
+    """
+    __slots__ = ["__cache", "__listener"]
+
+    def __init__(self, cache: QueryCache = None, config_filename: str = CONFIG_FILENAME, pool_size: int = None):
+        self.__listener = None
+
+        super().__init__(config_filename, pool_size)
+
+        self.__cache = QueryCache() if cache is None else cache
+
+        self.__listener = ChangeListener(self.open_connection, self.__cache.invalidate, self.__cache.clear)
+        self.__listener.start()
+
+    def __read_through(self, method: str, args: tuple, tags: list, loader, session: Session = None):
+        """
+        Return a cached result or load and cache it
+
+        :param method: Name of the cached method
+        :param args: Arguments that identify the result
+        :param tags: Tags to invalidate the result by
+        :param loader: Function running the actual query
+        :param session: Session the result is loaded for
+        :return: Query result
+        """
+        if method in SHARED_RESULTS:
+            key = (method,) + args
+        else:
+            key = (method, self.get_current_user(session)) + args
+
+        value = self.__cache.get(key)
+
+        if value is not QueryCache.MISS:
+            return value
+
+        generation = self.__cache.generation()
+        value = loader()
+
+        # Failed queries are never cached
+        if value is not False:
+            self.__cache.put(key, value, CACHE_TTLS[method], tags, generation)
+
+        return value
+
+    def get_cache_stats(self) -> dict[str, int]:
+        return self.__cache.stats()
+
+    def invalidate(self, *tags) -> int:
+        """
+        Drop cached entries by tag
+
+        :param tags: Tags to invalidate
+        :return: Number of entries dropped
+        """
+        return self.__cache.invalidate(*tags)
+
+    def shutdown(self):
+        if self.__listener is not None:
+            self.__listener.stop()
+
+        super().shutdown()
+
+    # Cached reads
+
+    def get_book_by_isbn(self, isbn: str, session: Session = None):
+        return self.__read_through("get_book_by_isbn", (isbn,),
+                                   [("isbn", isbn), ("user", self.get_current_user(session))],
+                                   lambda: super(CachedDataInteraction, self).get_book_by_isbn(isbn, session), session)
+
+    def list_collections(self, username: str = None, session: Session = None):
+        username = self.get_current_user(session) if username == None else username
+
+        return self.__read_through("list_collections", (username,),
+                                   [("collections", username)],
+                                   lambda: super(CachedDataInteraction, self).list_collections(username, session), session)
+
+    def get_collection_contents(self, collection_name: str, username: str = None, session: Session = None):
+        username = self.get_current_user(session) if username == None else username
+
+        return self.__read_through("get_collection_contents", (collection_name, username),
+                                   [("collections", username), ("user", username)],
+                                   lambda: super(CachedDataInteraction, self).get_collection_contents(collection_name, username, session),
+                                   session)
+
+    def get_top_books(self, username: str = None, session: Session = None):
+        username = self.get_current_user(session) if username == None else username
+
+        return self.__read_through("get_top_books", (username,),
+                                   [("user", username)],
+                                   lambda: super(CachedDataInteraction, self).get_top_books(username, session), session)
+
+    def get_profile_summary(self, username: str = None, session: Session = None):
+        username = self.get_current_user(session) if username == None else username
+
+        return self.__read_through("get_profile_summary", (username,),
+                                   [("user", username), ("collections", username)],
+                                   lambda: super(CachedDataInteraction, self).get_profile_summary(username, session), session)
+
+    def get_reading_stats(self, username: str = None, session: Session = None):
+        username = self.get_current_user(session) if username == None else username
+
+        return self.__read_through("get_reading_stats", (username,),
+                                   [("user", username)],
+                                   lambda: super(CachedDataInteraction, self).get_reading_stats(username, session), session)
+
+    def get_top_recent_books(self):
+        return self.__read_through("get_top_recent_books", (), [],
+                                   lambda: super(CachedDataInteraction, self).get_top_recent_books())
+
+    def get_top_new_releases(self):
+        return self.__read_through("get_top_new_releases", (), [],
+                                   lambda: super(CachedDataInteraction, self).get_top_new_releases())
+
+    # Writes with invalidation
+
+    def rate_book(self, book_isbn: str, rating: int, session: Session = None) -> bool:
+        success = super().rate_book(book_isbn, rating, session)
+
+        if success:
+            self.__cache.invalidate(("isbn", book_isbn), ("user", self.get_current_user(session)))
+
+        return success
+
+    def read_book_by_isbn(self, book_isbn: str, start_page: int, end_page: int, session: Session = None) -> bool:
+        success = super().read_book_by_isbn(book_isbn, start_page, end_page, session)
+
+        if success:
+            self.__cache.invalidate(("user", self.get_current_user(session)))
+
+        return success
+
+    def read_random_book_by_collection(self, collection_name: str, start_page: int, end_page: int, session: Session = None) -> str:
+        book_name = super().read_random_book_by_collection(collection_name, start_page, end_page, session)
+
+        if book_name:
+            self.__cache.invalidate(("user", self.get_current_user(session)))
+
+        return book_name
+
+    def read_random_books_by_collection(self, collection_name: str, count: int, start_page: int, end_page: int, session: Session = None) -> list[str]:
+        book_names = super().read_random_books_by_collection(collection_name, count, start_page, end_page, session)
+
+        if book_names:
+            self.__cache.invalidate(("user", self.get_current_user(session)))
+
+        return book_names
+
+    def create_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
+        # Partial failures can still have written rows so always invalidate
+        success = super().create_collection(collection_name, book_isbns, session)
+        self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return success
+
+    def clone_collection(self, username: str, collection_name: str, new_name: str = None, session: Session = None) -> int:
+        book_count = super().clone_collection(username, collection_name, new_name, session)
+
+        if book_count is not False:
+            self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return book_count
+
+    def combine_collections(self, operation: CollectionOperations, collection_names: list[str], new_name: str, session: Session = None) -> int:
+        book_count = super().combine_collections(operation, collection_names, new_name, session)
+
+        if book_count is not False:
+            self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return book_count
+
+    def add_books_to_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
+        success = super().add_books_to_collection(collection_name, book_isbns, session)
+        self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return success
+
+    def remove_books_from_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
+        success = super().remove_books_from_collection(collection_name, book_isbns, session)
+        self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return success
+
+    def delete_collection(self, collection_name: str, session: Session = None) -> bool:
+        success = super().delete_collection(collection_name, session)
+        self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return success
+
+    def rename_collection(self, current_name: str, new_name: str, session: Session = None) -> bool:
+        success = super().rename_collection(current_name, new_name, session)
+        self.__cache.invalidate(("collections", self.get_current_user(session)))
+
+        return success
+
+    def follow_user(self, followee: str, session: Session = None) -> bool:
+        success = super().follow_user(followee, session)
+
+        if success:
+            self.__cache.invalidate(("user", self.get_current_user(session)), ("user", followee))
+
+        return success
+
+    def unfollow_user(self, followee: str, session: Session = None) -> bool:
+        success = super().unfollow_user(followee, session)
+
+        if success:
+            self.__cache.invalidate(("user", self.get_current_user(session)), ("user", followee))
+
+        return success
@@ -0,0 +1,104 @@
+import json
+import select
+import threading
+import time
+
+from data_interaction.schema import CHANGES_CHANNEL
+
+# Seconds between checks of the stop flag while no notifications arrive
+POLL_INTERVAL = 1.0
+# Bounds of the reconnect backoff in seconds
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+
+class ChangeListener:
+    """
+    Background thread that LISTENs for change notifications published by the database triggers
+    and hands the invalidation tags to a callback
+    """
+    __slots__ = ["__connect", "__on_change", "__on_lost", "__thread", "__stop", "__connection"]
+
+    def __init__(self, connect, on_change, on_lost):
+        """
+        :param connect: Function returning a new autocommit database connection
+        :param on_change: Called with the tags of every change, e.g. on_change(("isbn", "123"), ("user", "bob"))
+        :param on_lost: Called when notifications may have been missed (listener connection was lost)
+        """
+        self.__connect = connect
+        self.__on_change = on_change
+        self.__on_lost = on_lost
+        self.__stop = threading.Event()
+        self.__connection = None
+        self.__thread = threading.Thread(target=self.__run, name="change-listener", daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+
+        try:
+            self.__connection.close()
+        except:
+            pass
+
+        if self.__thread.is_alive():
+            self.__thread.join(POLL_INTERVAL * 2)
+
+    def __listen(self, resync: bool) -> None:
+        """
+        Open the listening connection and dispatch notifications until stopped or disconnected
+
+        :param resync: If notifications may have been missed before this connection was listening
+        """
+        self.__connection = self.__connect()
+
+        with self.__connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANGES_CHANNEL};")
+
+        # Only resync once listening so no change can slip in between
+        if resync:
+            self.__on_lost()
+
+        while not self.__stop.is_set():
+            readable, _, _ = select.select([self.__connection], [], [], POLL_INTERVAL)
+
+            if len(readable) == 0:
+                continue
+
+            self.__connection.poll()
+
+            while self.__connection.notifies:
+                notification = self.__connection.notifies.pop(0)
+
+                try:
+                    tags = [tuple(tag) for tag in json.loads(notification.payload)]
+                except ValueError:
+                    continue
+
+                if len(tags) != 0:
+                    self.__on_change(*tags)
+
+    def __run(self) -> None:
+        backoff = MIN_BACKOFF
+        resync = False
+
+        while not self.__stop.is_set():
+            started = time.monotonic()
+
+            try:
+                self.__listen(resync)
+            except Exception:
+                try:
+                    self.__connection.close()
+                except:
+                    pass
+
+                # A connection that stayed up for a while starts the backoff over
+                if time.monotonic() - started > MAX_BACKOFF:
+                    backoff = MIN_BACKOFF
+
+                resync = True
+                self.__stop.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
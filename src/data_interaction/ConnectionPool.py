@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+
+# Connections the pool opens at most unless configured otherwise
+DEFAULT_POOL_SIZE = 4
+
+# Seconds a connection may sit idle before it is probed on its next use
+HEALTH_CHECK_AFTER = 30
+
+
+class ConnectionPool:
+    """
+    Fixed size pool of database connections lent to one thread at a time
+    -- Connections are opened lazily, callers block while all of them are lent out
+    -- Connections idle for longer than HEALTH_CHECK_AFTER are probed before being lent, dead ones are replaced
+    """
+    __slots__ = ["__connect", "__check", "__size", "__idle", "__opened", "__lock"]
+
+    def __init__(self, connect, size: int = DEFAULT_POOL_SIZE, check = None):
+        """
+        :param connect: Function opening a new connection
+        :param size: Maximum number of open connections
+        :param check: Function probing a connection, returns if it is usable, None to never probe
+        """
+        self.__connect = connect
+        self.__check = check
+        self.__size = max(1, size)
+        # tuple(connection, time it was returned), most recently returned first so idle connections beyond the
+        # working set stay idle
+        self.__idle = queue.LifoQueue()
+        self.__opened = 0
+        self.__lock = threading.Lock()
+
+    def __usable(self, connection, returned_at: float) -> bool:
+        """
+        Probe a connection that has been idle for a while, dropping it if it is dead
+        """
+        if self.__check is None or time.monotonic() - returned_at < HEALTH_CHECK_AFTER:
+            return True
+
+        if self.__check(connection):
+            return True
+
+        self.__discard(connection)
+        return False
+
+    def __discard(self, connection) -> None:
+        try:
+            connection.close()
+        except:
+            pass
+
+        with self.__lock:
+            self.__opened -= 1
+
+    def acquire(self, timeout: float = None):
+        """
+        Take an idle connection, opening one if the pool is not full yet
+
+        :param timeout: Seconds to wait for a connection, None to wait forever
+        :return: Connection
+        """
+        while True:
+            try:
+                connection, returned_at = self.__idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if self.__usable(connection, returned_at):
+                return connection
+
+        with self.__lock:
+            open_new = self.__opened < self.__size
+
+            if open_new:
+                self.__opened += 1
+
+        if open_new:
+            try:
+                return self.__connect()
+            except:
+                with self.__lock:
+                    self.__opened -= 1
+                raise
+
+        try:
+            connection, returned_at = self.__idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No database connection available")
+
+        if self.__usable(connection, returned_at):
+            return connection
+
+        # The dead connection freed a slot for a new one
+        return self.acquire(timeout)
+
+    def release(self, connection) -> None:
+        """
+        Return a connection, closed connections are dropped so a new one can be opened
+        """
+        if connection.closed:
+            with self.__lock:
+                self.__opened -= 1
+            return
+
+        self.__idle.put((connection, time.monotonic()))
+
+    def close(self) -> None:
+        """
+        Close every idle connection
+        """
+        while True:
+            try:
+                connection, _ = self.__idle.get_nowait()
+            except queue.Empty:
+                break
+
+            self.__discard(connection)
@@ -1,9 +1,26 @@
 from enum import Enum
+import datetime
+import functools
 import json
 import random
+import threading
+import time
 
+import numpy as np
 import psycopg2
-from sshtunnel import SSHTunnelForwarder
+
+from data_interaction.BloomFilter import BloomFilter
+from data_interaction.BookResultSet import BookResultSet
+from data_interaction.BookSimilarityIndex import BookSimilarityIndex
+from data_interaction.ConnectionPool import ConnectionPool, DEFAULT_POOL_SIZE
+from data_interaction.FollowGraph import FollowGraph
+from data_interaction.GenreTree import GenreTree
+from data_interaction.LocalCatalog import LocalCatalog
+from data_interaction.QueryStats import QueryStats, InstrumentedCursor, take_interrupt
+from data_interaction.ReadingStats import ReadingStats, NO_GENRE
+from data_interaction.Session import Session, BoundDataInteraction
+from data_interaction.TunnelManager import TUNNELS, find_published, tunnel_settings
+from data_interaction import schema
 
 class SortOptions(Enum):
     BOOK_NAME = 1
@@ -17,64 +34,282 @@ class SearchMethods(Enum):
     AUTHOR = 3
     PUBLISHER = 4
     GENRE = 5
+
+class CollectionOperations(Enum):
+    UNION = 1
+    INTERSECT = 2
+    DIFFERENCE = 3
     
 
 CONFIG_FILENAME = "../config.json"
 
+# Seconds between delta syncs of the local catalog replica
+CATALOG_SYNC_INTERVAL = 60
+
+# Seconds between prunes of catalog_log by a syncing process
+CATALOG_PRUNE_INTERVAL = 3600
+
+# Rows fetched per query by streaming methods
+STREAM_BATCH_SIZE = 100
+
+# Columns of a book row from the search query, batched searches append their sort key after them
+SEARCH_COLUMNS = 7
+
+# Rows fetched per round trip into NumPy arrays
+ARRAY_BATCH_SIZE = 10000
+
+# TCP keepalives on database connections: seconds idle before the first probe, seconds between probes and
+# unanswered probes before the connection counts as dead
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+# Attempts to open a connection and the bounds of the backoff between them in seconds
+CONNECT_ATTEMPTS = 5
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+# Times a read is run again after losing its connection
+READ_RETRIES = 2
+
 class DataInteraction:
-    __slots__ = ["__sshTunnel", "__connection", "__cursor", "__current_user"]
+    """
+    Database access for any number of sessions over a small pool of connections
+    -- Methods acting for a user take a Session, without one they act for the default session
+    -- Each call borrows one pooled connection for the calling thread, nested calls share it
+    """
+    __slots__ = ["__sshTunnel", "__pool", "__local", "__default_session", "__lock", "__similarity_index",
+                 "__follow_graph", "__database_credentials", "__tunnel_settings", "__tunnel_lock", "__catalog", "__catalog_synced_at", "__catalog_pruned_at",
+                 "__isbn_filter", "__genre_tree", "__query_stats"]
+
+    def __retryable(method):
+        """
+        Mark a method that only reads, so it is run again if its connection is lost during the call
+        -- Must be applied below __borrows_connection
+        """
+        method.retryable = True
+
+        return method
+
+    def __borrows_connection(method):
+        """
+        Give the calling thread a pooled connection for the duration of the call, taken on first use of __cursor
+        -- Methods marked __retryable are run again on a new connection if theirs was lost, up to READ_RETRIES times
+        -- A statement cancelled by Ctrl-C ends the outermost call with KeyboardInterrupt, even if the method caught it
+        """
+        @functools.wraps(method)
+        def borrowing(self, *args, **kwargs):
+            local = self.__local
+            depth = getattr(local, "depth", 0)
+            retries = 0
+
+            while True:
+                local.depth = depth + 1
+                lost = False
+                interrupted = False
+
+                try:
+                    result = method(self, *args, **kwargs)
+                finally:
+                    local.depth = depth
+
+                    if depth == 0:
+                        interrupted = take_interrupt()
+
+                    # The outermost call returns the connection
+                    if depth == 0 and getattr(local, "cursor", None) is not None:
+                        cursor = local.cursor
+                        local.cursor = None
+                        # psycopg2 marks the connection closed when the server or the network dropped it
+                        lost = cursor.connection.closed != 0
+
+                        try:
+                            cursor.close()
+                        except:
+                            pass
+
+                        self.__pool.release(cursor.connection)
+
+                if interrupted:
+                    raise KeyboardInterrupt
+
+                # Writes are never replayed, they may have been applied before the connection dropped
+                if not lost or not getattr(method, "retryable", False) or retries == READ_RETRIES:
+                    return result
+
+                retries += 1
+
+        return borrowing
+
+    @property
+    def __cursor(self):
+        """
+        Cursor on the connection lent to the calling thread, borrowed from the pool on first use
+        """
+        local = self.__local
+        cursor = getattr(local, "cursor", None)
+
+        if cursor is None:
+            if getattr(local, "depth", 0) == 0:
+                raise RuntimeError("Database used outside of a connection borrowing method")
+
+            connection = self.__pool.acquire()
+            cursor = connection.cursor(cursor_factory = InstrumentedCursor)
+            cursor.attach(self.__query_stats)
+            local.cursor = cursor
+
+        return cursor
+
+    def __session_for(self, session: Session | None) -> Session:
+        return self.__default_session if session is None else session
+
+    def __init__(self, config_filename: str = CONFIG_FILENAME, pool_size: int = None):
+        """
+        :param config_filename: Config file with the credentials
+        :param pool_size: Maximum number of pooled connections, "pool_size" from the config if None
+        """
+        self.__sshTunnel = None
+        self.__tunnel_settings = None
+        # Serializes picking the tunnel between threads opening connections
+        self.__tunnel_lock = threading.Lock()
+        self.__pool = None
+        self.__catalog = None
 
-    def __init__(self):
         try:
             # Get login credentials
-            with open(CONFIG_FILENAME, 'r') as file:
+            with open(config_filename, 'r') as file:
                 credentials = json.load(file)
 
-            # Data for connection
-            ssh_host = "starbug.cs.rit.edu"
-            ssh_port = 22
-            sql_host = "127.0.0.1"
-            sql_port = 5432
-            db = "p32001_13"
+            # Data for connection, defaults are the course database over ssh
+            settings = tunnel_settings(credentials)
+            sql_host, sql_port = settings["remote_address"]
+            db = credentials.get("database", "p32001_13")
             username = credentials["username"]
             password = credentials["password"]
-            
-            # Establish connection via ssh tunneling
-            self.__sshTunnel = SSHTunnelForwarder(
-                (ssh_host, ssh_port),
-                ssh_username = username,
-                ssh_password = password,
-                remote_bind_address = (sql_host, sql_port),
-                local_bind_address = (sql_host, sql_port)
-            )
 
-            self.__sshTunnel.start()
+            if credentials.get("use_ssh", True):
+                # The tunnel is picked by open_connection
+                self.__tunnel_settings = settings
+
+            self.__database_credentials = (sql_host, sql_port, db, username, password)
+
+            if pool_size is None:
+                pool_size = credentials.get("pool_size", DEFAULT_POOL_SIZE)
 
-            self.__connection = psycopg2.connect(
-                host = self.__sshTunnel.local_bind_host,
-                port = self.__sshTunnel.local_bind_port,
-                database = db,
-                user = username,
-                password = password
+            self.__pool = ConnectionPool(self.open_connection, pool_size, self.__healthy)
+
+            # Connect once up front so bad credentials fail here
+            self.__pool.release(self.__pool.acquire())
+
+            self.__query_stats = QueryStats(
+                slow_ms = credentials.get("slow_query_ms", 500),
+                explain = credentials.get("explain_slow_queries", False),
+                timeouts = credentials.get("statement_timeouts")
             )
-            self.__connection.autocommit = True
-            
-            self.__cursor = self.__connection.cursor()
-            self.__current_user = None
+
+            self.__local = threading.local()
+            self.__default_session = Session()
+            # Guards the in-memory indexes shared by every session
+            self.__lock = threading.RLock()
+            self.__similarity_index = None
+            self.__follow_graph = None
+            self.__catalog_synced_at = 0
+            self.__catalog_pruned_at = time.monotonic()
+            self.__isbn_filter = None
+            self.__genre_tree = None
         except Exception as e:
             self.shutdown()
             raise Exception(e)
 
-    def login(self, username: str, password: str) -> bool:
+    def open_connection(self):
+        """
+        Open a new autocommit database connection outside of the pool (through the SSH tunnel unless disabled
+        in the config)
+        -- A dropped tunnel is restarted first, failed attempts are retried with exponential backoff
+
+        :return: psycopg2 connection
+        """
+        host, port, db, username, password = self.__database_credentials
+        backoff = MIN_BACKOFF
+
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                if self.__tunnel_settings is not None:
+                    host, port = self.__tunnel_address()
+
+                connection = psycopg2.connect(
+                    host = host,
+                    port = port,
+                    database = db,
+                    user = username,
+                    password = password,
+                    keepalives = 1,
+                    keepalives_idle = KEEPALIVE_IDLE,
+                    keepalives_interval = KEEPALIVE_INTERVAL,
+                    keepalives_count = KEEPALIVE_COUNT
+                )
+                connection.autocommit = True
+
+                return connection
+            except psycopg2.OperationalError as e:
+                # Retrying cannot fix wrong credentials
+                if "authentication failed" in str(e) or attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+            except Exception:
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def __tunnel_address(self) -> tuple[str, int]:
+        """
+        Local address of the SSH tunnel to connect through
+        -- A tunnel daemon on this host (src/tunnel.py) is looked up on every call since it republishes a restarted
+           tunnel on a new port, without a live one the tunnel shared by the process is started
+
+        :return: tuple(host, port)
+        """
+        with self.__tunnel_lock:
+            if self.__sshTunnel is None:
+                published = find_published(self.__tunnel_settings)
+
+                if published is not None:
+                    return published
+
+                self.__sshTunnel = TUNNELS.acquire(**self.__tunnel_settings)
+
+            TUNNELS.ensure_active(self.__sshTunnel)
+
+            return self.__sshTunnel.local_bind_host, self.__sshTunnel.local_bind_port
+
+    @staticmethod
+    def __healthy(connection) -> bool:
+        """
+        Probe a pooled connection with a trivial query
+
+        :param connection: Idle connection
+        :return: If the connection answered
+        """
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    def login(self, username: str, password: str, session: Session = None) -> bool:
         """
         Attempt to login using a given username and password
         -- This should record login date and time when it was accessed
 
         :param username: Username of account to access
         :param password: Password to try
+        :param session: Session to log in, the default session if None
         :return: If login was successful
         """
-
         try:
             query = f"""
                         UPDATE users SET lastaccessed = CURRENT_TIMESTAMP
@@ -87,24 +322,28 @@ class DataInteraction:
                 return False
 
             # If successfully logged in then current user should be set
-            self.__current_user = username
+            self.__session_for(session).reset(username)
             return True
         except:
             return False
 
-    def logout(self) -> bool:
+    def logout(self, session: Session = None) -> bool:
         """
         If logged into account then logout
 
+        :param session: Session to log out, the default session if None
         :return: If logout successful
         """
-        if self.__current_user == None:
+        session = self.__session_for(session)
+
+        if session.username == None:
             return False
 
-        self.__current_user = None
+        session.reset()
         return True
 
-    def create_account(self, username: str, name: str, email: str, password: str) -> bool:
+    @__borrows_connection
+    def create_account(self, username: str, name: str, email: str, password: str, session: Session = None) -> bool:
         """
         Create a new account
         -- Username must be unique
@@ -114,9 +353,9 @@ class DataInteraction:
         :param name: Name of the user
         :param email: Email address of user
         :param password: Password to set
+        :param session: Session to log in to the new account, the default session if None
         :return: If successful
         """
-
         try:
             query = f"""
                         INSERT INTO users
@@ -132,18 +371,243 @@ class DataInteraction:
                 return False
 
             # If successfully created the account then set username
-            self.__current_user = username
+            self.__session_for(session).reset(username)
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def sync_catalog(self) -> bool:
+        """
+        Bring the local catalog replica up to date with the server
+        -- The first sync copies the whole catalog, later syncs only fetch books changed in catalog_log
+        -- Changes are fetched from every transaction still running at the last sync, whatever order they commit in
+
+        :return: If successful
+        """
+        try:
+            with self.__lock:
+                if self.__catalog is None:
+                    self.__catalog = LocalCatalog()
+
+            if time.monotonic() - self.__catalog_pruned_at > CATALOG_PRUNE_INTERVAL:
+                self.prune_catalog_log()
+                self.__catalog_pruned_at = time.monotonic()
+
+            # Everything logged by a transaction older than xmin is visible from here on
+            query = f"""
+                        SELECT
+                            txid_snapshot_xmin(txid_current_snapshot()),
+                            (SELECT xid FROM catalog_log_horizon WHERE id = 0);
+                    """
+            self.__cursor.execute(query)
+            xmin, pruned_xid = self.__cursor.fetchone()
+
+            last_xmin = self.__catalog.synced_xmin()
+
+            # Changes the replica has not seen may have been pruned
+            if last_xmin is None or (pruned_xid is not None and pruned_xid >= last_xmin):
+                last_xmin = None
+                changed_isbns = []
+                isbn_filter = "TRUE"
+            else:
+                # Rereads the changes of transactions that were still running at the last sync, even if some of
+                # their entries were already applied
+                query = f"""
+                            SELECT DISTINCT isbn FROM catalog_log
+                            WHERE xid >= {last_xmin};
+                        """
+                self.__cursor.execute(query)
+                changed_isbns = [row[0] for row in self.__cursor.fetchall()]
+
+                if len(changed_isbns) == 0:
+                    self.__catalog.apply([], [], xmin)
+                    self.__catalog_synced_at = time.monotonic()
+                    return True
+
+                isbn_list = ", ".join(f"'{isbn}'" for isbn in changed_isbns)
+                isbn_filter = f"book.isbn IN ({isbn_list})"
+
+            query = f"""
+                    SELECT
+                        book.isbn,
+                        book.title as title,
+                        STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
+                        STRING_AGG(DISTINCT publishes_contrib.name, ', ') AS publishers,
+                        book.length,
+                        CASE
+                            WHEN book.audience = 0 THEN 'Kids'
+                            WHEN book.audience = 1 THEN 'Teens'
+                            WHEN book.audience = 2 THEN 'Adults'
+                            ELSE 'Unknown'
+                        END AS audience,
+                        STRING_AGG(DISTINCT genre.name, ', ') AS genres
+                    FROM
+                        book
+                    JOIN
+                        authors ON book.isbn = authors.isbn
+                    JOIN
+                        contributor AS authors_contrib ON authors.contributorID = authors_contrib.contributorID
+                    JOIN
+                        publishes ON book.isbn = publishes.isbn
+                    JOIN
+                        contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
+                    LEFT JOIN
+                        category ON category.isbn = book.isbn
+                    LEFT JOIN
+                        genre ON genre.genreid = category.genreid
+                    WHERE
+                        {isbn_filter}
+                    GROUP BY
+                        book.isbn, book.title, book.length, book.audience;
+                    """
+            self.__cursor.execute(query)
+
+            books = self.__cursor.fetchall()
+
+            self.__catalog.apply(books, changed_isbns, xmin, last_xmin is None)
+            self.__catalog_synced_at = time.monotonic()
+
+            # Bloom filters cannot delete, deleted books are only dropped on the next rebuild
+            with self.__lock:
+                if self.__isbn_filter is not None:
+                    for book in books:
+                        self.__isbn_filter.add(book[0])
+
+            # The same delta keeps the similarity index up to date, a first sync has nothing to refresh
+            if len(changed_isbns) != 0 and self.__similarity_index is not None:
+                return self.refresh_similarity_index(changed_isbns)
+
             return True
         except:
             return False
 
-    def get_book_by_isbn(self, isbn: str) -> tuple[str, list[str], str, int, str, int] | None:
+    @__borrows_connection
+    def prune_catalog_log(self) -> bool:
+        """
+        Bulk job dropping catalog_log entries older than schema.CATALOG_LOG_RETENTION
+        -- Replicas that last synced before the pruned entries copy the whole catalog on their next sync
+
+        :return: If successful
+        """
+        try:
+            self.__cursor.execute(schema.PRUNE_CATALOG_LOG)
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def build_isbn_filter(self) -> bool:
+        """
+        Bulk build the Bloom filter of every ISBN, from the local catalog when it is available
+
+        :return: If successful
+        """
+        try:
+            if self.__catalog is not None:
+                isbns = list(self.__catalog.isbns())
+            else:
+                query = f"""
+                            SELECT isbn FROM book;
+                        """
+                self.__cursor.execute(query)
+                isbns = [row[0] for row in self.__cursor.fetchall()]
+
+            self.__isbn_filter = BloomFilter.build(isbns)
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def book_exists(self, isbn: str) -> bool:
+        """
+        Check if a book exists
+        -- ISBNs not in the Bloom filter are rejected without a round trip, others take one indexed probe
+
+        :param isbn: ISBN of the book
+        :return: If the book exists
+        """
+        # Delta syncs of the catalog also add new ISBNs to the filter
+        self.__catalog_ready()
+
+        if self.__isbn_filter is None and not self.build_isbn_filter():
+            return False
+
+        if isbn not in self.__isbn_filter:
+            return False
+
+        try:
+            query = f"""
+                        SELECT EXISTS (SELECT 1 FROM book WHERE isbn = '{isbn}');
+                    """
+            self.__cursor.execute(query)
+
+            return self.__cursor.fetchone()[0]
+        except:
+            return False
+
+    def __catalog_ready(self) -> bool:
+        """
+        Make sure the local catalog replica exists and is reasonably fresh
+
+        :return: If the replica can be used
+        """
+        if self.__catalog is None or time.monotonic() - self.__catalog_synced_at > CATALOG_SYNC_INTERVAL:
+            return self.sync_catalog()
+
+        return True
+
+    @__borrows_connection
+    @__retryable
+    def get_book_by_isbn(self, isbn: str, session: Session = None) -> tuple[str, list[str], str, int, str, int] | None:
         """
         Get the book from an ISBN
+        -- The book card is served from the local catalog replica, only the rating is queried remotely
+
+        :param isbn: ISBN of the book to search for
+        :return: Book details (tuple(title, authors, publishers, length, audience, rating)) or None if not found
+        """
+        current_user = self.__session_for(session).username
+
+        if self.__isbn_filter is not None and isbn not in self.__isbn_filter:
+            return None
+
+        if not self.__catalog_ready():
+            return self.__get_remote_book_by_isbn(isbn, session)
+
+        # New books show up after the next delta sync, at most CATALOG_SYNC_INTERVAL seconds later
+        book = self.__catalog.get(isbn)
+
+        if book is None:
+            return None
+
+        if current_user is None:
+            return book + (None,)
+
+        try:
+            query = f"""
+                        SELECT rates FROM rates WHERE username = '{current_user}' AND isbn = '{isbn}';
+                    """
+
+            self.__cursor.execute(query)
+            rating = self.__cursor.fetchone()
+
+            return book + (None if rating is None else rating[0],)
+        except:
+            return False
+
+    def __get_remote_book_by_isbn(self, isbn: str, session: Session = None) -> tuple[str, list[str], str, int, str, int] | None:
+        """
+        Get the book from an ISBN straight from the server
 
         :param isbn: ISBN of the book to search for
         :return: Book details (tuple(title, authors, publishers, length, audience, rating)) or None if not found
         """
+        current_user = self.__session_for(session).username
 
         try:
             query = f"""
@@ -170,7 +634,7 @@ class DataInteraction:
                     JOIN 
                         contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
                     LEFT JOIN 
-                        rates ON book.isbn = rates.isbn AND rates.username = '{self.__current_user}'
+                        rates ON book.isbn = rates.isbn AND rates.username = '{current_user}'
                     WHERE
                         book.isbn = '{isbn}'
                     GROUP BY
@@ -183,6 +647,8 @@ class DataInteraction:
         except:
             return False
 
+    @__borrows_connection
+    @__retryable
     def search_for_users(self, email: str) -> list[tuple]:
         """
         Find all user accounts by an email address
@@ -203,7 +669,8 @@ class DataInteraction:
         except:
             return False
 
-    def follow_user(self, followee: str) -> bool:
+    @__borrows_connection
+    def follow_user(self, followee: str, session: Session = None) -> bool:
         """
         Current logged in user will follow followee
         -- Followee must exist
@@ -211,20 +678,29 @@ class DataInteraction:
         :param followee: Username of person to follow
         :return: If successful
         """
+        current_user = self.__session_for(session).username
 
         try:
             query = f"""
                         INSERT INTO follows (followerusername, followeeusername)
-                        VALUES ('{self.__current_user}', '{followee}');
+                        VALUES ('{current_user}', '{followee}');
                     """
 
             self.__cursor.execute(query)
 
-            return self.__cursor.rowcount != 0
+            if self.__cursor.rowcount == 0:
+                return False
+
+            with self.__lock:
+                if self.__follow_graph is not None:
+                    self.__follow_graph.follow(current_user, followee)
+
+            return True
         except:
             return False
 
-    def unfollow_user(self, followee: str) -> bool:
+    @__borrows_connection
+    def unfollow_user(self, followee: str, session: Session = None) -> bool:
         """
         Current logged in user will unfollow the followee
         -- Must be following the user
@@ -232,19 +708,30 @@ class DataInteraction:
         :param followee: Person to unfollow by username
         :return: If successful
         """
+        current_user = self.__session_for(session).username
+
         try:
             query = f"""
-                        DELETE from follows WHERE followerusername = '{self.__current_user}'
+                        DELETE from follows WHERE followerusername = '{current_user}'
                         AND followeeusername = '{followee}';
                     """
 
             self.__cursor.execute(query)
 
-            return self.__cursor.rowcount != 0
+            if self.__cursor.rowcount == 0:
+                return False
+
+            with self.__lock:
+                if self.__follow_graph is not None:
+                    self.__follow_graph.unfollow(current_user, followee)
+
+            return True
         except:
             return False
 
-    def list_followers(self, username: str = None) -> list[str]:
+    @__borrows_connection
+    @__retryable
+    def list_followers(self, username: str = None, session: Session = None) -> list[str]:
         """
         List all users that follow user with given username
 
@@ -252,7 +739,7 @@ class DataInteraction:
         :return: List of usernames that follow current user
         """
         if (username == None):
-            username = self.__current_user
+            username = self.__session_for(session).username
             
         try:
             query = f"""
@@ -266,7 +753,9 @@ class DataInteraction:
         except:
             return False
 
-    def list_following(self, username: str = None) -> list[str]:
+    @__borrows_connection
+    @__retryable
+    def list_following(self, username: str = None, session: Session = None) -> list[str]:
         """
         List all users that the given user follows
 
@@ -274,7 +763,7 @@ class DataInteraction:
         :return: Usernames of following
         """
         if (username == None):
-            username = self.__current_user
+            username = self.__session_for(session).username
 
         try:
             query = f"""
@@ -288,7 +777,136 @@ class DataInteraction:
         except:
             return False
 
-    def create_collection(self, collection_name: str, book_isbns: list[str]) -> bool:
+    @__borrows_connection
+    @__retryable
+    def build_follow_graph(self) -> bool:
+        """
+        Bulk load the follow graph into the in-memory adjacency index
+
+        :return: If successful
+        """
+        try:
+            query = f"""
+                        SELECT followerusername, followeeusername FROM follows;
+                    """
+
+            self.__cursor.execute(query)
+
+            graph = FollowGraph()
+            graph.build(self.__cursor.fetchall())
+
+            self.__follow_graph = graph
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def get_follow_counts(self, username: str = None, session: Session = None) -> tuple[int, int]:
+        """
+        Get the number of followers and followed users from the follow graph index
+
+        :param username: Username of the user to query, if None use current user
+        :return: tuple(number of followers, number following)
+        """
+        if (username == None):
+            username = self.__session_for(session).username
+
+        if self.__follow_graph is None and not self.build_follow_graph():
+            return False
+
+        with self.__lock:
+            return self.__follow_graph.follower_count(username), self.__follow_graph.following_count(username)
+
+    @__borrows_connection
+    @__retryable
+    def suggest_follows(self, limit: int = 10, session: Session = None) -> list[tuple[str, int, int]]:
+        """
+        Suggest users to follow among the users followed by the current user's followees
+        -- Ranked by shared follows plus the number of books both users have read
+
+        :param limit: Maximum number of suggestions
+        :return: List of tuple(username, shared follows, books read in common)
+        """
+        current_user = self.__session_for(session).username
+
+        if self.__follow_graph is None and not self.build_follow_graph():
+            return False
+
+        # Over-fetch so co-reads can reorder the candidates with the most shared follows
+        with self.__lock:
+            candidates = self.__follow_graph.friends_of_friends(current_user, limit * 5)
+
+        if len(candidates) == 0:
+            return []
+
+        try:
+            username_list = ", ".join(f"'{username}'" for username, _ in candidates)
+
+            query = f"""
+                        SELECT other.username, COUNT(DISTINCT other.isbn)
+                        FROM
+                            reads AS other
+                        WHERE
+                            other.username IN ({username_list})
+                            AND other.isbn IN (SELECT isbn FROM reads WHERE username = '{current_user}')
+                        GROUP BY other.username;
+                    """
+
+            self.__cursor.execute(query)
+            co_reads = dict(self.__cursor.fetchall())
+
+            suggestions = [(username, shared, co_reads.get(username, 0)) for username, shared in candidates]
+            suggestions.sort(key=lambda row: (-(row[1] + row[2]), row[0]))
+
+            return suggestions[:limit]
+        except:
+            return False
+
+    def __collection_id(self, collection_name: str, session: Session = None) -> int | None:
+        """
+        Get the id of one of the current user's collections, remembered by the session after the first lookup
+        -- The session's own collection writes keep the ids current, writes failing on an id forget it, since another
+           session or process may have deleted the collection
+
+        :param collection_name: Name of the collection
+        :param session: Session of the user, the default session if None
+        :return: collectionid or None if the user has no such collection
+        """
+        session = self.__session_for(session)
+        collectionid = session.collection_ids.get(collection_name)
+
+        if collectionid is not None:
+            return collectionid
+
+        query = f"""
+                    SELECT creates.collectionid
+                    FROM
+                        creates
+                    JOIN
+                        collections ON creates.collectionid = collections.collectionid
+                    WHERE
+                        creates.username = '{session.username}'
+                        AND collections.name = '{collection_name}';
+                """
+        self.__cursor.execute(query)
+
+        row = self.__cursor.fetchone()
+
+        if row is None:
+            return None
+
+        session.collection_ids[collection_name] = row[0]
+        return row[0]
+
+    def __forget_collection(self, collection_name: str, session: Session = None) -> None:
+        """
+        Drop a collection id remembered by __collection_id, looked up again on next use
+        """
+        self.__session_for(session).collection_ids.pop(collection_name, None)
+
+    @__borrows_connection
+    def create_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
         """
         Create a collection with this name and list of ISBNs (can be empty)
         -- Name must be unique, ISBNs must exist
@@ -297,6 +915,7 @@ class DataInteraction:
         :param book_isbns: List of ISBNs for books to add to the collection
         :return: If successful
         """
+        current_user = self.__session_for(session).username
 
         try:
             success = True
@@ -314,10 +933,11 @@ class DataInteraction:
 
             row = self.__cursor.fetchone()            
             collectionid = row[0]
+            self.__session_for(session).collection_ids[collection_name] = collectionid
 
             query = f"""
                         INSERT INTO creates (username, collectionid)
-                        VALUES ('{self.__current_user}', {collectionid});
+                        VALUES ('{current_user}', {collectionid});
                     """
             
             self.__cursor.execute(query)
@@ -340,7 +960,8 @@ class DataInteraction:
         except:
             return False
 
-    def add_books_to_collection(self, collection_name: str, book_isbns: list[str]) -> bool:
+    @__borrows_connection
+    def add_books_to_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
         """
         Add a list of books to a collection
         -- Collection must exist and ISBNs must exist
@@ -350,25 +971,12 @@ class DataInteraction:
         :return: If all were added
         """
         try:
-            query = f"""
-                        SELECT creates.collectionid
-                        FROM
-                            creates
-                        JOIN
-                            collections ON creates.collectionid = collections.collectionid
-                        WHERE
-                            creates.username = '{self.__current_user}'
-                            AND collections.name = '{collection_name}';
-                    """
-            self.__cursor.execute(query)
-            
-            if self.__cursor.rowcount == 0:
+            collectionid = self.__collection_id(collection_name, session)
+
+            if collectionid is None:
                 return False
-            
+
             success = True
-            
-            row = self.__cursor.fetchone()            
-            collectionid = row[0]
 
             for isbn in book_isbns:
                 query = f"""
@@ -381,11 +989,16 @@ class DataInteraction:
                 if (self.__cursor.rowcount == 0):
                     success = False
 
+            if not success:
+                self.__forget_collection(collection_name, session)
+
             return success
         except:
+            self.__forget_collection(collection_name, session)
             return False
 
-    def remove_books_from_collection(self, collection_name: str, book_isbns: list[str]) -> bool:
+    @__borrows_connection
+    def remove_books_from_collection(self, collection_name: str, book_isbns: list[str], session: Session = None) -> bool:
         """
         Remove a list of books from a collection
         -- Collection must exist and ISBNs must be in collection
@@ -394,27 +1007,13 @@ class DataInteraction:
         :param book_isbns: List of books to remove by ISBN
         :return: If all were removed
         """
-
         try:
-            query = f"""
-                        SELECT creates.collectionid
-                        FROM
-                            creates
-                        JOIN
-                            collections ON creates.collectionid = collections.collectionid
-                        WHERE
-                            creates.username = '{self.__current_user}'
-                            AND collections.name = '{collection_name}';
-                    """
-            self.__cursor.execute(query)
-            
-            if self.__cursor.rowcount == 0:
+            collectionid = self.__collection_id(collection_name, session)
+
+            if collectionid is None:
                 return False
-            
+
             success = True
-            
-            row = self.__cursor.fetchone()            
-            collectionid = row[0]
 
             for isbn in book_isbns:
                 query = f"""
@@ -428,11 +1027,16 @@ class DataInteraction:
                 if (self.__cursor.rowcount == 0):
                     success = False
 
+            if not success:
+                self.__forget_collection(collection_name, session)
+
             return success
         except:
+            self.__forget_collection(collection_name, session)
             return False
 
-    def delete_collection(self, collection_name: str) -> bool:
+    @__borrows_connection
+    def delete_collection(self, collection_name: str, session: Session = None) -> bool:
         """
         Delete a given collection by name
         -- Collection must exist
@@ -440,25 +1044,15 @@ class DataInteraction:
         :param collection_name: Name of collection
         :return: If successful
         """
+        current_user = self.__session_for(session).username
 
         try:
-            query = f"""
-                        SELECT creates.collectionid
-                        FROM
-                            creates
-                        JOIN
-                            collections ON creates.collectionid = collections.collectionid
-                        WHERE
-                            creates.username = '{self.__current_user}'
-                            AND collections.name = '{collection_name}';
-                    """
-            self.__cursor.execute(query)
-            
-            if self.__cursor.rowcount == 0:
+            collectionid = self.__collection_id(collection_name, session)
+
+            if collectionid is None:
                 return False
-            
-            row = self.__cursor.fetchone()            
-            collectionid = row[0]
+
+            self.__forget_collection(collection_name, session)
         
             query = f"""
                         DELETE FROM belongs_to WHERE collectionid = {collectionid};
@@ -467,7 +1061,7 @@ class DataInteraction:
             self.__cursor.execute(query)
             
             query = f"""
-                        DELETE FROM creates WHERE username = '{self.__current_user}'
+                        DELETE FROM creates WHERE username = '{current_user}'
                         AND collectionid = {collectionid};
                     """
             self.__cursor.execute(query)
@@ -485,15 +1079,57 @@ class DataInteraction:
         except:
             return False
 
-    def rename_collection(self, current_name: str, new_name: str) -> bool:
+    def __create_collection_from(self, collection_name: str, books_sql: str, session: Session = None) -> int:
         """
-        Rename a collection
-        -- Collection must exist, new name must be unique and not equivalent to previous name
+        Create a collection filled by a query over belongs_to in one statement, no book crosses the connection
 
-        :param current_name: Current name of collection.
-        :param new_name: New name of collection
-        :return: If successful
+        :param collection_name: Name of collection to create
+        :param books_sql: Query selecting the distinct ISBNs of the new collection
+        :param session: Session of the user creating the collection
+        :return: Number of books in the new collection
+        """
+        session = self.__session_for(session)
+
+        query = f"""
+                    WITH new_collection AS
+                    (
+                        INSERT INTO collections (name)
+                        VALUES ('{collection_name}')
+                        RETURNING collectionid
+                    ), owner AS
+                    (
+                        INSERT INTO creates (username, collectionid)
+                        SELECT '{session.username}', collectionid FROM new_collection
+                    ), books AS
+                    (
+                        INSERT INTO belongs_to (collectionid, isbn)
+                        SELECT new_collection.collectionid, source.isbn
+                        FROM new_collection, ({books_sql}) AS source
+                        RETURNING isbn
+                    )
+                    SELECT (SELECT collectionid FROM new_collection), (SELECT COUNT(*) FROM books);
+                """
+
+        self.__cursor.execute(query)
+
+        collectionid, book_count = self.__cursor.fetchone()
+        session.collection_ids[collection_name] = collectionid
+
+        return book_count
+
+    @__borrows_connection
+    def clone_collection(self, username: str, collection_name: str, new_name: str = None, session: Session = None) -> int:
+        """
+        Copy another user's collection into a new collection of the current user
+
+        :param username: Owner of the collection to copy
+        :param collection_name: Name of the collection to copy
+        :param new_name: Name of the new collection, the copied name if None
+        :return: Number of books copied or False on failure
+        -- Fails if the user has no such collection or the new name is taken
         """
+        new_name = collection_name if new_name == None else new_name
+
         try:
             query = f"""
                         SELECT creates.collectionid
@@ -502,20 +1138,80 @@ class DataInteraction:
                         JOIN
                             collections ON creates.collectionid = collections.collectionid
                         WHERE
-                            creates.username = '{self.__current_user}'
-                            AND collections.name = '{current_name}';
+                            creates.username = '{username}'
+                            AND collections.name = '{collection_name}';
                     """
             self.__cursor.execute(query)
-            
-            if self.__cursor.rowcount == 0:
+
+            row = self.__cursor.fetchone()
+
+            if row is None:
+                return False
+
+            return self.__create_collection_from(new_name, f"SELECT isbn FROM belongs_to WHERE collectionid = {row[0]}",
+                                                 session)
+        except:
+            return False
+
+    @__borrows_connection
+    def combine_collections(self, operation: CollectionOperations, collection_names: list[str], new_name: str, session: Session = None) -> int:
+        """
+        Create a collection from the union, intersection or difference of the current user's collections
+
+        :param operation: Set operation to apply, a difference keeps the books of the first collection that are in
+                          none of the others
+        :param collection_names: Names of the collections to combine, in order
+        :param new_name: Name of the new collection
+        :return: Number of books in the new collection or False on failure
+        -- Fails if any collection does not exist or the new name is taken
+        """
+        try:
+            if len(collection_names) == 0:
+                return False
+
+            collectionids = [self.__collection_id(name, session) for name in collection_names]
+
+            if None in collectionids:
+                return False
+
+            if (operation == CollectionOperations.INTERSECT):
+                operator = "INTERSECT"
+            elif (operation == CollectionOperations.DIFFERENCE):
+                operator = "EXCEPT"
+            else:
+                operator = "UNION"
+
+            books_sql = f" {operator} ".join(
+                f"SELECT isbn FROM belongs_to WHERE collectionid = {collectionid}" for collectionid in collectionids
+            )
+
+            return self.__create_collection_from(new_name, books_sql, session)
+        except:
+            return False
+
+    @__borrows_connection
+    def rename_collection(self, current_name: str, new_name: str, session: Session = None) -> bool:
+        """
+        Rename a collection
+        -- Collection must exist, new name must be unique and not equivalent to previous name
+
+        :param current_name: Current name of collection.
+        :param new_name: New name of collection
+        :return: If successful
+        """
+        try:
+            collectionid = self.__collection_id(current_name, session)
+
+            if collectionid is None:
                 return False
             
-            row = self.__cursor.fetchone()            
-            collectionid = row[0]
-            
+            self.__forget_collection(current_name, session)
+
+            # The name check catches an id remembered from before another session renamed the collection
             query = f"""
                         UPDATE collections SET name = '{new_name}'
-                        WHERE collectionid = {collectionid};
+                        WHERE collectionid = {collectionid}
+                        AND name = '{current_name}';
                     """
             self.__cursor.execute(query)
             
@@ -524,32 +1220,30 @@ class DataInteraction:
             return False
     
 
-    def list_collections(self, username: str = None) -> list[tuple[str, int, int]]:
+    @__borrows_connection
+    @__retryable
+    def list_collections(self, username: str = None, session: Session = None) -> list[tuple[str, int, int]]:
         """
         Get a list of all collections
         -- Should be listed by name in ascending order
+        -- Counts come from the counters the collection_counters triggers maintain
 
         :param username: Username of the user to query, if None use current user
         :return: List of all collections as tuple(name, number of books, total page count)
         """
         if (username == None):
-            username = self.__current_user
+            username = self.__session_for(session).username
         
         try:
             query = f"""
-                        SELECT collections.name, COUNT(belongs_to.isbn) AS num_books,
-                        SUM(book.length) AS total_page_count
+                        SELECT collections.name, collections.book_count, collections.total_pages
                         FROM
                             creates
                         JOIN
                             collections ON creates.collectionid = collections.collectionid
-                        LEFT JOIN
-                            belongs_to ON collections.collectionid = belongs_to.collectionid
-                        LEFT JOIN
-                            book ON book.isbn = belongs_to.isbn
                         WHERE
                             creates.username = '{username}'
-                        GROUP BY collections.name;
+                        ORDER BY collections.name;
                     """
 
             self.__cursor.execute(query)
@@ -559,16 +1253,18 @@ class DataInteraction:
         except:
             return False
 
-    def get_collection_contents(self, collection_name: str, username: str = None) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def get_collection_contents(self, collection_name: str, username: str = None, session: Session = None) -> BookResultSet:
         """
         Get a list of all books in a collection
 
         :param collection_name: Name of the collection to search
         :param username: Username of the user to query, if None use current user
-        :return: List of books as tuple(name, authors, publisher, length, audience, rating, isbn)
+        :return: BookResultSet of the books (name, authors, publisher, length, audience, rating, isbn)
         """
         if (username == None):
-            username = self.__current_user
+            username = self.__session_for(session).username
         
         try:            
             query = f"""
@@ -610,13 +1306,193 @@ class DataInteraction:
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
-    def search_for_book(self, search_method: str, val: str, sort_by: SortOptions, ascending: bool = True) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def load_genres(self) -> bool:
+        """
+        Load the genre taxonomy into the in-memory genre tree
+
+        :return: If successful
+        """
+        try:
+            query = f"""
+                        SELECT genreid, name FROM genre;
+                    """
+            self.__cursor.execute(query)
+
+            self.__genre_tree = GenreTree(self.__cursor.fetchall())
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def autocomplete_genres(self, prefix: str, limit: int = 10) -> list[str]:
+        """
+        Get genre names starting with a prefix, served from the genre tree
+
+        :param prefix: Start of the genre name
+        :param limit: Maximum number of names
+        :return: Genre names in alphabetical order
+        """
+        if self.__genre_tree is None and not self.load_genres():
+            return False
+
+        return self.__genre_tree.autocomplete(prefix, limit)
+
+    @__borrows_connection
+    def rebuild_genre_closure(self) -> bool:
+        """
+        Bulk job rebuilding the genre_closure table from the hyphenated genre names
+
+        :return: If successful
+        """
+        try:
+            self.__cursor.execute(schema.REBUILD_GENRE_CLOSURE)
+
+            return True
+        except:
+            return False
+
+    def __fetch_books(self) -> BookResultSet:
+        """
+        Read the books of the last query in batches into a BookResultSet, so only one batch of row tuples exists at a
+        time
+        """
+        books = BookResultSet()
+
+        while True:
+            rows = self.__cursor.fetchmany(STREAM_BATCH_SIZE)
+
+            if not rows:
+                return books
+
+            books.extend(rows)
+
+    def __search_query(self, search_method: str, val: str, sort_by: SortOptions, ascending: bool, current_user: str,
+                       batch: bool = False, after: str = None) -> str:
+        """
+        Build the query behind search_for_book
+        -- Rows are totally ordered by (sort value, isbn, publisher, genre) so batches can continue from a sort key
+
+        :param batch: Select at most STREAM_BATCH_SIZE rows with the sort value, publisher and genre of their sort key
+                      appended after the SEARCH_COLUMNS book columns
+        :param after: SQL row value of the sort key of the last row read, only rows after it are selected
+        :return: Query
+        """
+        search_method_str = None
+
+        if (search_method == SearchMethods.BOOK_NAME):
+            search_method_str = f"book.title ILIKE '%{val}%'"
+        elif (search_method == SearchMethods.RELEASE_DATE):
+            search_method_str = f"book.releasedate = '{val}'"
+        elif (search_method == SearchMethods.AUTHOR):
+            search_method_str = f"authors_contrib.name = '{val}'"
+        elif (search_method == SearchMethods.PUBLISHER):
+            search_method_str = f"publishes_contrib.name = '{val}'"
+        elif self.__genre_tree is not None or self.load_genres():
+            # Matches the genre, its variants and every genre below it in the hierarchy, plus the exact name for
+            # genres added since the genre tree was loaded
+            genre_ids = ", ".join(str(genreid) for genreid in self.__genre_tree.subtree_roots(val))
+            subtree_sql = ""
+
+            if genre_ids != "":
+                subtree_sql = f"""
+                    SELECT category.isbn
+                    FROM genre_closure
+                    JOIN category ON category.genreid = genre_closure.descendantid
+                    WHERE genre_closure.ancestorid IN ({genre_ids})
+                    UNION"""
+
+            search_method_str = f"""book.isbn IN
+                ({subtree_sql}
+                    SELECT category.isbn
+                    FROM genre AS searched
+                    JOIN category ON category.genreid = searched.genreid
+                    WHERE searched.name = '{val}'
+                )"""
+        else:
+            search_method_str = f"genre.name = '{val}'"
+
+        sort_by_str = None
+
+        # Sort keys are never NULL so the row comparison continuing a batch is never unknown
+        if (sort_by == SortOptions.PUBLISHER):
+            sort_by_str = "publishes_contrib.name"
+        elif (sort_by == SortOptions.GENRE):
+            sort_by_str = "COALESCE(genre.name, '')"
+        elif (sort_by == SortOptions.RELEASED_YEAR):
+            sort_by_str = "COALESCE(EXTRACT(YEAR FROM book.releasedate), 0)"
+        else:
+            sort_by_str = "book.title"
+
+        sort_keys = [sort_by_str, "book.isbn", "publishes_contrib.name", "COALESCE(genre.name, '')"]
+        direction = "ASC" if ascending else "DESC"
+
+        key_columns_str = ""
+        after_str = ""
+        limit_str = ""
+
+        if batch:
+            key_columns_str = ", " + ", ".join(sort_keys[:1] + sort_keys[2:])
+            limit_str = f"LIMIT {STREAM_BATCH_SIZE}"
+
+        if after is not None:
+            after_str = f"AND ({', '.join(sort_keys)}) {'>' if ascending else '<'} {after}"
+
+        query = f"""
+                SELECT 
+                    book.title as title,
+                    STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
+                    STRING_AGG(DISTINCT publishes_contrib.name, ', ') AS publishers,
+                    book.length,
+                    CASE 
+                        WHEN book.audience = 0 THEN 'Kids'
+                        WHEN book.audience = 1 THEN 'Teens'
+                        WHEN book.audience = 2 THEN 'Adults'
+                        ELSE 'Unknown'
+                    END AS audience,
+                    rates.rates AS rating,
+                    book.isbn
+                    {key_columns_str}
+                FROM 
+                    book
+                JOIN
+                    authors ON book.isbn = authors.isbn
+                JOIN 
+                    contributor AS authors_contrib ON authors.contributorID = authors_contrib.contributorID
+                JOIN 
+                    publishes ON book.isbn = publishes.isbn
+                JOIN 
+                    contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
+                LEFT JOIN 
+                    rates ON book.isbn = rates.isbn AND rates.username = '{current_user}'
+                LEFT JOIN
+                    category ON category.isbn = book.isbn
+                LEFT JOIN
+                    genre ON genre.genreid = category.genreid
+                WHERE
+                    ({search_method_str})
+                    {after_str}
+                GROUP BY
+                    rates.rates, book.title, book.length, book.audience, book.releasedate,
+                    publishes_contrib.name, genre.name, book.releasedate, book.isbn
+                ORDER BY
+                    {", ".join(f"{key} {direction}" for key in sort_keys)}
+                {limit_str};
+                """
+
+        return query
+
+    @__borrows_connection
+    @__retryable
+    def search_for_book(self, search_method: str, val: str, sort_by: SortOptions, ascending: bool = True, session: Session = None) -> BookResultSet:
         """
         Search for a book by an attribute
 
@@ -624,84 +1500,83 @@ class DataInteraction:
         :param val: Value to fill in the search method
         :param sort_by: Option to sort the resulting list by specified in the enum
         :param ascending: If we sort in ascending order or False for descending order
-        :return: List of matching books in ascending alphabetical order tuple(name, authors, publisher, length,
-                                                                                audience, rating, isbn)
+        :return: BookResultSet of the matching books in ascending alphabetical order (name, authors, publisher,
+                 length, audience, rating, isbn)
         """
+        current_user = self.__session_for(session).username
+
         try:
-            search_method_str = None
-
-            if (search_method == SearchMethods.BOOK_NAME):
-                search_method_str = f"book.title ILIKE '%{val}%'"
-            elif (search_method == SearchMethods.RELEASE_DATE):
-                search_method_str = f"book.releasedate = '{val}'"
-            elif (search_method == SearchMethods.AUTHOR):
-                search_method_str = f"authors_contrib.name = '{val}'"
-            elif (search_method == SearchMethods.PUBLISHER):
-                search_method_str = f"publishes_contrib.name = '{val}'"
-            else:
-                search_method_str = f"genre.name = '{val}'"
+            query = self.__search_query(search_method, val, sort_by, ascending, current_user)
 
-            sort_by_str = None
+            self.__cursor.execute(query)
 
-            if (sort_by == SortOptions.PUBLISHER):
-                sort_by_str = "publishes_contrib.name"
-            elif (sort_by == SortOptions.GENRE):
-                sort_by_str = "genre.name"
-            elif (sort_by == SortOptions.RELEASED_YEAR):
-                sort_by_str = "EXTRACT(YEAR FROM book.releasedate)"
-            else:
-                sort_by_str = "book.title"
+            rows = self.__fetch_books()
 
-            query = f"""
-                    SELECT 
-                        book.title as title,
-                        STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
-                        STRING_AGG(DISTINCT publishes_contrib.name, ', ') AS publishers,
-                        book.length,
-                        CASE 
-                            WHEN book.audience = 0 THEN 'Kids'
-                            WHEN book.audience = 1 THEN 'Teens'
-                            WHEN book.audience = 2 THEN 'Adults'
-                            ELSE 'Unknown'
-                        END AS audience,
-                        rates.rates AS rating,
-                        book.isbn
-                    FROM 
-                        book
-                    JOIN
-                        authors ON book.isbn = authors.isbn
-                    JOIN 
-                        contributor AS authors_contrib ON authors.contributorID = authors_contrib.contributorID
-                    JOIN 
-                        publishes ON book.isbn = publishes.isbn
-                    JOIN 
-                        contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
-                    LEFT JOIN 
-                        rates ON book.isbn = rates.isbn AND rates.username = '{self.__current_user}'
-                    LEFT JOIN
-                        category ON category.isbn = book.isbn
-                    LEFT JOIN
-                        genre ON genre.genreid = category.genreid
-                    WHERE
-                        {search_method_str}
-                    GROUP BY
-                        rates.rates, book.title, book.length, book.audience, book.releasedate,
-                        publishes_contrib.name, genre.name, book.releasedate, book.isbn
-                    ORDER BY
-                        {sort_by_str}
-                        {"ASC" if ascending else "DESC"};
-                    """
+            return rows
+        except:
+            return False
 
-            self.__cursor.execute(query)
+    def stream_search_for_book(self, search_method: str, val: str, sort_by: SortOptions, ascending: bool = True, session: Session = None):
+        """
+        Search for a book like search_for_book, fetching the rows a batch at a time as they are read
+        -- Every batch is its own query on a connection borrowed only while it runs, nothing is held while the reader
+           pauses between batches
 
-            rows = self.__cursor.fetchall()
+        :return: Iterator of matching books tuple(name, authors, publisher, length, audience, rating, isbn), None if
+                 no book matches or False on failure
+        """
+        current_user = self.__session_for(session).username
 
-            return rows
+        batch_query = functools.partial(self.__search_query, search_method, val, sort_by, ascending, current_user, True)
+
+        return self.__stream(batch_query, "stream_search_for_book")
+
+    def __stream(self, batch_query, method: str):
+        """
+        Run a search a batch of rows at a time with keyset pagination, each batch continues after the sort key of the
+        last row read so no batch sorts or skips the rows before it
+        -- Rows changed between batches may still be missed or move
+
+        :param batch_query: Function(after) building the query of the batch after a sort key as in __search_query
+        :param method: Public method the statements are attributed to
+        :return: Iterator of the rows, None if there are none or False on failure
+        """
+        try:
+            rows = self.__fetch_batch(batch_query, None, method)
         except:
             return False
 
+        if len(rows) == 0:
+            return None
+
+        return self.__stream_rows(batch_query, rows, method)
 
-    def rate_book(self, book_isbn: str, rating: int) -> bool:
+    def __stream_rows(self, batch_query, rows: list[tuple], method: str):
+        while True:
+            for row in rows:
+                yield row[:SEARCH_COLUMNS]
+
+            if len(rows) < STREAM_BATCH_SIZE:
+                return
+
+            # tuple(sort value, isbn, publisher, genre)
+            last = rows[-1]
+            rows = self.__fetch_batch(batch_query, (last[SEARCH_COLUMNS], last[6]) + tuple(last[SEARCH_COLUMNS + 1:]), method)
+
+    @__borrows_connection
+    @__retryable
+    def __fetch_batch(self, batch_query, after: tuple | None, method: str) -> list[tuple]:
+        cursor = self.__cursor
+        after_str = None if after is None else cursor.mogrify("(%s, %s, %s, %s)", after).decode()
+
+        # Later batches run from whoever reads the stream, outside of the method that started it
+        cursor.attribute_to(method)
+        cursor.execute(batch_query(after = after_str))
+
+        return cursor.fetchall()
+
+    @__borrows_connection
+    def rate_book(self, book_isbn: str, rating: int, session: Session = None) -> bool:
         """
         Rate a book
         -- Book must exist
@@ -711,18 +1586,14 @@ class DataInteraction:
         :param rating: Rating of that book [1, 5]
         :return: If successful
         """
-        try:
-            # Check if book exists
-            query = f"""
-                        SELECT * FROM book WHERE isbn = '{book_isbn}';
-                    """
-            self.__cursor.execute(query)
+        current_user = self.__session_for(session).username
 
-            if self.__cursor.rowcount == 0:
+        try:
+            if not self.book_exists(book_isbn):
                 return False
             
             query = f"""
-                        SELECT * FROM rates WHERE username = '{self.__current_user}'
+                        SELECT * FROM rates WHERE username = '{current_user}'
                         AND isbn = '{book_isbn}';
                     """
             self.__cursor.execute(query)
@@ -730,13 +1601,13 @@ class DataInteraction:
             if (self.__cursor.rowcount == 0):
                 query = f"""
                             INSERT INTO rates (username, isbn, rates)
-                            VALUES ('{self.__current_user}', '{book_isbn}', {rating});
+                            VALUES ('{current_user}', '{book_isbn}', {rating});
                         """
                 self.__cursor.execute(query)
             else:
                 query = f"""
                             UPDATE rates SET rates = {rating}
-                            WHERE username = '{self.__current_user}'
+                            WHERE username = '{current_user}'
                             AND isbn = '{book_isbn}';
                         """
                 self.__cursor.execute(query)
@@ -745,7 +1616,8 @@ class DataInteraction:
         except:
             return False
 
-    def read_book_by_isbn(self, book_isbn: str, start_page: int, end_page: int) -> bool:
+    @__borrows_connection
+    def read_book_by_isbn(self, book_isbn: str, start_page: int, end_page: int, session: Session = None) -> bool:
         """
         Read a book by it's ISBN
         -- ISBN must exist
@@ -755,6 +1627,8 @@ class DataInteraction:
         :param end_page: End page for the reading session
         :return: If book read successfully
         """
+        current_user = self.__session_for(session).username
+
         try:
             numMins = random.randint(15, 300)
 
@@ -762,7 +1636,7 @@ class DataInteraction:
                         INSERT INTO reads (username, isbn, starttime, endtime, startpage, endpage)
                         VALUES
                         (
-                            '{self.__current_user}',
+                            '{current_user}',
                             '{book_isbn}',
                             CURRENT_TIMESTAMP,
                             CURRENT_TIMESTAMP + INTERVAL '{numMins} minutes',
@@ -770,75 +1644,157 @@ class DataInteraction:
                             {end_page}
                         );
                     """
-                
+                
+            self.__cursor.execute(query)
+
+            return self.__cursor.rowcount != 0
+        except:
+            return False
+
+    def __collection_size(self, collectionid: int) -> int:
+        """
+        :return: Number of books in a collection from its maintained counter
+        """
+        self.__cursor.execute(f"SELECT book_count FROM collections WHERE collectionid = {collectionid};")
+
+        row = self.__cursor.fetchone()
+
+        return 0 if row is None else row[0]
+
+    @__borrows_connection
+    def read_random_book_by_collection(self, collection_name: str, start_page: int, end_page: int, session: Session = None) -> str:
+        """
+        Read a random book from a collection
+        -- Collection name must exist
+        -- The book is picked at a random offset below the collection's book_count along its primary key index, so the
+           collection is never sorted
+
+        :param collection_name: Name of collection to select from
+        :param start_page: Start page for reading session
+        :param end_page: End page for reading session
+        :return: Name of the book that was read, empty string if failed
+        """
+        current_user = self.__session_for(session).username
+
+        try:
+            collectionid = self.__collection_id(collection_name, session)
+
+            if collectionid is None:
+                return ""
+
+            book_count = self.__collection_size(collectionid)
+
+            if book_count == 0:
+                self.__forget_collection(collection_name, session)
+                return ""
+
+            numMins = random.randint(15, 300)
+
+            # Pick and log the read in one statement
+            query = f"""
+                        WITH picked AS
+                        (
+                            SELECT belongs_to.isbn, book.title
+                            FROM
+                                belongs_to
+                            JOIN
+                                book ON book.isbn = belongs_to.isbn
+                            WHERE belongs_to.collectionid = {collectionid}
+                            ORDER BY belongs_to.isbn
+                            OFFSET {random.randrange(book_count)}
+                            LIMIT 1
+                        ), logged AS
+                        (
+                            INSERT INTO reads (username, isbn, starttime, endtime, startpage, endpage)
+                            SELECT
+                                '{current_user}',
+                                isbn,
+                                CURRENT_TIMESTAMP,
+                                CURRENT_TIMESTAMP + INTERVAL '{numMins} minutes',
+                                {start_page},
+                                {end_page}
+                            FROM picked
+                        )
+                        SELECT title FROM picked;
+                    """
+
             self.__cursor.execute(query)
 
-            return self.__cursor.rowcount != 0
+            row = self.__cursor.fetchone()
+
+            if row is None:
+                return ""
+
+            return row[0]
         except:
             return False
 
-    def read_random_book_by_collection(self, collection_name: str, start_page: int, end_page: int) -> str:
+    @__borrows_connection
+    def read_random_books_by_collection(self, collection_name: str, count: int, start_page: int, end_page: int, session: Session = None) -> list[str]:
         """
-        Read a random book from a collection
+        Read several distinct random books from a collection, logging every reading session in one write
         -- Collection name must exist
+        -- Positions are sampled below the collection's book_count and matched in one pass along its primary key index
 
         :param collection_name: Name of collection to select from
-        :param start_page: Start page for reading session
-        :param end_page: End page for reading session
-        :return: Name of the book that was read, empty string if failed
+        :param count: Number of books to read, every book of the collection if it holds fewer
+        :param start_page: Start page for every reading session
+        :param end_page: End page for every reading session
+        :return: Names of the books that were read, empty if failed
         """
+        current_user = self.__session_for(session).username
+
         try:
-            query = f"""
-                        SELECT book.isbn, book.title
-                        FROM
-                            collections
-                        JOIN
-                            creates on creates.collectionid = collections.collectionid
-                        JOIN
-                            belongs_to ON collections.collectionid = belongs_to.collectionid
-                        JOIN
-                            book ON book.isbn = belongs_to.isbn
-                        WHERE collections.name = '{collection_name}'
-                            AND creates.username = '{self.__current_user}'
-                        GROUP BY book.isbn, book.title
-                        ORDER BY RANDOM()
-                        LIMIT 1;
-                    """
-            
-            self.__cursor.execute(query)
-            
-            if (self.__cursor.rowcount == 0):
-                return ""
-            
-            book_info = self.__cursor.fetchone()
-            book_isbn = book_info[0]
-            book_name = book_info[1]
+            collectionid = self.__collection_id(collection_name, session)
 
-            numMins = random.randint(15, 300)
+            if collectionid is None or count <= 0:
+                return []
+
+            book_count = self.__collection_size(collectionid)
+
+            if book_count == 0:
+                self.__forget_collection(collection_name, session)
+                return []
+
+            positions = ", ".join(str(position) for position in random.sample(range(book_count), min(count, book_count)))
 
             query = f"""
-                        INSERT INTO reads (username, isbn, starttime, endtime, startpage, endpage)
-                        VALUES
+                        WITH picked AS
                         (
-                            '{self.__current_user}',
-                            '{book_isbn}',
-                            CURRENT_TIMESTAMP,
-                            CURRENT_TIMESTAMP + INTERVAL '{numMins} minutes',
-                            {start_page},
-                            {end_page}
-                        );
+                            SELECT positioned.isbn, book.title
+                            FROM
+                                (
+                                    SELECT isbn, ROW_NUMBER() OVER (ORDER BY isbn) - 1 AS position
+                                    FROM belongs_to
+                                    WHERE collectionid = {collectionid}
+                                ) AS positioned
+                            JOIN
+                                book ON book.isbn = positioned.isbn
+                            WHERE positioned.position IN ({positions})
+                        ), logged AS
+                        (
+                            INSERT INTO reads (username, isbn, starttime, endtime, startpage, endpage)
+                            SELECT
+                                '{current_user}',
+                                isbn,
+                                CURRENT_TIMESTAMP,
+                                CURRENT_TIMESTAMP + INTERVAL '1 minute' * (15 + FLOOR(RANDOM() * 286)),
+                                {start_page},
+                                {end_page}
+                            FROM picked
+                        )
+                        SELECT title FROM picked;
                     """
-                
+
             self.__cursor.execute(query)
 
-            if self.__cursor.rowcount == 0:
-                return ""
-            
-            return book_name
+            return [row[0] for row in self.__cursor.fetchall()]
         except:
             return False
 
-    def get_top_books(self, username: str = None) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def get_top_books(self, username: str = None, session: Session = None) -> BookResultSet:
         """
         Get top 10 books for the given user
 
@@ -846,7 +1802,7 @@ class DataInteraction:
         :return: Top books
         """
         if (username == None):
-            username = self.__current_user
+            username = self.__session_for(session).username
         
         try:
             query = f"""
@@ -885,13 +1841,156 @@ class DataInteraction:
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
-    def get_top_recent_books(self) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def get_profile_summary(self, username: str = None, session: Session = None) -> tuple[int, int, int, int, list[tuple[str, str, str, int, str, int]]] | None:
+        """
+        Get everything shown on a profile in a single statement
+        -- Pages read and follow counts are the counters on users, kept current by triggers for every process
+
+        :param username: Username of the user to query, if None use current user
+        :return: tuple(number of collections, number of followers, number following, total pages read,
+                 top 10 books as tuple(name, authors, publisher, length, audience, rating)) or None if the user does not exist
+        """
+        if (username == None):
+            username = self.__session_for(session).username
+
+        try:
+            query = f"""
+                        SELECT
+                            (SELECT COUNT(*) FROM creates WHERE username = '{username}'),
+                            users.follower_count,
+                            users.following_count,
+                            users.pages_read,
+                            (
+                                SELECT COALESCE(JSON_AGG(JSON_BUILD_ARRAY(title, authors, publishers, length, audience, rating)
+                                                         ORDER BY pages DESC), '[]')
+                                FROM
+                                (
+                                    SELECT
+                                        book.title as title,
+                                        STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
+                                        STRING_AGG(DISTINCT publishes_contrib.name, ', ') AS publishers,
+                                        book.length,
+                                        CASE
+                                            WHEN book.audience = 0 THEN 'Kids'
+                                            WHEN book.audience = 1 THEN 'Teens'
+                                            WHEN book.audience = 2 THEN 'Adults'
+                                            ELSE 'Unknown'
+                                        END AS audience,
+                                        rates.rates AS rating,
+                                        top_reads.pages
+                                    FROM
+                                        (
+                                            SELECT isbn, SUM(endpage - startpage) AS pages
+                                            FROM reads
+                                            WHERE username = '{username}'
+                                            GROUP BY isbn
+                                            ORDER BY pages DESC
+                                            LIMIT 10
+                                        ) AS top_reads
+                                    JOIN
+                                        book on book.isbn = top_reads.isbn
+                                    JOIN
+                                        authors ON book.isbn = authors.isbn
+                                    JOIN
+                                        contributor AS authors_contrib ON authors.contributorID = authors_contrib.contributorID
+                                    JOIN
+                                        publishes ON book.isbn = publishes.isbn
+                                    JOIN
+                                        contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
+                                    LEFT JOIN
+                                        rates ON book.isbn = rates.isbn AND rates.username = '{username}'
+                                    GROUP BY
+                                        rates.rates, book.isbn, book.title, book.length, book.audience, top_reads.pages
+                                ) AS top_books
+                            )
+                        FROM
+                            users
+                        WHERE
+                            users.username = '{username}';
+                    """
+
+            self.__cursor.execute(query)
+            row = self.__cursor.fetchone()
+
+            if row is None:
+                return None
+
+            collections, followers, following, pages, top_books = row
+
+            return collections, followers, following, pages, [tuple(book) for book in top_books]
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def get_reading_stats(self, username: str = None, session: Session = None) -> dict | None:
+        """
+        Get reading statistics of a user: pages per day, rolling totals, streaks, session averages and favourite
+        genres over time
+
+        :param username: Username of the user to query, if None use current user
+        :return: Dict of metric name -> value as computed by ReadingStats, None if the user does not exist
+        -- Every reading session is fetched in one query and the metrics are computed on the arrays
+        """
+        if (username == None):
+            username = self.__session_for(session).username
+
+        try:
+            self.__cursor.execute(f"SELECT 1 FROM users WHERE username = '{username}';")
+
+            if self.__cursor.fetchone() is None:
+                return None
+
+            # Books count towards their first genre
+            query = f"""
+                        SELECT
+                            EXTRACT(EPOCH FROM reads.starttime)::BIGINT,
+                            EXTRACT(EPOCH FROM reads.endtime)::BIGINT,
+                            reads.endpage - reads.startpage,
+                            COALESCE((SELECT MIN(category.genreid) FROM category WHERE category.isbn = reads.isbn), {NO_GENRE})
+                        FROM
+                            reads
+                        WHERE
+                            reads.username = '{username}';
+                    """
+
+            self.__cursor.execute(query)
+
+            batches = [np.zeros((0, 4), dtype=np.int64)]
+
+            while True:
+                rows = self.__cursor.fetchmany(ARRAY_BATCH_SIZE)
+
+                if not rows:
+                    break
+
+                batches.append(np.array(rows, dtype=np.int64))
+
+            stats = ReadingStats(np.concatenate(batches))
+            genre_ids = stats.genre_ids()
+            genre_names = dict()
+
+            if genre_ids:
+                self.__cursor.execute(f"""
+                    SELECT genreid, name FROM genre WHERE genreid IN ({", ".join(str(genreid) for genreid in genre_ids)});
+                """)
+                genre_names = dict(self.__cursor.fetchall())
+
+            return stats.summary(genre_names, np.datetime64(datetime.date.today()))
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def get_top_recent_books(self) -> BookResultSet:
         """
         Get top 20 books among all users over the past 90 days
 
@@ -936,20 +2035,63 @@ class DataInteraction:
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
-    def get_top_following_books(self) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def get_top_following_books(self, session: Session = None) -> BookResultSet:
         """
         Get the top 20 books among users that you follow
+        -- Served from the pre-ranked following_feed, reads of very popular followees are merged on read
 
         :return: Top 20 books
         """
+        current_user = self.__session_for(session).username
+
         try:
             query = f"""
+                        WITH celebrity_reads AS
+                        (
+                            SELECT reads.isbn, SUM(reads.endpage - reads.startpage) AS pages
+                            FROM
+                                follows
+                            JOIN
+                                feed_celebrities ON feed_celebrities.username = follows.followeeusername
+                            JOIN
+                                reads ON reads.username = follows.followeeusername
+                            WHERE
+                                follows.followerusername = '{current_user}'
+                            GROUP BY reads.isbn
+                        ),
+                        feed AS
+                        (
+                            (
+                                SELECT isbn, pages
+                                FROM following_feed
+                                WHERE username = '{current_user}'
+                                ORDER BY pages DESC
+                                LIMIT 20
+                            )
+                            UNION
+                            SELECT isbn, pages
+                            FROM following_feed
+                            WHERE username = '{current_user}'
+                                AND isbn IN (SELECT isbn FROM celebrity_reads)
+                            UNION ALL
+                            SELECT isbn, pages FROM celebrity_reads
+                        ),
+                        top_feed AS
+                        (
+                            SELECT isbn, SUM(pages) AS pages
+                            FROM feed
+                            GROUP BY isbn
+                            ORDER BY pages DESC
+                            LIMIT 20
+                        )
                         SELECT
                             book.title as title,
                             STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
@@ -961,13 +2103,11 @@ class DataInteraction:
                                 WHEN book.audience = 2 THEN 'Adults'
                                 ELSE 'Unknown'
                             END AS audience,
-                            AVG(rates.rates) AS rating
+                            (SELECT AVG(rates.rates) FROM rates WHERE rates.isbn = book.isbn) AS rating
                         FROM
-                            reads
-                        JOIN
-                            follows ON reads.username = follows.followeeusername
+                            top_feed
                         JOIN
-                            book on book.isbn = reads.isbn
+                            book on book.isbn = top_feed.isbn
                         JOIN
                             authors ON book.isbn = authors.isbn
                         JOIN
@@ -976,24 +2116,63 @@ class DataInteraction:
                             publishes ON book.isbn = publishes.isbn
                         JOIN
                             contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
-                        LEFT JOIN
-                            rates ON reads.isbn = rates.isbn
-                        WHERE
-                            follows.followerusername = '{self.__current_user}'
                         GROUP BY
-                            reads.isbn, book.title, book.length, book.audience, reads.endpage - reads.startpage, book.releasedate
-                        ORDER BY SUM(reads.endpage - reads.startpage) DESC
-                        LIMIT 20;
+                            book.isbn, book.title, book.length, book.audience, top_feed.pages
+                        ORDER BY top_feed.pages DESC;
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
-    def get_top_new_releases(self) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    def rebuild_following_feed(self) -> bool:
+        """
+        Bulk job recomputing the fan-out exceptions and every user's following feed
+
+        :return: If successful
+        """
+        try:
+            self.__cursor.execute(schema.REBUILD_FOLLOWING_FEED)
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    def rebuild_collection_counters(self) -> bool:
+        """
+        Bulk job recounting the books and pages of every collection
+
+        :return: If successful
+        """
+        try:
+            self.__cursor.execute(schema.REBUILD_COLLECTION_COUNTERS)
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    def rebuild_user_counters(self) -> bool:
+        """
+        Bulk job recounting the pages read, followers and followees of every user
+
+        :return: If successful
+        """
+        try:
+            self.__cursor.execute(schema.REBUILD_USER_COUNTERS)
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def get_top_new_releases(self) -> BookResultSet:
         """
         Get the top 5 new releases among all users
 
@@ -1036,18 +2215,22 @@ class DataInteraction:
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
-    def get_recommendations(self) -> list[tuple[str, list[str], str, int, str, int]]:
+    @__borrows_connection
+    @__retryable
+    def get_recommendations(self, session: Session = None) -> BookResultSet:
         """
         Get recommendations for books to read for the current user
 
         :return: Books recommended by the system
         """
+        current_user = self.__session_for(session).username
+
         try:
             query = f"""
                         WITH unread_books AS
@@ -1077,7 +2260,7 @@ class DataInteraction:
                                         SELECT 1
                                         FROM reads
                                         WHERE reads.isbn = book.isbn
-                                        AND reads.username = '{self.__current_user}'
+                                        AND reads.username = '{current_user}'
                                     )
                             GROUP BY
                                 book.isbn, book.title, category.genreid, authors.contributorid, book.length, book.audience
@@ -1092,16 +2275,16 @@ class DataInteraction:
                                 FROM
                                     follows
                                 WHERE
-                                    followerusername = '{self.__current_user}'
+                                    followerusername = '{current_user}'
                                 UNION
                                 SELECT
                                     followerusername AS username 
                                 FROM
                                     follows 
                                 WHERE
-                                    followeeusername = '{self.__current_user}'
+                                    followeeusername = '{current_user}'
                                 UNION
-                                SELECT '{self.__current_user}' AS username
+                                SELECT '{current_user}' AS username
                             )
                             AS users_unfiltered
                         ),
@@ -1174,25 +2357,209 @@ class DataInteraction:
                     """
 
             self.__cursor.execute(query)
-            rows = self.__cursor.fetchall()
+            rows = self.__fetch_books()
             
             return rows
         except:
             return False
 
+    def __get_book_features(self, book_isbns: list[str] = None) -> list[tuple[str, str]]:
+        """
+        Get the genre, author and publisher features of books for the similarity index
+
+        :param book_isbns: ISBNs of the books to fetch, if None fetch the whole catalog
+        :return: List of tuple(isbn, feature)
+        """
+        isbn_filter = ""
+
+        if book_isbns is not None:
+            isbn_list = ", ".join(f"'{isbn}'" for isbn in book_isbns)
+            isbn_filter = f"WHERE isbn IN ({isbn_list})"
+
+        query = f"""
+                    SELECT isbn, 'genre:' || genreid FROM category {isbn_filter}
+                    UNION ALL
+                    SELECT isbn, 'author:' || contributorid FROM authors {isbn_filter}
+                    UNION ALL
+                    SELECT isbn, 'publisher:' || contributorid FROM publishes {isbn_filter};
+                """
+
+        self.__cursor.execute(query)
+
+        return self.__cursor.fetchall()
+
+    @__borrows_connection
+    @__retryable
+    def build_similarity_index(self) -> bool:
+        """
+        Bulk build the MinHash/LSH similarity index from category, authors and publishes
+        -- Kept up to date by sync_catalog afterwards, so the catalog is synced first and no change falls in between
+
+        :return: If successful
+        """
+        try:
+            if not self.sync_catalog():
+                return False
+
+            index = BookSimilarityIndex()
+            index.build(self.__get_book_features())
+
+            self.__similarity_index = index
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    def refresh_similarity_index(self, book_isbns: list[str]) -> bool:
+        """
+        Update the similarity index after the genres, authors or publishers of books changed
+
+        :param book_isbns: ISBNs of the books that changed
+        :return: If successful
+        """
+        if self.__similarity_index is None:
+            return self.build_similarity_index()
+
+        try:
+            features = dict((isbn, set()) for isbn in book_isbns)
+
+            for isbn, feature in self.__get_book_features(book_isbns):
+                features[isbn].add(feature)
+
+            # Books with no features left (e.g. deleted) are removed by add()
+            with self.__lock:
+                for isbn, book_features in features.items():
+                    self.__similarity_index.add(isbn, book_features)
+
+            return True
+        except:
+            return False
+
+    @__borrows_connection
+    @__retryable
+    def get_similar_books(self, book_isbn: str, limit: int = 10, session: Session = None) -> list[tuple[str, list[str], str, int, str, int, str, float]]:
+        """
+        Get the books most similar to a given book by shared genres, authors and publishers
+
+        :param book_isbn: ISBN of the book to compare against
+        :param limit: Maximum number of books to return
+        :return: List of books as tuple(name, authors, publisher, length, audience, rating, isbn, similarity)
+                 in descending similarity
+        """
+        current_user = self.__session_for(session).username
+
+        if self.__similarity_index is None:
+            if not self.build_similarity_index():
+                return False
+        # A stale catalog sync also refreshes the index with the books changed since
+        elif not self.__catalog_ready():
+            return False
+
+        with self.__lock:
+            neighbours = self.__similarity_index.query(book_isbn, limit)
+
+        if len(neighbours) == 0:
+            return []
+
+        try:
+            isbn_list = ", ".join(f"'{isbn}'" for isbn, _ in neighbours)
+
+            query = f"""
+                    SELECT
+                        book.title as title,
+                        STRING_AGG(DISTINCT authors_contrib.name, ', ') AS authors,
+                        STRING_AGG(DISTINCT publishes_contrib.name, ', ') AS publishers,
+                        book.length,
+                        CASE
+                            WHEN book.audience = 0 THEN 'Kids'
+                            WHEN book.audience = 1 THEN 'Teens'
+                            WHEN book.audience = 2 THEN 'Adults'
+                            ELSE 'Unknown'
+                        END AS audience,
+                        rates.rates AS rating,
+                        book.isbn
+                    FROM
+                        book
+                    JOIN
+                        authors ON book.isbn = authors.isbn
+                    JOIN
+                        contributor AS authors_contrib ON authors.contributorID = authors_contrib.contributorID
+                    JOIN
+                        publishes ON book.isbn = publishes.isbn
+                    JOIN
+                        contributor AS publishes_contrib ON publishes.contributorID = publishes_contrib.contributorID
+                    LEFT JOIN
+                        rates ON book.isbn = rates.isbn AND rates.username = '{current_user}'
+                    WHERE
+                        book.isbn IN ({isbn_list})
+                    GROUP BY
+                        rates.rates, book.title, book.length, book.audience, book.isbn;
+                    """
+
+            self.__cursor.execute(query)
+            books = dict((row[6], row) for row in self.__cursor.fetchall())
+
+            return [books[isbn] + (round(similarity, 2),) for isbn, similarity in neighbours if isbn in books]
+        except:
+            return False
+
+    @__borrows_connection
+    def migrate(self) -> bool:
+        """
+        Apply the schema additions (tables, indexes and triggers) that the features rely on
+
+        :return: If all migrations were applied
+        """
+        try:
+            for _, statements in schema.MIGRATIONS:
+                self.__cursor.execute(statements)
+
+            return True
+        except:
+            return False
+
     def shutdown(self):
         try:
-            self.__cursor.close()
+            self.__catalog.close()
         except:
             pass
         try:
-            self.__connection.close()
+            self.__pool.close()
         except:
             pass
         try:
-            self.__sshTunnel.close()
+            # Other instances of the process may still use the tunnel
+            if self.__sshTunnel is not None:
+                TUNNELS.release(self.__sshTunnel)
+                self.__sshTunnel = None
         except:
             pass
 
-    def get_current_user(self):
-        return self.__current_user
\ No newline at end of file
+    def get_query_stats(self) -> list[tuple]:
+        """
+        Get per-method statement statistics for this session
+
+        :return: List of tuple(method, calls, errors, mean ms, p50 ms, p95 ms, p99 ms, max ms, rows, bytes, last error)
+        """
+        return self.__query_stats.summary()
+
+    def capture_statements(self, enabled: bool = True) -> list[tuple]:
+        """
+        Start or stop recording the statements this session executes, e.g. to EXPLAIN them
+
+        :param enabled: If statements should be recorded from now on
+        :return: List of tuple(method, query, vars) recorded since capturing started
+        """
+        return self.__query_stats.capture(enabled)
+
+    def get_current_user(self, session: Session = None):
+        return self.__session_for(session).username
+
+    def bind(self, session: Session) -> BoundDataInteraction:
+        """
+        Get this DataInteraction acting for one session, e.g. to run an Interface per user over shared connections
+
+        :param session: Session to pass to every method taking one
+        :return: BoundDataInteraction
+        """
+        return BoundDataInteraction(self, session)
\ No newline at end of file
@@ -0,0 +1,284 @@
+import numpy as np
+
+# Number of pending follow/unfollow edits before the CSR arrays are rebuilt
+COMPACT_THRESHOLD = 4096
+
+
+class FollowGraph:
+    """
+    In-memory adjacency index of the follow graph
+    -- Usernames are interned to integer ids, edges are stored as CSR arrays in both directions
+    -- Follows and unfollows go to a small overlay that is folded into the CSR arrays in bulk
+    """
+    __slots__ = ["__ids", "__names", "__following", "__followers", "__out_degree", "__in_degree",
+                 "__added", "__removed", "__pending"]
+
+    def __init__(self):
+        self.__ids = dict()
+        self.__names = []
+
+        # tuple(indptr, indices) for each direction
+        self.__following = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        self.__followers = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+
+        self.__out_degree = np.zeros(0, dtype=np.int32)
+        self.__in_degree = np.zeros(0, dtype=np.int32)
+
+        # Overlay of edits since the last compaction: follower id -> set of followee ids
+        self.__added = dict()
+        self.__removed = dict()
+        self.__pending = 0
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def __intern(self, username: str) -> int:
+        """
+        Get the id of a username, assigning a new one if it has not been seen
+
+        :param username: Username to intern
+        :return: Integer id
+        """
+        uid = self.__ids.get(username)
+
+        if uid is None:
+            uid = len(self.__names)
+            self.__ids[username] = uid
+            self.__names.append(username)
+
+            if uid >= len(self.__out_degree):
+                size = max(16, 2 * len(self.__out_degree))
+                self.__out_degree = np.resize(self.__out_degree, size)
+                self.__in_degree = np.resize(self.__in_degree, size)
+                self.__out_degree[uid:] = 0
+                self.__in_degree[uid:] = 0
+
+        return uid
+
+    @staticmethod
+    def __csr(sources: np.ndarray, targets: np.ndarray, num_nodes: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Build CSR arrays from an edge list
+
+        :param sources: Source id of every edge
+        :param targets: Target id of every edge
+        :param num_nodes: Number of interned users
+        :return: tuple(indptr, indices)
+        """
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+
+        return indptr, targets[order].astype(np.int32)
+
+    def __edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get every current edge, including the overlay
+
+        :return: tuple(follower ids, followee ids)
+        """
+        indptr, indices = self.__following
+        sources = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+        targets = indices
+
+        if len(self.__removed) != 0:
+            removed = set((follower, followee) for follower, followees in self.__removed.items() for followee in followees)
+            keep = np.fromiter(((s, t) not in removed for s, t in zip(sources.tolist(), targets.tolist())),
+                               dtype=bool, count=len(sources))
+            sources, targets = sources[keep], targets[keep]
+
+        added = [(follower, followee) for follower, followees in self.__added.items() for followee in followees]
+
+        if len(added) != 0:
+            added = np.array(added, dtype=np.int32)
+            sources = np.concatenate((sources, added[:, 0]))
+            targets = np.concatenate((targets, added[:, 1]))
+
+        return sources, targets
+
+    def __compact(self) -> None:
+        """
+        Fold the overlay into freshly built CSR arrays
+        """
+        sources, targets = self.__edges()
+        self.__load(sources, targets)
+
+    def __load(self, sources: np.ndarray, targets: np.ndarray) -> None:
+        num_nodes = len(self.__names)
+
+        self.__following = self.__csr(sources, targets, num_nodes)
+        self.__followers = self.__csr(targets, sources, num_nodes)
+
+        self.__out_degree = np.bincount(sources, minlength=num_nodes).astype(np.int32)
+        self.__in_degree = np.bincount(targets, minlength=num_nodes).astype(np.int32)
+
+        self.__added.clear()
+        self.__removed.clear()
+        self.__pending = 0
+
+    def build(self, rows) -> None:
+        """
+        Bulk load the graph, replacing anything already stored
+
+        :param rows: Iterable of tuple(follower username, followee username)
+        """
+        self.__ids.clear()
+        self.__names.clear()
+
+        edges = [(self.__intern(follower), self.__intern(followee)) for follower, followee in rows]
+        edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+
+        self.__load(edges[:, 0], edges[:, 1])
+
+    def __neighbours(self, uid: int, csr: tuple[np.ndarray, np.ndarray], outgoing: bool) -> np.ndarray:
+        """
+        Get the neighbours of a user in one direction, applying the overlay
+
+        :param uid: Id of the user
+        :param csr: CSR arrays of the direction
+        :param outgoing: True for followees, False for followers
+        :return: Array of neighbour ids
+        """
+        indptr, indices = csr
+        base = indices[indptr[uid]:indptr[uid + 1]] if uid + 1 < len(indptr) else indices[0:0]
+
+        if self.__pending == 0:
+            return base
+
+        if outgoing:
+            removed = self.__removed.get(uid, ())
+            added = self.__added.get(uid, ())
+        else:
+            removed = [follower for follower, followees in self.__removed.items() if uid in followees]
+            added = [follower for follower, followees in self.__added.items() if uid in followees]
+
+        if len(removed) != 0:
+            base = base[~np.isin(base, np.fromiter(removed, dtype=np.int32))]
+
+        if len(added) != 0:
+            base = np.concatenate((base, np.fromiter(added, dtype=np.int32)))
+
+        return base
+
+    def follow(self, follower: str, followee: str) -> None:
+        """
+        Record a new follow
+
+        :param follower: Username of the follower
+        :param followee: Username of the person followed
+        """
+        source, target = self.__intern(follower), self.__intern(followee)
+
+        if source in self.__removed and target in self.__removed[source]:
+            self.__removed[source].discard(target)
+        else:
+            self.__added.setdefault(source, set()).add(target)
+
+        self.__out_degree[source] += 1
+        self.__in_degree[target] += 1
+        self.__pending += 1
+
+        if self.__pending >= COMPACT_THRESHOLD:
+            self.__compact()
+
+    def unfollow(self, follower: str, followee: str) -> None:
+        """
+        Record an unfollow
+
+        :param follower: Username of the follower
+        :param followee: Username of the person unfollowed
+        """
+        source, target = self.__ids.get(follower), self.__ids.get(followee)
+
+        if source is None or target is None:
+            return
+
+        if source in self.__added and target in self.__added[source]:
+            self.__added[source].discard(target)
+        else:
+            self.__removed.setdefault(source, set()).add(target)
+
+        self.__out_degree[source] -= 1
+        self.__in_degree[target] -= 1
+        self.__pending += 1
+
+        if self.__pending >= COMPACT_THRESHOLD:
+            self.__compact()
+
+    def follower_count(self, username: str) -> int:
+        """
+        :param username: Username of the user
+        :return: Number of followers
+        """
+        uid = self.__ids.get(username)
+
+        return 0 if uid is None else int(self.__in_degree[uid])
+
+    def following_count(self, username: str) -> int:
+        """
+        :param username: Username of the user
+        :return: Number of users followed
+        """
+        uid = self.__ids.get(username)
+
+        return 0 if uid is None else int(self.__out_degree[uid])
+
+    def following(self, username: str) -> list[str]:
+        """
+        :param username: Username of the user
+        :return: Usernames the user follows
+        """
+        uid = self.__ids.get(username)
+
+        if uid is None:
+            return []
+
+        return [self.__names[i] for i in self.__neighbours(uid, self.__following, True).tolist()]
+
+    def followers(self, username: str) -> list[str]:
+        """
+        :param username: Username of the user
+        :return: Usernames following the user
+        """
+        uid = self.__ids.get(username)
+
+        if uid is None:
+            return []
+
+        return [self.__names[i] for i in self.__neighbours(uid, self.__followers, False).tolist()]
+
+    def friends_of_friends(self, username: str, limit: int = 50) -> list[tuple[str, int]]:
+        """
+        Rank users two hops away by how many of the user's followees follow them
+
+        :param username: Username of the user
+        :param limit: Maximum number of candidates to return
+        :return: List of tuple(username, shared follows) in descending order
+        """
+        uid = self.__ids.get(username)
+
+        if uid is None:
+            return []
+
+        followees = self.__neighbours(uid, self.__following, True)
+
+        if len(followees) == 0:
+            return []
+
+        second_hop = [self.__neighbours(int(f), self.__following, True) for f in followees]
+        second_hop = np.concatenate(second_hop)
+
+        counts = np.bincount(second_hop, minlength=len(self.__names))
+
+        # Already followed users and the user themself are not suggestions
+        counts[followees] = 0
+        counts[uid] = 0
+
+        candidates = np.flatnonzero(counts)
+
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-counts[candidates], limit - 1)[:limit]]
+
+        candidates = candidates[np.lexsort((candidates, -counts[candidates]))]
+
+        return [(self.__names[i], int(counts[i])) for i in candidates.tolist()]
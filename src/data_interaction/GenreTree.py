@@ -0,0 +1,168 @@
+import bisect
+import re
+
+USER_SUFFIX = re.compile(r"\s+user$", re.IGNORECASE)
+HYPHEN = re.compile(r"\s*-\s*")
+WHITESPACE = re.compile(r"\s+")
+
+# Same normalization in SQL, used to build the genre_closure table server side
+NORMALIZE_SQL = (
+    r"LOWER(TRIM(BOTH '-' FROM REGEXP_REPLACE(REGEXP_REPLACE(REGEXP_REPLACE("
+    r"TRIM({column}), '\s+user$', '', 'i'), '\s*-\s*', '-', 'g'), '\s+', ' ', 'g')))"
+)
+
+
+def normalize_genre(name: str) -> str:
+    """
+    Normalize a genre name into its hierarchy path
+    -- " Academic-College user" and "Academic - College " both become "academic-college"
+
+    :param name: Genre name as stored
+    :return: Normalized path with levels separated by '-'
+    """
+    name = USER_SUFFIX.sub("", name.strip())
+    name = HYPHEN.sub("-", name)
+    name = WHITESPACE.sub(" ", name)
+
+    return name.strip("-").lower()
+
+
+class GenreTree:
+    """
+    In-memory index of the hyphenated genre taxonomy
+    -- Duplicate and "user" variants of a genre share one node holding all of their ids
+    """
+    __slots__ = ["__ids", "__names", "__children", "__sorted_paths"]
+
+    def __init__(self, rows=()):
+        """
+        :param rows: Iterable of tuple(genreid, name)
+        """
+        # path -> set of genre ids, path -> display name, path -> set of child paths
+        self.__ids = dict()
+        self.__names = dict()
+        self.__children = dict()
+        self.__sorted_paths = []
+
+        for genreid, name in rows:
+            self.add(genreid, name)
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def add(self, genreid: int, name: str) -> None:
+        """
+        Add a genre, creating any missing ancestors
+
+        :param genreid: Id of the genre
+        :param name: Name of the genre as stored
+        """
+        path = normalize_genre(name)
+
+        if path == "":
+            return
+
+        display = HYPHEN.sub("-", WHITESPACE.sub(" ", USER_SUFFIX.sub("", name.strip()))).strip("-")
+        levels = path.split("-")
+        display_levels = display.split("-")
+
+        for depth in range(1, len(levels) + 1):
+            node = "-".join(levels[:depth])
+
+            if node not in self.__names:
+                self.__names[node] = "-".join(display_levels[:depth])
+                self.__ids[node] = set()
+                self.__children[node] = set()
+                bisect.insort(self.__sorted_paths, node)
+
+            if depth > 1:
+                self.__children["-".join(levels[:depth - 1])].add(node)
+
+        self.__ids[path].add(genreid)
+
+    def __subtree(self, path: str):
+        """
+        :param path: Normalized path of the root
+        :return: Generator of every path in the subtree, root included
+        """
+        stack = [path]
+
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(self.__children[node])
+
+    def resolve(self, name: str) -> set[int]:
+        """
+        Get the ids of a genre and all its variants
+
+        :param name: Genre name in any spelling
+        :return: Set of genre ids, empty if unknown
+        """
+        return set(self.__ids.get(normalize_genre(name), ()))
+
+    def descendants(self, name: str) -> set[int]:
+        """
+        Get the ids of a genre and every genre below it
+
+        :param name: Genre name in any spelling
+        :return: Set of genre ids, empty if unknown
+        """
+        path = normalize_genre(name)
+
+        if path not in self.__names:
+            return set()
+
+        ids = set()
+
+        for node in self.__subtree(path):
+            ids |= self.__ids[node]
+
+        return ids
+
+    def subtree_roots(self, name: str) -> set[int]:
+        """
+        Get the smallest set of genre ids whose descendants cover the genre's subtree
+        -- Levels that only exist as a prefix (e.g. "Adventure" with only "Adventure-Pirates") have no id
+
+        :param name: Genre name in any spelling
+        :return: Set of genre ids, empty if unknown
+        """
+        path = normalize_genre(name)
+
+        if path not in self.__names:
+            return set()
+
+        roots = set()
+        stack = [path]
+
+        while stack:
+            node = stack.pop()
+
+            if len(self.__ids[node]) != 0:
+                roots |= self.__ids[node]
+            else:
+                stack.extend(self.__children[node])
+
+        return roots
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> list[str]:
+        """
+        Get genre names starting with a prefix
+
+        :param prefix: Prefix in any spelling
+        :param limit: Maximum number of names
+        :return: Display names in alphabetical order
+        """
+        prefix = normalize_genre(prefix)
+        start = bisect.bisect_left(self.__sorted_paths, prefix)
+
+        matches = []
+
+        for path in self.__sorted_paths[start:]:
+            if not path.startswith(prefix) or len(matches) == limit:
+                break
+
+            matches.append(self.__names[path])
+
+        return matches
@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+
+CATALOG_FILENAME = "../catalog.sqlite3"
+
+
+class LocalCatalog:
+    """
+    On-disk SQLite replica of the book catalog (book cards with contributors and genres)
+    -- Kept up to date from the server's catalog_log, by the transaction ids logged there
+    -- Safe to share between threads, calls are serialized on the one SQLite connection
+    """
+    __slots__ = ["__connection", "__lock"]
+
+    def __init__(self, filename: str = CATALOG_FILENAME):
+        self.__connection = sqlite3.connect(filename, check_same_thread=False)
+        self.__lock = threading.Lock()
+
+        self.__connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+
+            CREATE TABLE IF NOT EXISTS book
+            (
+                isbn TEXT PRIMARY KEY,
+                title TEXT,
+                authors TEXT,
+                publishers TEXT,
+                length INTEGER,
+                audience TEXT,
+                genres TEXT
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS sync_position
+            (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                xmin INTEGER NOT NULL
+            );
+        """)
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM book;").fetchone()[0]
+
+    def synced_xmin(self) -> int | None:
+        """
+        :return: Oldest server transaction that was still running at the last sync, every change logged by an older
+                 one is in the replica, None if never synced
+        """
+        with self.__lock:
+            row = self.__connection.execute("SELECT xmin FROM sync_position WHERE id = 0;").fetchone()
+
+        return None if row is None else row[0]
+
+    def get(self, isbn: str) -> tuple[str, str, str, int, str] | None:
+        """
+        Get a book card
+
+        :param isbn: ISBN of the book
+        :return: tuple(title, authors, publishers, length, audience) or None if not found
+        """
+        with self.__lock:
+            return self.__connection.execute(
+                "SELECT title, authors, publishers, length, audience FROM book WHERE isbn = ?;", (isbn,)
+            ).fetchone()
+
+    def contains(self, isbn: str) -> bool:
+        with self.__lock:
+            return self.__connection.execute("SELECT 1 FROM book WHERE isbn = ?;", (isbn,)).fetchone() is not None
+
+    def isbns(self) -> list[str]:
+        """
+        :return: Every ISBN in the replica
+        """
+        with self.__lock:
+            return [row[0] for row in self.__connection.execute("SELECT isbn FROM book;")]
+
+    def apply(self, books: list[tuple], changed_isbns, xmin: int, replace: bool = False) -> None:
+        """
+        Apply a snapshot or delta from the server in one transaction
+
+        :param books: Book cards as tuple(isbn, title, authors, publishers, length, audience, genres)
+        :param changed_isbns: ISBNs that changed, those missing from books were deleted
+        :param xmin: Oldest server transaction still running when the data was read
+        :param replace: If books is a full snapshot replacing the replica
+        """
+        with self.__lock, self.__connection:
+            if replace:
+                self.__connection.execute("DELETE FROM book;")
+            else:
+                found = set(book[0] for book in books)
+                self.__connection.executemany(
+                    "DELETE FROM book WHERE isbn = ?;",
+                    ((isbn,) for isbn in changed_isbns if isbn not in found)
+                )
+
+            self.__connection.executemany("INSERT OR REPLACE INTO book VALUES (?, ?, ?, ?, ?, ?, ?);", books)
+            self.__connection.execute("INSERT OR REPLACE INTO sync_position (id, xmin) VALUES (0, ?);", (xmin,))
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
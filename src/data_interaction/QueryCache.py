@@ -0,0 +1,214 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+# Default memory budget of the cache in bytes
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Seconds an invalidation is remembered per tag, results that took longer to load are not stored
+INVALIDATION_HORIZON = 60
+
+
+class QueryCache:
+    """
+    Memory bounded LRU cache of query results with per-entry TTLs and tag based invalidation
+    -- Safe to use from several threads, e.g. invalidation from a change listener
+    """
+    __slots__ = ["__entries", "__tags", "__max_bytes", "__bytes", "__stats", "__lock", "__generation",
+                 "__invalidated", "__forgotten"]
+
+    # Returned by get() on a miss since None and [] are valid cached results
+    MISS = object()
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        # key -> tuple(value, expiry time, size, tags), least recently used first
+        self.__entries = OrderedDict()
+        # tag -> set of keys
+        self.__tags = dict()
+        self.__max_bytes = max_bytes
+        self.__bytes = 0
+        self.__stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self.__lock = threading.RLock()
+        # Bumped on every invalidation, results loaded across an invalidation of one of their tags are not stored
+        self.__generation = 0
+        # tag -> tuple(generation it was last invalidated at, time), least recently invalidated first
+        self.__invalidated = OrderedDict()
+        # Generation of the newest invalidation no longer remembered
+        self.__forgotten = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @staticmethod
+    def __sizeof(value) -> int:
+        """
+        Approximate the memory used by a query result
+
+        :param value: Result to measure
+        :return: Size in bytes
+        """
+        # Results that know their own footprint, e.g. BookResultSet
+        byte_size = getattr(value, "byte_size", None)
+
+        if byte_size is not None:
+            return byte_size()
+
+        size = sys.getsizeof(value)
+
+        if isinstance(value, (tuple, list)):
+            size += sum(QueryCache.__sizeof(item) for item in value)
+        elif isinstance(value, dict):
+            size += sum(QueryCache.__sizeof(key) + QueryCache.__sizeof(item) for key, item in value.items())
+
+        return size
+
+    def __remove(self, key) -> None:
+        _, _, size, tags = self.__entries.pop(key)
+        self.__bytes -= size
+
+        for tag in tags:
+            keys = self.__tags.get(tag)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if len(keys) == 0:
+                    del self.__tags[tag]
+
+    def get(self, key):
+        """
+        Look up a cached result
+
+        :param key: Hashable key of the query
+        :return: Cached result or QueryCache.MISS
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                self.__stats["misses"] += 1
+                return QueryCache.MISS
+
+            if entry[1] <= time.monotonic():
+                self.__remove(key)
+                self.__stats["expirations"] += 1
+                self.__stats["misses"] += 1
+                return QueryCache.MISS
+
+            self.__entries.move_to_end(key)
+            self.__stats["hits"] += 1
+
+            return entry[0]
+
+    def generation(self) -> int:
+        """
+        :return: Counter of invalidations, pass to put() to drop results that may be stale
+        """
+        return self.__generation
+
+    def __stale(self, tags: tuple, generation: int) -> bool:
+        """
+        :return: If any of the tags was invalidated after generation, or may have been
+        """
+        if generation < self.__forgotten:
+            return True
+
+        for tag in tags:
+            invalidated = self.__invalidated.get(tag)
+
+            if invalidated is not None and invalidated[0] > generation:
+                return True
+
+        return False
+
+    def __forget(self, now: float) -> None:
+        """
+        Drop invalidations older than INVALIDATION_HORIZON so the record stays bounded
+        """
+        while len(self.__invalidated) != 0:
+            tag, (generation, invalidated_at) = next(iter(self.__invalidated.items()))
+
+            if now - invalidated_at < INVALIDATION_HORIZON:
+                break
+
+            del self.__invalidated[tag]
+            self.__forgotten = generation
+
+    def put(self, key, value, ttl: float, tags=(), generation: int = None) -> None:
+        """
+        Store a result, evicting least recently used entries when over the memory budget
+
+        :param key: Hashable key of the query
+        :param value: Result to cache
+        :param ttl: Seconds the result stays valid
+        :param tags: Tags the entry can be invalidated by
+        :param generation: generation() from before the result was loaded, if any of the tags was invalidated
+                           since the result is not stored
+        """
+        size = self.__sizeof(value)
+        tags = tuple(tags)
+
+        with self.__lock:
+            if generation is not None and self.__stale(tags, generation):
+                return
+
+            if key in self.__entries:
+                self.__remove(key)
+
+            if size > self.__max_bytes:
+                return
+
+            self.__entries[key] = (value, time.monotonic() + ttl, size, tags)
+            self.__bytes += size
+
+            for tag in tags:
+                self.__tags.setdefault(tag, set()).add(key)
+
+            while self.__bytes > self.__max_bytes:
+                self.__remove(next(iter(self.__entries)))
+                self.__stats["evictions"] += 1
+
+    def invalidate(self, *tags) -> int:
+        """
+        Drop every entry carrying any of the given tags
+
+        :param tags: Tags to invalidate
+        :return: Number of entries dropped
+        """
+        dropped = 0
+
+        with self.__lock:
+            for tag in tags:
+                for key in list(self.__tags.get(tag, ())):
+                    self.__remove(key)
+                    dropped += 1
+
+            self.__stats["invalidations"] += dropped
+            self.__generation += 1
+            now = time.monotonic()
+
+            for tag in tags:
+                self.__invalidated[tag] = (self.__generation, now)
+                self.__invalidated.move_to_end(tag)
+
+            self.__forget(now)
+
+        return dropped
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__tags.clear()
+            self.__bytes = 0
+            self.__generation += 1
+            # Every entry is dropped, as if all tags were invalidated
+            self.__invalidated.clear()
+            self.__forgotten = self.__generation
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Hit, miss, eviction, expiration and invalidation counts plus current size
+        """
+        with self.__lock:
+            return dict(self.__stats, entries=len(self.__entries), bytes=self.__bytes)
@@ -0,0 +1,436 @@
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+import select
+
+import psycopg2.extensions
+
+# Upper bounds in milliseconds of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+SLOW_QUERY_LOG = "../slow_queries.log"
+
+# Budget key in the "statement_timeouts" config applying to methods without their own, the server's timeout
+# applies to them if it is not set
+DEFAULT_TIMEOUT_KEY = "default"
+
+# Timeout of a connection whose last statement failed, its SET may have been rolled back with it
+UNKNOWN_TIMEOUT = object()
+
+# SQLSTATE of statements cancelled by a timeout or a cancel request
+QUERY_CANCELED = "57014"
+
+# Files whose public methods statements are attributed to
+ATTRIBUTED_FILES = ("DataInteraction.py", "CachedDataInteraction.py")
+
+
+def _calling_method() -> str:
+    """
+    Find the DataInteraction method that issued the statement
+
+    :return: Name of the innermost public DataInteraction method on the stack
+    """
+    frame = sys._getframe(2)
+
+    while frame is not None:
+        code = frame.f_code
+
+        if not code.co_name.startswith(("_", "<")) and os.path.basename(code.co_filename) in ATTRIBUTED_FILES:
+            return code.co_name
+
+        frame = frame.f_back
+
+    return "unknown"
+
+
+def _row_bytes(rows) -> int:
+    """
+    Approximate the size of fetched rows
+
+    :param rows: Rows as returned by fetch*
+    :return: Approximate bytes
+    """
+    size = 0
+
+    for row in rows:
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                size += len(value)
+            elif value is not None:
+                size += 8
+
+    return size
+
+
+class MethodStats:
+    __slots__ = ["calls", "errors", "timeouts", "cancels", "rows", "bytes", "total_ms", "max_ms", "buckets",
+                 "last_error"]
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancels = 0
+        self.rows = 0
+        self.bytes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.last_error = None
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a latency percentile from the histogram
+
+        :param fraction: Percentile as a fraction, e.g. 0.95
+        :return: Upper bound of the bucket holding the percentile in milliseconds
+        """
+        target = fraction * self.calls
+        seen = 0
+
+        for i, count in enumerate(self.buckets):
+            seen += count
+
+            if seen >= target and count != 0:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max_ms
+
+        return 0.0
+
+
+class QueryStats:
+    """
+    Session wide per-method statement statistics, statement time budgets and slow query log
+    """
+    __slots__ = ["__methods", "__lock", "__slow_ms", "__explain", "__log_filename", "__statements", "__timeouts",
+                 "__connection_timeouts"]
+
+    def __init__(self, slow_ms: float = 500, explain: bool = False, log_filename: str = SLOW_QUERY_LOG,
+                 timeouts: dict[str, int] = None):
+        """
+        :param slow_ms: Statements taking longer than this are written to the slow query log
+        :param explain: If slow read statements should be re-run with EXPLAIN (ANALYZE, BUFFERS)
+        :param log_filename: File the slow query log is appended to, None to disable it
+        :param timeouts: Method name -> statement_timeout in milliseconds (0 for none), the optional "default" key
+                         applies to every other method, methods without a budget keep the server's timeout
+        """
+        self.__methods = dict()
+        self.__lock = threading.Lock()
+        self.__slow_ms = slow_ms
+        self.__explain = explain
+        self.__log_filename = log_filename
+        self.__timeouts = timeouts
+        # Connection -> statement_timeout set on it by a budgeted method, absent while it has the server's
+        self.__connection_timeouts = weakref.WeakKeyDictionary()
+        # List of tuple(method, query, vars) while capturing statements, None otherwise
+        self.__statements = None
+
+    def __method(self, method: str) -> MethodStats:
+        stats = self.__methods.get(method)
+
+        if stats is None:
+            stats = self.__methods[method] = MethodStats()
+
+        return stats
+
+    def record_execute(self, method: str, elapsed_ms: float, error: BaseException = None) -> None:
+        with self.__lock:
+            stats = self.__method(method)
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+            bucket = len(LATENCY_BUCKETS)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed_ms <= bound:
+                    bucket = i
+                    break
+            stats.buckets[bucket] += 1
+
+            if error is not None:
+                stats.errors += 1
+                stats.last_error = f"{type(error).__name__}: {str(error).strip()}"
+
+                if isinstance(error, KeyboardInterrupt):
+                    stats.cancels += 1
+                elif getattr(error, "pgcode", None) == QUERY_CANCELED:
+                    if "statement timeout" in str(error):
+                        stats.timeouts += 1
+                    else:
+                        stats.cancels += 1
+
+    def timeout_ms(self, method: str) -> int | None:
+        """
+        :param method: Name of the method issuing a statement
+        :return: statement_timeout budget of the method in milliseconds, 0 for none, None if it has no budget
+        """
+        if self.__timeouts is None:
+            return None
+
+        timeout_ms = self.__timeouts.get(method, self.__timeouts.get(DEFAULT_TIMEOUT_KEY))
+
+        return None if timeout_ms is None else int(timeout_ms)
+
+    def timeout_statement(self, connection, method: str, local: bool = False) -> str:
+        """
+        :param connection: Connection the method's next statement runs on
+        :param method: Name of the method issuing the statement
+        :param local: If the setting should only last for the current transaction
+        :return: Statement giving the connection the method's statement_timeout, empty if it already has it
+        -- Methods without a budget get the server's timeout back from a budgeted method that ran on the connection
+        """
+        timeout_ms = self.timeout_ms(method)
+
+        with self.__lock:
+            current = self.__connection_timeouts.get(connection)
+
+            if local:
+                if timeout_ms is None and current is None:
+                    return ""
+
+                return f"SET LOCAL statement_timeout = {'DEFAULT' if timeout_ms is None else timeout_ms};"
+
+            if timeout_ms == current:
+                return ""
+
+            if timeout_ms is None:
+                del self.__connection_timeouts[connection]
+                return "RESET statement_timeout; "
+
+            self.__connection_timeouts[connection] = timeout_ms
+
+            return f"SET statement_timeout = {timeout_ms}; "
+
+    def forget_timeout(self, connection) -> None:
+        """
+        Send the timeout again before the next statement on a connection whose statement failed
+        """
+        with self.__lock:
+            self.__connection_timeouts[connection] = UNKNOWN_TIMEOUT
+
+    def record_fetch(self, method: str, rows) -> None:
+        with self.__lock:
+            stats = self.__method(method)
+            stats.rows += len(rows)
+            stats.bytes += _row_bytes(rows)
+
+    def capture(self, enabled: bool = True) -> list[tuple]:
+        """
+        Start or stop recording the text of every executed statement
+
+        :param enabled: If statements should be recorded from now on
+        :return: List of tuple(method, query, vars) recorded since capturing started
+        """
+        with self.__lock:
+            statements = self.__statements if self.__statements is not None else []
+            self.__statements = [] if enabled else None
+
+            return statements
+
+    def record_statement(self, method: str, query, vars) -> None:
+        if self.__statements is not None:
+            with self.__lock:
+                self.__statements.append((method, query, vars))
+
+    def is_slow(self, elapsed_ms: float) -> bool:
+        return elapsed_ms >= self.__slow_ms
+
+    def should_explain(self, query: str) -> bool:
+        """
+        Only read statements are explained since EXPLAIN ANALYZE executes the statement again
+
+        :param query: Statement text
+        :return: If the statement can safely be explained
+        """
+        if not self.__explain:
+            return False
+
+        text = query.lstrip().upper()
+
+        return text.startswith(("SELECT", "WITH")) and not any(
+            keyword in text for keyword in ("INSERT ", "UPDATE ", "DELETE ")
+        )
+
+    def log_slow(self, method: str, query: str, elapsed_ms: float, rowcount: int, plan=None) -> None:
+        """
+        Append a slow statement to the structured (JSON lines) slow query log
+        """
+        if self.__log_filename is None:
+            return
+
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "method": method,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rowcount": rowcount,
+            "query": " ".join(query.split()),
+        }
+
+        if plan is not None:
+            entry["plan"] = plan
+
+        with self.__lock:
+            with open(self.__log_filename, "a") as file:
+                file.write(json.dumps(entry, default=str) + "\n")
+
+    def summary(self) -> list[tuple]:
+        """
+        :return: List of tuple(method, calls, errors, timeouts, cancels, mean ms, p50 ms, p95 ms, p99 ms, max ms, rows,
+                 bytes, last error) sorted by total time spent
+        """
+        with self.__lock:
+            methods = sorted(self.__methods.items(), key=lambda item: -item[1].total_ms)
+
+            return [
+                (
+                    method, stats.calls, stats.errors, stats.timeouts, stats.cancels,
+                    round(stats.total_ms / stats.calls, 2) if stats.calls else 0.0,
+                    stats.percentile(0.5), stats.percentile(0.95), stats.percentile(0.99),
+                    round(stats.max_ms, 2), stats.rows, stats.bytes, stats.last_error
+                )
+                for method, stats in methods
+            ]
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    Cursor timing every statement and counting fetched rows and bytes into a QueryStats
+    """
+
+    def attach(self, stats: QueryStats) -> None:
+        self.stats = stats
+        self.method = "unknown"
+        self.attributed_to = None
+
+    def attribute_to(self, method: str) -> None:
+        """
+        Attribute the following statements to a method instead of the one found on the stack, e.g. for statements
+        of a stream that run after its method returned
+        """
+        self.attributed_to = method
+
+    def execute(self, query, vars=None):
+        stats = getattr(self, "stats", None)
+
+        if stats is None:
+            return super().execute(query, vars)
+
+        self.method = _calling_method() if self.attributed_to is None else self.attributed_to
+        stats.record_statement(self.method, query, vars)
+        statement = query
+
+        if self.name is None and isinstance(query, str):
+            # Sent in the same round trip, the setting stays on the connection until a statement changes it
+            statement = stats.timeout_statement(self.connection, self.method) + query
+        else:
+            # Server side cursors can only be declared for a single query and always run in a transaction
+            timeout_statement = stats.timeout_statement(self.connection, self.method, local = True)
+
+            if timeout_statement:
+                with self.connection.cursor() as timeout_cursor:
+                    timeout_cursor.execute(timeout_statement)
+
+        start = time.perf_counter()
+
+        try:
+            result = super().execute(statement, vars)
+        except BaseException as e:
+            # KeyboardInterrupt included, cancel_on_interrupt raises it for statements cancelled by Ctrl-C
+            stats.forget_timeout(self.connection)
+            stats.record_execute(self.method, (time.perf_counter() - start) * 1000, e)
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats.record_execute(self.method, elapsed_ms)
+
+        if stats.is_slow(elapsed_ms):
+            plan = None
+
+            if stats.should_explain(query):
+                try:
+                    with self.connection.cursor() as explain_cursor:
+                        explain_cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, vars)
+                        plan = explain_cursor.fetchone()[0]
+                except Exception as e:
+                    plan = f"EXPLAIN failed: {e}"
+
+            stats.log_slow(self.method, query, elapsed_ms, self.rowcount, plan)
+
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+
+        if row is not None and getattr(self, "stats", None) is not None:
+            self.stats.record_fetch(self.method, (row,))
+
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+
+        if getattr(self, "stats", None) is not None:
+            self.stats.record_fetch(self.method, rows)
+
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+
+        if getattr(self, "stats", None) is not None:
+            self.stats.record_fetch(self.method, rows)
+
+        return rows
+
+
+# Marks threads whose statement was cancelled by Ctrl-C
+_interrupts = threading.local()
+
+
+def take_interrupt() -> bool:
+    """
+    :return: If Ctrl-C cancelled a statement of the calling thread since the last call, clearing the mark
+    -- Lets callers re-raise the KeyboardInterrupt when error handling around the statement swallowed it
+    """
+    interrupted = getattr(_interrupts, "pending", False)
+    _interrupts.pending = False
+
+    return interrupted
+
+
+def cancel_on_interrupt(connection) -> None:
+    """
+    psycopg2 wait callback that keeps statements interruptible: Ctrl-C sends a cancel request for the running
+    statement instead of waiting for it to finish, then raises KeyboardInterrupt once the server answered
+    -- Install with psycopg2.extensions.set_wait_callback before opening connections
+    """
+    interrupted = False
+
+    try:
+        while True:
+            try:
+                state = connection.poll()
+
+                if state == psycopg2.extensions.POLL_OK:
+                    break
+                elif state == psycopg2.extensions.POLL_READ:
+                    select.select([connection.fileno()], [], [])
+                elif state == psycopg2.extensions.POLL_WRITE:
+                    select.select([], [connection.fileno()], [])
+                else:
+                    raise psycopg2.OperationalError(f"Bad state from poll: {state}")
+            except KeyboardInterrupt:
+                # Keep polling, the server answers the cancelled statement with an error
+                connection.cancel()
+                interrupted = True
+    except psycopg2.extensions.QueryCanceledError:
+        if not interrupted:
+            raise
+
+    if interrupted:
+        # Remembered since DataInteraction methods turn any exception, this one included, into a failed result
+        _interrupts.pending = True
+        raise KeyboardInterrupt
@@ -0,0 +1,141 @@
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Days summed by the rolling windows
+WEEK = 7
+MONTH = 30
+
+# Genres listed among the favourites
+TOP_GENRES = 5
+
+# Genre id of books without a genre
+NO_GENRE = -1
+
+
+class ReadingStats:
+    """
+    Reading metrics of one user computed from their reading sessions as arrays
+    -- Sessions are bucketed into days and months with bincount, no per-session Python loops
+    """
+    __slots__ = ["__starts", "__ends", "__pages", "__genres"]
+
+    def __init__(self, sessions: np.ndarray):
+        """
+        :param sessions: Array of rows (start epoch seconds, end epoch seconds, pages read, genre id or NO_GENRE)
+        """
+        sessions = np.asarray(sessions, dtype=np.int64).reshape(-1, 4)
+
+        self.__starts = sessions[:, 0]
+        self.__ends = sessions[:, 1]
+        self.__pages = sessions[:, 2]
+        self.__genres = sessions[:, 3]
+
+    def genre_ids(self) -> list[int]:
+        """
+        :return: Ids of the genres read, to look up their names
+        """
+        return [int(genreid) for genreid in np.unique(self.__genres) if genreid != NO_GENRE]
+
+    @staticmethod
+    def __runs(days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find runs of consecutive days
+
+        :param days: Sorted unique day numbers
+        :return: Arrays of the first day and the length of every run
+        """
+        breaks = np.flatnonzero(np.diff(days) != 1) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(days)]))
+
+        return days[starts], ends - starts
+
+    def summary(self, genre_names: dict[int, str], today: np.datetime64) -> dict:
+        """
+        :param genre_names: Genre id -> name
+        :param today: Current date, ends the current streak and the rolling windows
+        :return: Dict of metric name -> value, dates as datetime64 days
+        """
+        sessions = len(self.__starts)
+        pages = int(self.__pages.sum())
+
+        stats = {
+            "sessions": sessions,
+            "pages": pages,
+        }
+
+        if sessions == 0:
+            return stats
+
+        today = int(np.datetime64(today, "D").astype(np.int64))
+        days = self.__starts // SECONDS_PER_DAY
+        first_day = int(days.min())
+        last_day = max(int(days.max()), today)
+
+        # Pages read on every day from the first session until today
+        daily = np.bincount(days - first_day, weights=self.__pages, minlength=last_day - first_day + 1)
+        active_days = np.flatnonzero(np.bincount(days - first_day)) + first_day
+
+        run_starts, run_lengths = self.__runs(active_days)
+        longest = int(np.argmax(run_lengths))
+        run_ends = run_starts + run_lengths - 1
+
+        # A streak is still running if it reached today or yesterday
+        current = int(run_lengths[-1]) if run_ends[-1] >= today - 1 else 0
+
+        cumulative = np.concatenate(([0], np.cumsum(daily)))
+        week = cumulative[WEEK:] - cumulative[:-WEEK] if len(daily) >= WEEK else cumulative[-1:]
+        best_day = int(np.argmax(daily))
+
+        durations = (self.__ends - self.__starts) / 60
+
+        stats.update({
+            "first_read": np.datetime64(first_day, "D"),
+            "last_read": np.datetime64(int(days.max()), "D"),
+            "days_active": len(active_days),
+            "pages_per_day": pages / len(daily),
+            "pages_per_active_day": pages / len(active_days),
+            "average_session_minutes": float(durations.mean()),
+            "average_session_pages": pages / sessions,
+            "best_day": (np.datetime64(first_day + best_day, "D"), int(daily[best_day])),
+            "best_week_pages": int(week.max()),
+            "last_week_pages": int(daily[-WEEK:].sum()),
+            "last_month_pages": int(daily[-MONTH:].sum()),
+            "longest_streak": (int(run_lengths[longest]), np.datetime64(int(run_starts[longest]), "D"),
+                               np.datetime64(int(run_ends[longest]), "D")),
+            "current_streak": current,
+        })
+
+        # Pages per month and genre in one bincount over the combined index
+        months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        first_month = int(months.min())
+        genre_ids, genre_index = np.unique(self.__genres, return_inverse=True)
+        num_months = int(months.max()) - first_month + 1
+
+        by_month = np.bincount((months - first_month) * len(genre_ids) + genre_index, weights=self.__pages,
+                               minlength=num_months * len(genre_ids)).reshape(num_months, len(genre_ids))
+
+        # Books without a genre never count as a favourite
+        by_month[:, genre_ids == NO_GENRE] = -1
+
+        totals = by_month.sum(axis=0)
+        favourites = [column for column in np.argsort(-totals, kind="stable")[:TOP_GENRES]
+                      if genre_ids[column] != NO_GENRE and totals[column] > 0]
+
+        stats["favourite_genres"] = [
+            (genre_names.get(int(genre_ids[column]), str(genre_ids[column])), int(totals[column]))
+            for column in favourites
+        ]
+
+        top = np.argmax(by_month, axis=1)
+        top_pages = by_month[np.arange(num_months), top]
+        read_months = np.flatnonzero(top_pages > 0)
+
+        stats["genres_by_month"] = [
+            (np.datetime64(first_month + int(month), "M"), genre_names.get(int(genre_ids[top[month]]), str(genre_ids[top[month]])),
+             int(top_pages[month]))
+            for month in read_months
+        ]
+
+        return stats
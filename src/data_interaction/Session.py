@@ -0,0 +1,56 @@
+import functools
+import inspect
+
+
+class Session:
+    """
+    Identity and per-session state of one user of a DataInteraction
+    -- Many sessions share the DataInteraction's pooled connections, a session is only used by one thread at a time
+    """
+    __slots__ = ["username", "collection_ids"]
+
+    def __init__(self, username: str = None):
+        """
+        :param username: Logged in user, None if nobody is logged in
+        """
+        self.username = username
+        # Collection name -> collectionid of the user's collections looked up so far
+        self.collection_ids = dict()
+
+    def reset(self, username: str = None) -> None:
+        """
+        Switch the session to another user, dropping the state of the previous one
+        """
+        self.username = username
+        self.collection_ids.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _takes_session(function) -> bool:
+    return "session" in inspect.signature(function).parameters
+
+
+class BoundDataInteraction:
+    """
+    A DataInteraction with one session filled in for every method taking a session
+    -- Lets code written for a single user, like Interface, run once per session over a shared DataInteraction
+    """
+    __slots__ = ["database", "session"]
+
+    def __init__(self, database, session: Session):
+        self.database = database
+        self.session = session
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.database, name)
+
+        if callable(attribute) and _takes_session(attribute.__func__ if hasattr(attribute, "__func__") else attribute):
+            return functools.partial(attribute, session=self.session)
+
+        return attribute
+
+    def shutdown(self) -> None:
+        """
+        Ends the session only, the shared DataInteraction stays open
+        """
+        self.session.reset()
@@ -0,0 +1,172 @@
+import json
+import os
+import socket
+import threading
+
+from sshtunnel import SSHTunnelForwarder
+
+# Defaults are the course database
+DEFAULT_SSH_HOST = "starbug.cs.rit.edu"
+SSH_PORT = 22
+DEFAULT_SQL_HOST = "127.0.0.1"
+DEFAULT_SQL_PORT = 5432
+
+# Seconds between keepalive messages on the SSH transport
+SSH_KEEPALIVE = 15
+
+# File a tunnel daemon publishes its local address in for the other processes on this host
+TUNNEL_FILENAME = "../tunnel.json"
+
+# Seconds to wait for a published tunnel to accept a connection
+PROBE_TIMEOUT = 1.0
+
+
+def tunnel_settings(credentials: dict) -> dict:
+    """
+    :param credentials: Loaded config file
+    :return: Keyword arguments of TunnelManager.acquire
+    """
+    return {
+        "ssh_address": (credentials.get("ssh_host", DEFAULT_SSH_HOST), SSH_PORT),
+        "username": credentials["username"],
+        "password": credentials["password"],
+        "remote_address": (credentials.get("sql_host", DEFAULT_SQL_HOST), credentials.get("sql_port", DEFAULT_SQL_PORT)),
+        "compression": credentials.get("ssh_compression", False)
+    }
+
+
+def publish(tunnel: SSHTunnelForwarder, settings: dict, filename: str = TUNNEL_FILENAME) -> None:
+    """
+    Advertise a tunnel's local address so other processes connect through it instead of opening their own
+    """
+    with open(filename, "w") as file:
+        json.dump({
+            "pid": os.getpid(),
+            "ssh_address": list(settings["ssh_address"]),
+            "username": settings["username"],
+            "remote_address": list(settings["remote_address"]),
+            "local_address": [tunnel.local_bind_host, tunnel.local_bind_port]
+        }, file)
+
+
+def unpublish(filename: str = TUNNEL_FILENAME) -> None:
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def find_published(settings: dict, filename: str = TUNNEL_FILENAME) -> tuple[str, int] | None:
+    """
+    Look for a tunnel daemon on this host carrying connections to the same database
+
+    :param settings: Tunnel settings from tunnel_settings
+    :param filename: File the daemon publishes its address in
+    :return: tuple(host, port) of the daemon's tunnel or None if there is no live one
+    """
+    try:
+        with open(filename, "r") as file:
+            published = json.load(file)
+
+        if (published["ssh_address"] != list(settings["ssh_address"]) or published["username"] != settings["username"]
+                or published["remote_address"] != list(settings["remote_address"])):
+            return None
+
+        host, port = published["local_address"]
+
+        # A daemon that died leaves its file behind
+        socket.create_connection((host, port), PROBE_TIMEOUT).close()
+
+        return host, port
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class TunnelManager:
+    """
+    SSH tunnels shared by every DataInteraction of the process, one authenticated transport per gateway, user and
+    database
+    -- Tunnels listen on an ephemeral local port, so any number of processes can connect from one host
+    -- Every database connection is a channel multiplexed over the tunnel's transport, no new SSH handshake
+    -- Tunnels are reference counted and closed when their last user releases them
+    """
+    __slots__ = ["__tunnels", "__users", "__lock"]
+
+    def __init__(self):
+        # tuple(ssh address, username, remote address, compression) -> tunnel
+        self.__tunnels = {}
+        # Same key -> number of users of the tunnel
+        self.__users = {}
+        # Also serializes restarts so concurrent callers restart a dropped tunnel once
+        self.__lock = threading.Lock()
+
+    def acquire(self, ssh_address: tuple[str, int], username: str, password: str, remote_address: tuple[str, int],
+                compression: bool = False) -> SSHTunnelForwarder:
+        """
+        Get the tunnel to a database, starting it if no one uses it yet
+
+        :param ssh_address: tuple(host, port) of the SSH gateway
+        :param username: SSH username
+        :param password: SSH password
+        :param remote_address: tuple(host, port) of the database as seen from the gateway
+        :param compression: If the transport compresses traffic, pays off for large result transfers on slow links
+        :return: Started tunnel, give it back with release
+        """
+        key = (tuple(ssh_address), username, tuple(remote_address), compression)
+
+        with self.__lock:
+            tunnel = self.__tunnels.get(key)
+
+            if tunnel is None:
+                tunnel = SSHTunnelForwarder(
+                    tuple(ssh_address),
+                    ssh_username = username,
+                    ssh_password = password,
+                    remote_bind_address = tuple(remote_address),
+                    local_bind_address = ("127.0.0.1", 0),
+                    set_keepalive = SSH_KEEPALIVE,
+                    compression = compression
+                )
+
+                tunnel.start()
+
+                self.__tunnels[key] = tunnel
+                self.__users[key] = 0
+
+            self.__users[key] += 1
+
+        return tunnel
+
+    def ensure_active(self, tunnel: SSHTunnelForwarder) -> None:
+        """
+        Restart a tunnel if its transport is down
+        -- The local port may change, read it from the tunnel after calling this
+        """
+        with self.__lock:
+            if not tunnel.is_active:
+                tunnel.restart()
+
+    def release(self, tunnel: SSHTunnelForwarder) -> None:
+        """
+        Give back a tunnel from acquire, stopping it once no one uses it
+        """
+        with self.__lock:
+            for key, shared in self.__tunnels.items():
+                if shared is tunnel:
+                    break
+            else:
+                return
+
+            self.__users[key] -= 1
+
+            if self.__users[key] > 0:
+                return
+
+            del self.__tunnels[key]
+            del self.__users[key]
+
+        tunnel.close()
+
+
+# Tunnels of this process
+TUNNELS = TunnelManager()
@@ -0,0 +1,511 @@
+"""
+Schema additions on top of the base BadReads tables
+-- Every statement is idempotent so the migrations can be rerun at any time
+"""
+
+from data_interaction.GenreTree import NORMALIZE_SQL
+
+# Followees with more followers than this are not fanned out on write, their reads are merged on read
+FAN_OUT_FOLLOWER_LIMIT = 5000
+
+FOLLOWING_FEED = """
+    CREATE TABLE IF NOT EXISTS following_feed
+    (
+        username VARCHAR NOT NULL,
+        isbn VARCHAR NOT NULL,
+        pages BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, isbn)
+    );
+
+    CREATE INDEX IF NOT EXISTS following_feed_ranked ON following_feed (username, pages DESC);
+
+    CREATE TABLE IF NOT EXISTS feed_celebrities
+    (
+        username VARCHAR PRIMARY KEY
+    );
+
+    CREATE OR REPLACE FUNCTION following_feed_on_read() RETURNS trigger AS $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM feed_celebrities WHERE username = NEW.username) THEN
+            INSERT INTO following_feed (username, isbn, pages)
+            SELECT followerusername, NEW.isbn, NEW.endpage - NEW.startpage
+            FROM follows
+            WHERE followeeusername = NEW.username
+            ON CONFLICT (username, isbn) DO UPDATE SET pages = following_feed.pages + EXCLUDED.pages;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION following_feed_on_follow() RETURNS trigger AS $$
+    DECLARE
+        followee VARCHAR;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            followee := NEW.followeeusername;
+        ELSE
+            followee := OLD.followeeusername;
+        END IF;
+
+        IF EXISTS (SELECT 1 FROM feed_celebrities WHERE username = followee) THEN
+            RETURN NULL;
+        END IF;
+
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO following_feed (username, isbn, pages)
+            SELECT NEW.followerusername, isbn, SUM(endpage - startpage)
+            FROM reads
+            WHERE username = NEW.followeeusername
+            GROUP BY isbn
+            ON CONFLICT (username, isbn) DO UPDATE SET pages = following_feed.pages + EXCLUDED.pages;
+        ELSE
+            UPDATE following_feed SET pages = following_feed.pages - followee_reads.pages
+            FROM
+                (
+                    SELECT isbn, SUM(endpage - startpage) AS pages
+                    FROM reads
+                    WHERE username = OLD.followeeusername
+                    GROUP BY isbn
+                ) AS followee_reads
+            WHERE following_feed.username = OLD.followerusername
+                AND following_feed.isbn = followee_reads.isbn;
+
+            DELETE FROM following_feed
+            WHERE username = OLD.followerusername AND pages <= 0
+                AND NOT EXISTS
+                    (
+                        SELECT 1
+                        FROM reads
+                        JOIN follows ON reads.username = follows.followeeusername
+                        WHERE follows.followerusername = OLD.followerusername
+                            AND reads.isbn = following_feed.isbn
+                    );
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS following_feed_reads ON reads;
+    CREATE TRIGGER following_feed_reads AFTER INSERT ON reads
+        FOR EACH ROW EXECUTE FUNCTION following_feed_on_read();
+
+    DROP TRIGGER IF EXISTS following_feed_follows ON follows;
+    CREATE TRIGGER following_feed_follows AFTER INSERT OR DELETE ON follows
+        FOR EACH ROW EXECUTE FUNCTION following_feed_on_follow();
+"""
+
+# Bulk job: recompute which accounts are too popular to fan out, then rebuild every feed
+REBUILD_FOLLOWING_FEED = f"""
+    BEGIN;
+
+    TRUNCATE feed_celebrities;
+
+    INSERT INTO feed_celebrities (username)
+    SELECT followeeusername
+    FROM follows
+    GROUP BY followeeusername
+    HAVING COUNT(*) > {FAN_OUT_FOLLOWER_LIMIT};
+
+    TRUNCATE following_feed;
+
+    INSERT INTO following_feed (username, isbn, pages)
+    SELECT follows.followerusername, reads.isbn, SUM(reads.endpage - reads.startpage)
+    FROM
+        reads
+    JOIN
+        follows ON reads.username = follows.followeeusername
+    WHERE
+        NOT EXISTS (SELECT 1 FROM feed_celebrities WHERE feed_celebrities.username = follows.followeeusername)
+    GROUP BY
+        follows.followerusername, reads.isbn;
+
+    COMMIT;
+"""
+
+# Channel the change triggers publish cache invalidation tags on
+CHANGES_CHANNEL = "badreads_changes"
+
+CHANGE_NOTIFICATIONS = f"""
+    CREATE OR REPLACE FUNCTION notify_badreads_change() RETURNS trigger AS $$
+    DECLARE
+        changed RECORD;
+        tags JSONB;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD;
+        ELSE
+            changed := NEW;
+        END IF;
+
+        IF TG_TABLE_NAME = 'rates' THEN
+            tags := JSONB_BUILD_ARRAY(JSONB_BUILD_ARRAY('isbn', changed.isbn), JSONB_BUILD_ARRAY('user', changed.username));
+        ELSIF TG_TABLE_NAME = 'reads' THEN
+            tags := JSONB_BUILD_ARRAY(JSONB_BUILD_ARRAY('user', changed.username));
+        ELSIF TG_TABLE_NAME = 'creates' THEN
+            tags := JSONB_BUILD_ARRAY(JSONB_BUILD_ARRAY('collections', changed.username));
+        ELSIF TG_TABLE_NAME IN ('belongs_to', 'collections') THEN
+            SELECT COALESCE(JSONB_AGG(JSONB_BUILD_ARRAY('collections', username)), '[]')
+            INTO tags
+            FROM creates
+            WHERE collectionid = changed.collectionid;
+        ELSIF TG_TABLE_NAME = 'follows' THEN
+            tags := JSONB_BUILD_ARRAY(JSONB_BUILD_ARRAY('user', changed.followerusername),
+                                      JSONB_BUILD_ARRAY('user', changed.followeeusername));
+        ELSIF TG_TABLE_NAME = 'catalog_log' THEN
+            -- Every catalog change is logged, so cached books are invalidated like local catalogs are synced
+            tags := JSONB_BUILD_ARRAY(JSONB_BUILD_ARRAY('isbn', changed.isbn));
+        END IF;
+
+        -- Identical payloads within a transaction are delivered once
+        PERFORM pg_notify('{CHANGES_CHANNEL}', tags::TEXT);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS notify_rates ON rates;
+    CREATE TRIGGER notify_rates AFTER INSERT OR UPDATE OR DELETE ON rates
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+
+    DROP TRIGGER IF EXISTS notify_reads ON reads;
+    CREATE TRIGGER notify_reads AFTER INSERT OR UPDATE OR DELETE ON reads
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+
+    DROP TRIGGER IF EXISTS notify_creates ON creates;
+    CREATE TRIGGER notify_creates AFTER INSERT OR UPDATE OR DELETE ON creates
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+
+    DROP TRIGGER IF EXISTS notify_belongs_to ON belongs_to;
+    CREATE TRIGGER notify_belongs_to AFTER INSERT OR UPDATE OR DELETE ON belongs_to
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+
+    DROP TRIGGER IF EXISTS notify_collections ON collections;
+    CREATE TRIGGER notify_collections AFTER UPDATE ON collections
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+
+    DROP TRIGGER IF EXISTS notify_follows ON follows;
+    CREATE TRIGGER notify_follows AFTER INSERT OR UPDATE OR DELETE ON follows
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+"""
+
+# Age after which catalog_log entries are pruned, replicas synced longer ago than this copy the whole catalog again
+CATALOG_LOG_RETENTION = "7 days"
+
+# Changes are synced by the id of the transaction that logged them, sequences are handed out before commit so a
+# lower one can become visible after a higher one was already synced
+CATALOG_LOG = """
+    CREATE TABLE IF NOT EXISTS catalog_log
+    (
+        sequence BIGSERIAL PRIMARY KEY,
+        isbn VARCHAR NOT NULL,
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        xid BIGINT NOT NULL DEFAULT txid_current()
+    );
+
+    CREATE INDEX IF NOT EXISTS catalog_log_xid ON catalog_log (xid);
+
+    -- Newest transaction id of the pruned entries
+    CREATE TABLE IF NOT EXISTS catalog_log_horizon
+    (
+        id INT PRIMARY KEY CHECK (id = 0),
+        xid BIGINT NOT NULL
+    );
+
+    CREATE OR REPLACE FUNCTION log_catalog_change() RETURNS trigger AS $$
+    DECLARE
+        changed RECORD;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD;
+        ELSE
+            changed := NEW;
+        END IF;
+
+        IF TG_TABLE_NAME IN ('book', 'authors', 'publishes', 'category') THEN
+            INSERT INTO catalog_log (isbn) VALUES (changed.isbn);
+
+            IF TG_OP = 'UPDATE' AND OLD.isbn <> NEW.isbn THEN
+                INSERT INTO catalog_log (isbn) VALUES (OLD.isbn);
+            END IF;
+        ELSIF TG_TABLE_NAME = 'contributor' THEN
+            INSERT INTO catalog_log (isbn)
+            SELECT isbn FROM authors WHERE contributorid = changed.contributorid
+            UNION
+            SELECT isbn FROM publishes WHERE contributorid = changed.contributorid;
+        ELSIF TG_TABLE_NAME = 'genre' THEN
+            INSERT INTO catalog_log (isbn)
+            SELECT isbn FROM category WHERE genreid = changed.genreid;
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS log_book ON book;
+    CREATE TRIGGER log_book AFTER INSERT OR UPDATE OR DELETE ON book
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS log_authors ON authors;
+    CREATE TRIGGER log_authors AFTER INSERT OR UPDATE OR DELETE ON authors
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS log_publishes ON publishes;
+    CREATE TRIGGER log_publishes AFTER INSERT OR UPDATE OR DELETE ON publishes
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS log_category ON category;
+    CREATE TRIGGER log_category AFTER INSERT OR UPDATE OR DELETE ON category
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS log_contributor ON contributor;
+    CREATE TRIGGER log_contributor AFTER UPDATE ON contributor
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS log_genre ON genre;
+    CREATE TRIGGER log_genre AFTER UPDATE ON genre
+        FOR EACH ROW EXECUTE FUNCTION log_catalog_change();
+
+    DROP TRIGGER IF EXISTS notify_catalog_log ON catalog_log;
+    CREATE TRIGGER notify_catalog_log AFTER INSERT ON catalog_log
+        FOR EACH ROW EXECUTE FUNCTION notify_badreads_change();
+"""
+
+# Bulk job: drop catalog_log entries older than CATALOG_LOG_RETENTION, remembering how far the log was pruned
+PRUNE_CATALOG_LOG = f"""
+    WITH pruned AS
+    (
+        DELETE FROM catalog_log
+        WHERE changed_at < CURRENT_TIMESTAMP - INTERVAL '{CATALOG_LOG_RETENTION}'
+        RETURNING xid
+    )
+    INSERT INTO catalog_log_horizon (id, xid)
+    SELECT 0, MAX(xid) FROM pruned HAVING COUNT(*) > 0
+    ON CONFLICT (id) DO UPDATE SET xid = GREATEST(catalog_log_horizon.xid, EXCLUDED.xid);
+"""
+
+# Ancestor/descendant pairs of genre_closure: every genre is an ancestor of itself, its "user"/spacing variants
+# and every genre whose normalized path extends its own, e.g. "Academic" -> "Academic-College user"
+# -- {condition} narrows the pairs, e.g. to the ones of a single genre
+GENRE_CLOSURE_PAIRS = f"""
+    WITH normalized AS
+    (
+        SELECT genreid, {NORMALIZE_SQL.format(column="name")} AS path
+        FROM genre
+    )
+    SELECT
+        ancestor.genreid,
+        descendant.genreid,
+        (LENGTH(descendant.path) - LENGTH(REPLACE(descendant.path, '-', '')))
+            - (LENGTH(ancestor.path) - LENGTH(REPLACE(ancestor.path, '-', '')))
+    FROM
+        normalized AS ancestor
+    JOIN
+        normalized AS descendant
+            ON descendant.path = ancestor.path
+            OR LEFT(descendant.path, LENGTH(ancestor.path) + 1) = ancestor.path || '-'
+    WHERE
+        ancestor.path <> ''
+        AND ({{condition}})
+"""
+
+# Filled in bulk by REBUILD_GENRE_CLOSURE, genres added, renamed or deleted afterwards are kept up to date by a trigger
+GENRE_CLOSURE = f"""
+    CREATE TABLE IF NOT EXISTS genre_closure
+    (
+        ancestorid INT NOT NULL,
+        descendantid INT NOT NULL,
+        depth INT NOT NULL,
+        PRIMARY KEY (ancestorid, descendantid)
+    );
+
+    CREATE INDEX IF NOT EXISTS genre_closure_descendant ON genre_closure (descendantid);
+
+    CREATE OR REPLACE FUNCTION genre_closure_on_genre() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            DELETE FROM genre_closure WHERE ancestorid = OLD.genreid OR descendantid = OLD.genreid;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO genre_closure (ancestorid, descendantid, depth)
+            {GENRE_CLOSURE_PAIRS.format(condition="ancestor.genreid = NEW.genreid OR descendant.genreid = NEW.genreid")}
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS genre_closure_genre ON genre;
+    CREATE TRIGGER genre_closure_genre AFTER INSERT OR UPDATE OF name OR DELETE ON genre
+        FOR EACH ROW EXECUTE FUNCTION genre_closure_on_genre();
+"""
+
+# Bulk job: rebuild the whole closure
+REBUILD_GENRE_CLOSURE = f"""
+    BEGIN;
+
+    TRUNCATE genre_closure;
+
+    INSERT INTO genre_closure (ancestorid, descendantid, depth)
+    {GENRE_CLOSURE_PAIRS.format(condition="TRUE")};
+
+    COMMIT;
+"""
+
+# Indexes the per-user, per-book and recent activity queries rely on instead of scanning the large tables
+QUERY_INDEXES = """
+    CREATE INDEX IF NOT EXISTS reads_username_isbn ON reads (username, isbn);
+    CREATE INDEX IF NOT EXISTS reads_isbn ON reads (isbn);
+    CREATE INDEX IF NOT EXISTS reads_starttime ON reads (starttime);
+    CREATE INDEX IF NOT EXISTS rates_isbn ON rates (isbn);
+    CREATE INDEX IF NOT EXISTS follows_followee ON follows (followeeusername);
+    CREATE INDEX IF NOT EXISTS belongs_to_isbn ON belongs_to (isbn);
+"""
+
+# Per-collection counters kept current by triggers so listing collections needs no aggregation
+COLLECTION_COUNTERS = """
+    ALTER TABLE collections ADD COLUMN IF NOT EXISTS book_count INT NOT NULL DEFAULT 0;
+    ALTER TABLE collections ADD COLUMN IF NOT EXISTS total_pages BIGINT NOT NULL DEFAULT 0;
+
+    CREATE OR REPLACE FUNCTION collection_counters_on_contents() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE collections
+            SET book_count = book_count - 1,
+                total_pages = total_pages - COALESCE((SELECT length FROM book WHERE isbn = OLD.isbn), 0)
+            WHERE collectionid = OLD.collectionid;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE collections
+            SET book_count = book_count + 1,
+                total_pages = total_pages + COALESCE((SELECT length FROM book WHERE isbn = NEW.isbn), 0)
+            WHERE collectionid = NEW.collectionid;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION collection_counters_on_length() RETURNS trigger AS $$
+    BEGIN
+        UPDATE collections
+        SET total_pages = total_pages + COALESCE(NEW.length, 0) - COALESCE(OLD.length, 0)
+        WHERE collectionid IN (SELECT collectionid FROM belongs_to WHERE isbn = NEW.isbn);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS collection_counters_belongs_to ON belongs_to;
+    CREATE TRIGGER collection_counters_belongs_to AFTER INSERT OR UPDATE OR DELETE ON belongs_to
+        FOR EACH ROW EXECUTE FUNCTION collection_counters_on_contents();
+
+    DROP TRIGGER IF EXISTS collection_counters_book ON book;
+    CREATE TRIGGER collection_counters_book AFTER UPDATE OF length ON book
+        FOR EACH ROW WHEN (OLD.length IS DISTINCT FROM NEW.length) EXECUTE FUNCTION collection_counters_on_length();
+"""
+
+# Bulk job: recount every collection, only rows whose counters drifted are written
+REBUILD_COLLECTION_COUNTERS = """
+    UPDATE collections
+    SET book_count = counts.book_count, total_pages = counts.total_pages
+    FROM
+        (
+            SELECT collections.collectionid, COUNT(belongs_to.isbn) AS book_count,
+                COALESCE(SUM(book.length), 0) AS total_pages
+            FROM
+                collections
+            LEFT JOIN
+                belongs_to ON collections.collectionid = belongs_to.collectionid
+            LEFT JOIN
+                book ON book.isbn = belongs_to.isbn
+            GROUP BY
+                collections.collectionid
+        ) AS counts
+    WHERE
+        collections.collectionid = counts.collectionid
+        AND (collections.book_count, collections.total_pages) IS DISTINCT FROM (counts.book_count, counts.total_pages);
+"""
+
+# Pages read and follow counts of every user, kept up to date by triggers on reads and follows
+USER_COUNTERS = """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS pages_read BIGINT NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS follower_count INT NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS following_count INT NOT NULL DEFAULT 0;
+
+    CREATE OR REPLACE FUNCTION user_counters_on_reads() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE users
+            SET pages_read = pages_read - COALESCE(OLD.endpage - OLD.startpage, 0)
+            WHERE username = OLD.username;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE users
+            SET pages_read = pages_read + COALESCE(NEW.endpage - NEW.startpage, 0)
+            WHERE username = NEW.username;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION user_counters_on_follows() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE users SET follower_count = follower_count - 1 WHERE username = OLD.followeeusername;
+            UPDATE users SET following_count = following_count - 1 WHERE username = OLD.followerusername;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE users SET follower_count = follower_count + 1 WHERE username = NEW.followeeusername;
+            UPDATE users SET following_count = following_count + 1 WHERE username = NEW.followerusername;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS user_counters_reads ON reads;
+    CREATE TRIGGER user_counters_reads AFTER INSERT OR UPDATE OR DELETE ON reads
+        FOR EACH ROW EXECUTE FUNCTION user_counters_on_reads();
+
+    DROP TRIGGER IF EXISTS user_counters_follows ON follows;
+    CREATE TRIGGER user_counters_follows AFTER INSERT OR UPDATE OR DELETE ON follows
+        FOR EACH ROW EXECUTE FUNCTION user_counters_on_follows();
+"""
+
+# Bulk job: recount every user, only rows whose counters drifted are written
+REBUILD_USER_COUNTERS = """
+    UPDATE users
+    SET pages_read = counts.pages_read, follower_count = counts.follower_count,
+        following_count = counts.following_count
+    FROM
+        (
+            SELECT users.username, COALESCE(pages.pages_read, 0) AS pages_read,
+                COALESCE(followers.follower_count, 0) AS follower_count,
+                COALESCE(following.following_count, 0) AS following_count
+            FROM
+                users
+            LEFT JOIN
+                (SELECT username, SUM(endpage - startpage) AS pages_read FROM reads GROUP BY username) AS pages
+                ON pages.username = users.username
+            LEFT JOIN
+                (SELECT followeeusername, COUNT(*) AS follower_count FROM follows GROUP BY followeeusername) AS followers
+                ON followers.followeeusername = users.username
+            LEFT JOIN
+                (SELECT followerusername, COUNT(*) AS following_count FROM follows GROUP BY followerusername) AS following
+                ON following.followerusername = users.username
+        ) AS counts
+    WHERE
+        users.username = counts.username
+        AND (users.pages_read, users.follower_count, users.following_count)
+            IS DISTINCT FROM (counts.pages_read, counts.follower_count, counts.following_count);
+"""
+
+MIGRATIONS = (
+    ("following_feed", FOLLOWING_FEED),
+    ("change_notifications", CHANGE_NOTIFICATIONS),
+    ("catalog_log", CATALOG_LOG),
+    ("genre_closure", GENRE_CLOSURE),
+    ("query_indexes", QUERY_INDEXES),
+    ("collection_counters", COLLECTION_COUNTERS),
+    ("user_counters", USER_COUNTERS),
+)
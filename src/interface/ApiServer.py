@@ -0,0 +1,301 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import json
+import re
+import secrets
+import threading
+import time
+
+from data_interaction.BookResultSet import json_default
+from data_interaction.DataInteraction import DataInteraction, SortOptions, SearchMethods, CollectionOperations
+from data_interaction.Session import Session, BoundDataInteraction
+from interface.Interface import Interface
+
+# Seconds a session token stays valid after its last request
+SESSION_TTL = 3600
+
+# Seconds an idle keep-alive connection may hold a worker thread before it is closed
+KEEP_ALIVE_TIMEOUT = 5
+
+SEARCH_METHODS = {
+    "name": SearchMethods.BOOK_NAME,
+    "release_date": SearchMethods.RELEASE_DATE,
+    "author": SearchMethods.AUTHOR,
+    "publisher": SearchMethods.PUBLISHER,
+    "genre": SearchMethods.GENRE,
+}
+
+COLLECTION_OPERATIONS = {
+    "union": CollectionOperations.UNION,
+    "intersect": CollectionOperations.INTERSECT,
+    "difference": CollectionOperations.DIFFERENCE,
+}
+
+SORT_OPTIONS = {
+    "name": SortOptions.BOOK_NAME,
+    "publisher": SortOptions.PUBLISHER,
+    "genre": SortOptions.GENRE,
+    "release_year": SortOptions.RELEASED_YEAR,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class SessionStore:
+    """
+    Sessions of logged in API users by token
+    -- Expired sessions are dropped on lookup and swept whenever a session is created
+    """
+    __slots__ = ["__sessions", "__lock", "__ttl"]
+
+    def __init__(self, ttl: float = SESSION_TTL):
+        # token -> list[Session, last used time], least recently used first
+        self.__sessions = dict()
+        self.__lock = threading.Lock()
+        self.__ttl = ttl
+
+    def create(self, session: Session) -> str:
+        """
+        :param session: Session of an authenticated user
+        :return: New session token
+        """
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+
+        with self.__lock:
+            # Sessions are ordered by last use, so the sweep stops at the first one still alive
+            expired = []
+
+            for old_token, entry in self.__sessions.items():
+                if now - entry[1] <= self.__ttl:
+                    break
+
+                expired.append(old_token)
+
+            for old_token in expired:
+                del self.__sessions[old_token]
+
+            self.__sessions[token] = [session, now]
+
+        return token
+
+    def get(self, token: str) -> Session | None:
+        """
+        Look up a token and extend its lifetime
+
+        :param token: Session token
+        :return: Session or None if unknown or expired
+        """
+        now = time.monotonic()
+
+        with self.__lock:
+            entry = self.__sessions.get(token)
+
+            if entry is None:
+                return None
+
+            if now - entry[1] > self.__ttl:
+                del self.__sessions[token]
+                return None
+
+            entry[1] = now
+            # Keep the order by last use for the sweep in create
+            del self.__sessions[token]
+            self.__sessions[token] = entry
+
+            return entry[0]
+
+    def remove(self, token: str) -> bool:
+        with self.__lock:
+            return self.__sessions.pop(token, None) is not None
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive clients would otherwise hold their worker forever and starve the fixed pool
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def do_GET(self):
+        self.server.dispatch(self)
+
+    def do_POST(self):
+        self.server.dispatch(self)
+
+    def do_PUT(self):
+        self.server.dispatch(self)
+
+    def do_PATCH(self):
+        self.server.dispatch(self)
+
+    def do_DELETE(self):
+        self.server.dispatch(self)
+
+    def send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, default=json_default).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ApiServer(HTTPServer):
+    """
+    HTTP/JSON API over the Interface operations for many concurrent users
+    -- Requests are handled by a fixed pool of worker threads sharing the DataInteraction's pooled connections
+    -- Users log in for a token sent as "Authorization: Bearer <token>", each token has its own Session
+    """
+
+    def __init__(self, address: tuple[str, int], database: DataInteraction, workers: int = 32):
+        super().__init__(address, ApiRequestHandler)
+
+        self.database = database
+        self.sessions = SessionStore()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Tuples of HTTP method, path pattern, function(database bound to the session, arguments), if login is required
+        self.routes = tuple((method, re.compile(pattern), function, login_required) for method, pattern, function, login_required in (
+            ("POST", r"/login", self.__login, False),
+            ("POST", r"/logout", self.__logout, True),
+            ("POST", r"/accounts", self.__create_account, False),
+            ("GET", r"/books/search", self.__search_books, True),
+            ("GET", r"/books/(?P<isbn>[^/]+)", lambda db, args: db.get_book_by_isbn(args["isbn"]), True),
+            ("GET", r"/books/(?P<isbn>[^/]+)/similar", lambda db, args: db.get_similar_books(args["isbn"], int(args.get("limit", 10))), True),
+            ("PUT", r"/books/(?P<isbn>[^/]+)/rating", lambda db, args: db.rate_book(args["isbn"], int(args["rating"])), True),
+            ("POST", r"/books/(?P<isbn>[^/]+)/reads", lambda db, args: db.read_book_by_isbn(args["isbn"], int(args["start_page"]), int(args["end_page"])), True),
+            ("GET", r"/collections", lambda db, args: db.list_collections(), True),
+            ("POST", r"/collections", lambda db, args: db.create_collection(args["name"], args.get("isbns", [])), True),
+            ("POST", r"/collections/combined", lambda db, args: db.combine_collections(COLLECTION_OPERATIONS[args["operation"]], args["collections"], args["name"]), True),
+            ("GET", r"/collections/(?P<name>[^/]+)", lambda db, args: db.get_collection_contents(args["name"]), True),
+            ("PATCH", r"/collections/(?P<name>[^/]+)", lambda db, args: db.rename_collection(args["name"], args["new_name"]), True),
+            ("DELETE", r"/collections/(?P<name>[^/]+)", lambda db, args: db.delete_collection(args["name"]), True),
+            ("POST", r"/collections/(?P<name>[^/]+)/books", lambda db, args: db.add_books_to_collection(args["name"], args["isbns"]), True),
+            ("DELETE", r"/collections/(?P<name>[^/]+)/books", lambda db, args: db.remove_books_from_collection(args["name"], args["isbns"]), True),
+            ("POST", r"/collections/(?P<name>[^/]+)/reads", lambda db, args: db.read_random_book_by_collection(args["name"], int(args["start_page"]), int(args["end_page"])), True),
+            ("POST", r"/collections/(?P<name>[^/]+)/reads/random", lambda db, args: db.read_random_books_by_collection(args["name"], int(args["count"]), int(args["start_page"]), int(args["end_page"])), True),
+            ("GET", r"/users", lambda db, args: db.search_for_users(args["email"]), True),
+            ("GET", r"/users/(?P<username>[^/]+)", lambda db, args: db.get_profile_summary(args["username"]), False),
+            ("GET", r"/stats/reading", lambda db, args: db.get_reading_stats(), True),
+            ("POST", r"/users/(?P<username>[^/]+)/collections/(?P<collection>[^/]+)/clone", lambda db, args: db.clone_collection(args["username"], args["collection"], args.get("name")), True),
+            ("GET", r"/followers", lambda db, args: db.list_followers(), True),
+            ("GET", r"/following", lambda db, args: db.list_following(), True),
+            ("POST", r"/following", lambda db, args: db.follow_user(args["username"]), True),
+            ("DELETE", r"/following/(?P<username>[^/]+)", lambda db, args: db.unfollow_user(args["username"]), True),
+            ("GET", r"/suggestions", lambda db, args: db.suggest_follows(int(args.get("limit", 10))), True),
+            ("GET", r"/top/books", lambda db, args: db.get_top_recent_books(), True),
+            ("GET", r"/top/following", lambda db, args: db.get_top_following_books(), True),
+            ("GET", r"/top/new-releases", lambda db, args: db.get_top_new_releases(), True),
+            ("GET", r"/recommendations", lambda db, args: db.get_recommendations(), True),
+        ))
+
+    def __login(self, database: BoundDataInteraction, args: dict) -> dict:
+        if not database.login(args["username"], Interface.hash_password(args["password"])):
+            raise ApiError(401, "Incorrect password or user does not exist")
+
+        return {"token": self.sessions.create(database.session)}
+
+    def __logout(self, database: BoundDataInteraction, args: dict) -> bool:
+        database.logout()
+
+        return self.sessions.remove(args["token"])
+
+    def __create_account(self, database: BoundDataInteraction, args: dict) -> dict:
+        password = Interface.hash_password(args["password"])
+
+        if not database.create_account(args["username"], args["name"], args["email"], password):
+            raise ApiError(400, "Failed to create an account")
+
+        return {"token": self.sessions.create(database.session)}
+
+    @staticmethod
+    def __search_books(database: BoundDataInteraction, args: dict):
+        return database.search_for_book(
+            SEARCH_METHODS[args["method"]], args["value"], SORT_OPTIONS[args.get("sort", "name")],
+            args.get("order", "asc") == "asc"
+        )
+
+    def dispatch(self, handler: ApiRequestHandler) -> None:
+        """
+        Route a request, run it for the token's session and send the JSON response
+        """
+        url = urlparse(handler.path)
+        route = None
+        path_matched = False
+
+        for method, pattern, function, login_required in self.routes:
+            match = pattern.fullmatch(url.path)
+
+            if match is not None:
+                path_matched = True
+
+                if method == handler.command:
+                    route = (match, function, login_required)
+                    break
+
+        try:
+            if route is None:
+                raise ApiError(405, "Method not allowed") if path_matched else ApiError(404, "Unknown path")
+
+            match, function, login_required = route
+
+            args = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            length = int(handler.headers.get("Content-Length", 0))
+            if length != 0:
+                body = json.loads(handler.rfile.read(length))
+
+                if not isinstance(body, dict):
+                    raise ApiError(400, "Request body must be a JSON object")
+
+                args.update(body)
+
+            args.update((key, unquote(value)) for key, value in match.groupdict().items())
+
+            authorization = handler.headers.get("Authorization", "")
+            args["token"] = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+            session = self.sessions.get(args["token"]) if args["token"] else None
+
+            if login_required and session is None:
+                raise ApiError(401, "Must be logged in to a user account")
+
+            # Requests without a token get a throwaway session, login keeps it under a new token
+            result = function(self.database.bind(Session() if session is None else session), args)
+
+            # DataInteraction methods signal failure by returning False and missing rows by returning None
+            if result is False:
+                raise ApiError(400, "Request failed")
+
+            if result is None:
+                raise ApiError(404, "Not found")
+
+            handler.send_json(200, {"result": result})
+        except ApiError as e:
+            handler.send_json(e.status, {"error": str(e)})
+        except (KeyError, ValueError, TypeError) as e:
+            handler.send_json(400, {"error": f"Missing or invalid argument: {e}"})
+        except Exception as e:
+            # E.g. no pooled connection became available or the database went away
+            handler.log_error("%s failed: %r", url.path, e)
+            handler.send_json(500, {"error": "Internal server error"})
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.__process_request, request, client_address)
+
+    def __process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.database.shutdown()
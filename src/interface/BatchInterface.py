@@ -0,0 +1,128 @@
+import json
+import time
+
+from data_interaction.BookResultSet import json_default
+from data_interaction.DataInteraction import DataInteraction, SortOptions, SearchMethods, CollectionOperations
+from interface.Interface import Interface
+
+# DataInteraction methods a script may call
+BATCH_COMMANDS = (
+    "login", "logout", "create_account", "get_book_by_isbn", "book_exists", "search_for_users", "follow_user",
+    "unfollow_user", "list_followers", "list_following", "get_follow_counts", "suggest_follows",
+    "create_collection", "clone_collection", "combine_collections", "add_books_to_collection",
+    "remove_books_from_collection", "delete_collection", "rename_collection", "list_collections",
+    "get_collection_contents", "autocomplete_genres", "search_for_book", "rate_book", "read_book_by_isbn",
+    "read_random_book_by_collection", "read_random_books_by_collection", "get_top_books", "get_profile_summary",
+    "get_reading_stats", "get_top_recent_books", "get_top_following_books", "get_top_new_releases",
+    "get_recommendations", "get_similar_books", "get_query_stats"
+)
+
+
+class BatchInterface:
+    """
+    Runs a script of commands on one connection and writes the results as JSON lines
+    -- Script lines are JSON objects like {"command": "rate_book", "args": {"book_isbn": "...", "rating": 5}},
+       blank lines and lines starting with '#' are skipped
+    """
+
+    def __init__(self, output, database: DataInteraction = None, stop_on_error: bool = False):
+        """
+        :param output: Writable text stream the results are written to
+        :param database: Database to use, a DataInteraction on the default config if None
+        :param stop_on_error: If the script stops at the first failed command
+        """
+        self.database = DataInteraction() if database is None else database
+        self.output = output
+        self.stop_on_error = stop_on_error
+
+    @staticmethod
+    def __convert_args(command: str, args: dict) -> dict:
+        """
+        Turn the JSON arguments into the values the DataInteraction method takes
+
+        :param command: Name of the method
+        :param args: Keyword arguments from the script
+        :return: Converted keyword arguments
+        """
+        args = dict(args)
+
+        # Passwords are given in plaintext like at the prompt
+        if command in ("login", "create_account") and "password" in args:
+            args["password"] = Interface.hash_password(args["password"])
+
+        if "search_method" in args:
+            args["search_method"] = SearchMethods[args["search_method"].upper()]
+
+        if "sort_by" in args:
+            args["sort_by"] = SortOptions[args["sort_by"].upper()]
+
+        if "operation" in args:
+            args["operation"] = CollectionOperations[args["operation"].upper()]
+
+        return args
+
+    def __write(self, result: dict) -> None:
+        self.output.write(json.dumps(result, default=json_default) + "\n")
+
+    def execute(self, number: int, line: str) -> bool:
+        """
+        Run one script line
+
+        :param number: Line number, echoed in the result
+        :param line: JSON object with the command name and its keyword arguments
+        :return: If the command succeeded
+        """
+        start = time.perf_counter()
+
+        try:
+            request = json.loads(line)
+            command = request["command"]
+
+            if command not in BATCH_COMMANDS:
+                raise ValueError(f"Unknown command {command}")
+
+            result = getattr(self.database, command)(**self.__convert_args(command, request.get("args", {})))
+        except Exception as e:
+            self.__write({"line": number, "ok": False, "error": f"{type(e).__name__}: {e}"})
+            return False
+
+        # Methods signal failure by returning False
+        ok = result is not False
+
+        self.__write({
+            "line": number,
+            "command": command,
+            "ok": ok,
+            "result": result if ok else None,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        })
+
+        return ok
+
+    def run(self, script) -> int:
+        """
+        Run every line of a script
+
+        :param script: Iterable of script lines, e.g. an open file
+        :return: Number of failed commands
+        """
+        failures = 0
+
+        for number, line in enumerate(script, 1):
+            line = line.strip()
+
+            if line == "" or line.startswith("#"):
+                continue
+
+            if not self.execute(number, line):
+                failures += 1
+
+                if self.stop_on_error:
+                    break
+
+        self.output.flush()
+
+        return failures
+
+    def shutdown(self):
+        self.database.shutdown()
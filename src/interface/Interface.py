@@ -2,13 +2,27 @@ from getpass import getpass
 from tabulate import tabulate
 import hashlib
 
-from data_interaction.DataInteraction import DataInteraction
-from data_interaction.DataInteraction import SortOptions, SearchMethods
+from data_interaction.CachedDataInteraction import CachedDataInteraction
+from data_interaction.DataInteraction import DataInteraction, SortOptions, SearchMethods, CollectionOperations
+from interface.Pager import Pager
+from interface.TableRenderer import TableRenderer
+
+BOOK_HEADERS = ["Book name", "Authors", "Publisher", "Length", "Audience", "Rating", "ISBN"]
+
+# Widest each book column may get, long author lists and titles are truncated to fit
+BOOK_COLUMN_WIDTHS = [40, 30, 25, None, None, None, None]
 
 
 class Interface:
-    def __init__(self):
-        self.database = DataInteraction()
+    def __init__(self, database: DataInteraction = None, prompt = input, secret_prompt = getpass):
+        """
+        :param database: Database to use, a CachedDataInteraction on the default config if None
+        :param prompt: Function reading the answer to a prompt, replaced to script the commands
+        :param secret_prompt: Function reading the answer to a password prompt
+        """
+        self.database = CachedDataInteraction() if database is None else database
+        self.prompt = prompt
+        self.secret_prompt = secret_prompt
 
         # Tuples of command keyword, description, function pointer
         self.command_list = (
@@ -19,22 +33,30 @@ class Interface:
             ("search books", "Search for books in the database", self.search_for_books),
             ("create collection", "Create a collection of books", self.create_collection),
             ("show collections", "Show all created collections", self.show_collections),
+            ("clone collection", "Copy another user's collection into a new collection", self.clone_collection),
+            ("combine collections", "Create a collection from the union, intersection or difference of collections", self.combine_collections),
             ("show collection contents", "Show all books under a collection", self.get_collection_contents),
             ("modify collection", "Modify the name or delete a collection", self.modify_collection),
             ("modify collection contents", "Modify the contents of a collection", self.modify_collection_contents),
             ("rate book", "Give a book a star rating", self.rate_book),
             ("read book", "Read a book by ISBN", self.read_by_isbn),
             ("read random book", "Read a random book from collection", self.read_random_book),
+            ("read random books", "Read several different random books from a collection", self.read_random_books),
             ("search users", "Search for users by email", self.search_for_users),
             ("follow user", "Follow a user", self.follow_user),
             ("unfollow user", "Unfollow a user", self.unfollow_user),
             ("list followers", "List all followers", self.list_followers),
             ("list following", "List all following", self.list_following),
             ("view profile", "View the profile of a given user", self.view_profile),
+            ("reading stats", "Show your reading statistics", self.reading_stats),
             ("top books", "View the top books among all users over last 90 days", self.top_books),
             ("follower favorites", "View the top books among followers", self.follower_favorites),
             ("new releases", "View the top new releases of the month", self.new_releases),
-            ("recommendations", "Get recommendations for books to read", self.recommendations)
+            ("recommendations", "Get recommendations for books to read", self.recommendations),
+            ("similar books", "Find books similar to a book by ISBN", self.similar_books),
+            ("suggest follows", "Get suggestions for users to follow", self.suggest_follows),
+            ("cache stats", "Show query cache statistics for this session", self.cache_stats),
+            ("stats", "Show database statement statistics for this session", self.stats)
         )
 
         # Generate command mappings
@@ -55,8 +77,7 @@ class Interface:
 
         return True
 
-    @staticmethod
-    def __matching_prompt(prompt: str, options: list[str]) -> str:
+    def __matching_prompt(self, prompt: str, options: list[str]) -> str:
         """
         Prompt the user and make sure they respond with one of the options
 
@@ -68,12 +89,12 @@ class Interface:
 
         selected = "None"
         while selected not in options:
-            selected = str(input("Enter option to select: ")).lower()
+            selected = str(self.prompt("Enter option to select: ")).lower()
 
         return selected
 
     @staticmethod
-    def __hash_password(plaintext: str) -> str:
+    def hash_password(plaintext: str) -> str:
         """
         Hash the given plaintext into its sha1
 
@@ -87,18 +108,16 @@ class Interface:
 
         return m.hexdigest()
 
-    @staticmethod
-    def __display_books(books) -> None:
+    def __display_books(self, books) -> None:
         """
-        Print a list of books as a table
+        Print books as a table, a page at a time on a terminal
 
-        :param books: List of books as tuple(name, authors, publisher, length, audience, rating, isbn)
+        :param books: List or streaming iterator of books as tuple(name, authors, publisher, length, audience, rating,
+                      isbn)
         """
-        headers = ["Book name", "Authors", "Publisher", "Length", "Audience", "Rating", "ISBN"]
-
-        table = tabulate(books, headers=headers, tablefmt="grid")
+        renderer = TableRenderer(BOOK_HEADERS, BOOK_COLUMN_WIDTHS)
 
-        print(table)
+        Pager(self.prompt).page(renderer.lines(books))
 
     def help(self) -> bool:
         """
@@ -122,9 +141,9 @@ class Interface:
 
         :return: If login was successful
         """
-        username = str(input("Username: "))
-        password = str(getpass("Password: "))
-        password = self.__hash_password(password)
+        username = str(self.prompt("Username: "))
+        password = str(self.secret_prompt("Password: "))
+        password = self.hash_password(password)
 
         if self.database.login(username, password):
             # This means login success so allow login
@@ -154,18 +173,18 @@ class Interface:
 
         :return: If account creation successful
         """
-        username = str(input("Enter a username (must be unique): "))
-        name = str(input("Enter your name: "))
-        email = str(input("Enter your email: "))
-        password = str(getpass("Enter a password: "))
-        confirm_pass = str(getpass("Reenter password: "))
+        username = str(self.prompt("Enter a username (must be unique): "))
+        name = str(self.prompt("Enter your name: "))
+        email = str(self.prompt("Enter your email: "))
+        password = str(self.secret_prompt("Enter a password: "))
+        confirm_pass = str(self.secret_prompt("Reenter password: "))
 
         if password != confirm_pass:
             print("Passwords do not match.")
             return False
 
         # Now attempt to create the account
-        password = self.__hash_password(password)
+        password = self.hash_password(password)
         if self.database.create_account(username, name, email, password):
             self.database.login(username, password)
             print("Account created successfully! Logged in.")
@@ -183,9 +202,9 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        collection_name = str(input("Enter collection name (must be unique): "))
+        collection_name = str(self.prompt("Enter collection name (must be unique): "))
 
-        isbn_text = str(input("Enter comma separated ISBNs (can be empty): "))
+        isbn_text = str(self.prompt("Enter comma separated ISBNs (can be empty): "))
         isbns = [x.strip() for x in isbn_text.split(",")]
 
         if len(isbns) == 1 and isbns[0] == "":
@@ -198,6 +217,60 @@ class Interface:
             print("Failed to create collection. Collection name should be unique and ISBNs must exist.")
             return False
 
+    def clone_collection(self) -> bool:
+        """
+        Copy another user's collection
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        username = str(self.prompt("Enter username of the collection's owner: "))
+        collection_name = str(self.prompt("Enter collection name: "))
+        new_name = str(self.prompt("Enter name of the new collection (empty to keep the name): "))
+
+        book_count = self.database.clone_collection(username, collection_name, new_name if new_name != "" else None)
+
+        if book_count is False:
+            print("Failed to clone collection. The collection must exist and the new name should be unique.")
+            return False
+
+        print(f"Collection cloned with {book_count} books!")
+        return True
+
+    def combine_collections(self) -> bool:
+        """
+        Create a collection from the union, intersection or difference of the user's collections
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        operation = self.__matching_prompt("Operations", ["union", "intersect", "difference"])
+
+        names_text = str(self.prompt("Enter comma separated collection names (a difference keeps the first's books in none of the others): "))
+        collection_names = [x.strip() for x in names_text.split(",") if x.strip() != ""]
+
+        new_name = str(self.prompt("Enter name of the new collection (must be unique): "))
+
+        if operation == "intersect":
+            operation_enum = CollectionOperations.INTERSECT
+        elif operation == "difference":
+            operation_enum = CollectionOperations.DIFFERENCE
+        else:
+            operation_enum = CollectionOperations.UNION
+
+        book_count = self.database.combine_collections(operation_enum, collection_names, new_name)
+
+        if book_count is False:
+            print("Failed to combine collections. The collections must exist and the new name should be unique.")
+            return False
+
+        print(f"Collection created with {book_count} books!")
+        return True
+
     def show_collections(self) -> bool:
         """
         List all collections of books
@@ -236,12 +309,18 @@ class Interface:
 
         search_method = self.__matching_prompt("Available search methods", search_options)
 
-        search_val = str(input("Search value: "))
+        search_val = str(self.prompt("Search value: "))
+
+        if search_method == "genre":
+            suggestions = self.database.autocomplete_genres(search_val)
+
+            if suggestions and search_val.strip().lower() not in [genre.lower() for genre in suggestions]:
+                print("Matching genres: {}".format(", ".join(suggestions)))
 
         order_options = ["name", "publisher", "genre", "release year"]
         order_by = self.__matching_prompt("Order by", order_options)
 
-        ascending = str(input("(a)scending/(d)escending? ")) == "a"
+        ascending = str(self.prompt("(a)scending/(d)escending? ")) == "a"
 
         order_by_enum = None
         if order_by == "publisher":
@@ -266,7 +345,7 @@ class Interface:
             search_method_enum = SearchMethods.GENRE
 
 
-        results = self.database.search_for_book(search_method_enum, search_val, order_by_enum, ascending)
+        results = self.database.stream_search_for_book(search_method_enum, search_val, order_by_enum, ascending)
 
         if results == False:
             print("Failed to search database for books.")
@@ -289,14 +368,14 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        collection_name = str(input("Enter collection name: "))
+        collection_name = str(self.prompt("Enter collection name: "))
 
         modify_options = ["rename", "delete"]
 
         selected = self.__matching_prompt("Available modification options", modify_options)
 
         if selected == "rename":
-            new_name = str(input("Enter new name: "))
+            new_name = str(self.prompt("Enter new name: "))
 
             if self.database.rename_collection(collection_name, new_name):
                 print("Renamed successfully.")
@@ -326,14 +405,14 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        collection_name = str(input("Enter collection name: "))
+        collection_name = str(self.prompt("Enter collection name: "))
 
         modify_options = ["add", "remove"]
 
         selected = self.__matching_prompt("Available modification options", modify_options)
 
         if selected == "add":
-            new_books_str = str(input("Enter the ISBNs of the books to add comma separated: "))
+            new_books_str = str(self.prompt("Enter the ISBNs of the books to add comma separated: "))
             new_books = [x.strip() for x in new_books_str.split(",")]
 
             if self.database.add_books_to_collection(collection_name, new_books):
@@ -344,7 +423,7 @@ class Interface:
                 return False
 
         elif selected == "remove":
-            remove_books_str = str(input("Enter the ISBNs of the books to remove comma separated: "))
+            remove_books_str = str(self.prompt("Enter the ISBNs of the books to remove comma separated: "))
             remove_books = [x.strip() for x in remove_books_str.split(",")]
 
             if self.database.remove_books_from_collection(collection_name, remove_books):
@@ -366,7 +445,7 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        collection_name = str(input("Enter collection name: "))
+        collection_name = str(self.prompt("Enter collection name: "))
 
         books = self.database.get_collection_contents(collection_name)
 
@@ -386,7 +465,7 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        book_isbn = str(input("Enter the ISBN of the book to rate: "))
+        book_isbn = str(self.prompt("Enter the ISBN of the book to rate: "))
 
         book_result = self.database.get_book_by_isbn(book_isbn)
 
@@ -403,7 +482,7 @@ class Interface:
         star_rating = 0
 
         while not (1 <= star_rating <= 5):
-            star_rating = int(input("Enter new rating to set [1, 5]: "))
+            star_rating = int(self.prompt("Enter new rating to set [1, 5]: "))
 
         if self.database.rate_book(book_isbn, star_rating):
             print("Successfully set rating.")
@@ -421,14 +500,14 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        book_isbn = str(input("Enter the ISBN of the book to read: "))
+        book_isbn = str(self.prompt("Enter the ISBN of the book to read: "))
 
-        if self.database.get_book_by_isbn(book_isbn) is None:
+        if not self.database.book_exists(book_isbn):
             print("Book does not exist. Try again.")
             return False
 
-        start_page = int(input("Enter start page: "))
-        end_page = int(input("Enter end page: "))
+        start_page = int(self.prompt("Enter start page: "))
+        end_page = int(self.prompt("Enter end page: "))
 
         if self.database.read_book_by_isbn(book_isbn, start_page, end_page):
             print("Successfully read book.")
@@ -446,10 +525,10 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        collection_name = str(input("Enter collection name: "))
+        collection_name = str(self.prompt("Enter collection name: "))
 
-        start_page = int(input("Enter start page: "))
-        end_page = int(input("Enter end page: "))
+        start_page = int(self.prompt("Enter start page: "))
+        end_page = int(self.prompt("Enter end page: "))
 
         if (book_name := self.database.read_random_book_by_collection(collection_name, start_page, end_page)) == False:
             print("Failed to get book from database.")
@@ -461,6 +540,37 @@ class Interface:
             print("Failed to read book.")
             return False
 
+    def read_random_books(self) -> bool:
+        """
+        Read several distinct random books from a collection
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        collection_name = str(self.prompt("Enter collection name: "))
+
+        count = int(self.prompt("Enter number of books: "))
+        start_page = int(self.prompt("Enter start page: "))
+        end_page = int(self.prompt("Enter end page: "))
+
+        book_names = self.database.read_random_books_by_collection(collection_name, count, start_page, end_page)
+
+        if book_names == False:
+            print("Failed to get books from database.")
+            return False
+        elif len(book_names) == 0:
+            print("Failed to read books.")
+            return False
+
+        print(f"Successfully read {len(book_names)} books:")
+
+        for book_name in book_names:
+            print(f"\t{book_name}")
+
+        return True
+
     def search_for_users(self) -> bool:
         """
         Search for users by a given email
@@ -470,7 +580,7 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        email = str(input("Enter an email to search for users: "))
+        email = str(self.prompt("Enter an email to search for users: "))
 
         usernames = self.database.search_for_users(email)
 
@@ -494,7 +604,7 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        username = str(input("Enter a username to follow: "))
+        username = str(self.prompt("Enter a username to follow: "))
 
         if self.database.follow_user(username):
             print("Followed successfully.")
@@ -512,7 +622,7 @@ class Interface:
         if not self.__pre_checks():
             return False
 
-        username = str(input("Enter a username to unfollow: "))
+        username = str(self.prompt("Enter a username to unfollow: "))
 
         if self.database.unfollow_user(username):
             print("Unfollowed successfully.")
@@ -567,31 +677,80 @@ class Interface:
 
         :return: If successful
         """
-        username = str(input("Enter username of user to view: "))
+        username = str(self.prompt("Enter username of user to view: "))
 
-        collection = self.database.list_collections(username)
+        summary = self.database.get_profile_summary(username)
 
-        if collection == False:
-            print("Failed to query user. Does the user exist?")
+        if summary == False:
+            print("Failed to query user from database.")
             return False
 
-        collection = len(collection)
-
-        followers = len(self.database.list_followers(username))
-        following = len(self.database.list_following(username))
+        if summary is None:
+            print("User does not exist.")
+            return False
 
-        top_books = self.database.get_top_books(username)
+        collection, followers, following, pages, top_books = summary
 
         print(f"User {username}:")
         print(f"\t{collection} collections")
         print(f"\t{followers} followers")
         print(f"\tIs following {following} users")
+        print(f"\t{pages} pages read")
         print(f"Top {len(top_books)} books:")
 
         self.__display_books(top_books)
 
         return True
 
+    def reading_stats(self) -> bool:
+        """
+        Show the reading statistics of the current user
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        stats = self.database.get_reading_stats()
+
+        if stats == False or stats is None:
+            print("Failed to compute reading statistics.")
+            return False
+
+        if stats["sessions"] == 0:
+            print("No books read yet.")
+            return True
+
+        streak_days, streak_start, streak_end = stats["longest_streak"]
+        best_day, best_day_pages = stats["best_day"]
+
+        rows = [
+            ("Reading sessions", stats["sessions"]),
+            ("Pages read", stats["pages"]),
+            ("Reading since", stats["first_read"]),
+            ("Days with reading", stats["days_active"]),
+            ("Pages per day", round(stats["pages_per_day"], 1)),
+            ("Pages per reading day", round(stats["pages_per_active_day"], 1)),
+            ("Average session", f"{stats['average_session_minutes']:.0f} minutes, {stats['average_session_pages']:.1f} pages"),
+            ("Pages in the last 7 days", stats["last_week_pages"]),
+            ("Pages in the last 30 days", stats["last_month_pages"]),
+            ("Best day", f"{best_day} ({best_day_pages} pages)"),
+            ("Best 7 days", f"{stats['best_week_pages']} pages"),
+            ("Longest streak", f"{streak_days} days ({streak_start} to {streak_end})"),
+            ("Current streak", f"{stats['current_streak']} days"),
+        ]
+
+        print(tabulate(rows, tablefmt="simple"))
+
+        if stats["favourite_genres"]:
+            print()
+            print(tabulate(stats["favourite_genres"], headers=["Favourite genre", "Pages"], tablefmt="simple"))
+
+            print()
+            print(tabulate(stats["genres_by_month"][-12:], headers=["Month", "Top genre", "Pages"], tablefmt="simple"))
+
+        return True
+
     def top_books(self) -> bool:
         """
         Get top books across all users
@@ -691,6 +850,92 @@ class Interface:
         self.__display_books(books)
 
         return True
-    
+
+    def similar_books(self) -> bool:
+        """
+        Get books similar to a given book by genres, authors and publishers
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        book_isbn = str(self.prompt("Enter the ISBN of the book: "))
+
+        books = self.database.get_similar_books(book_isbn)
+
+        if books == False:
+            print("Failed to fetch similar books")
+            return False
+
+        if len(books) == 0:
+            print("No similar books found")
+            return False
+
+        print(f"Top {len(books)} similar books:")
+
+        headers = ["Book name", "Authors", "Publisher", "Length", "Audience", "Rating", "ISBN", "Similarity"]
+        table = tabulate(books, headers=headers, tablefmt="grid")
+        print(table)
+
+        return True
+
+    def suggest_follows(self) -> bool:
+        """
+        Suggest users to follow from the users your followees follow
+
+        :return: If successful
+        """
+        if not self.__pre_checks():
+            return False
+
+        suggestions = self.database.suggest_follows()
+
+        if suggestions == False:
+            print("Failed to fetch follow suggestions")
+            return False
+
+        if len(suggestions) == 0:
+            print("No suggestions found. Follow some users first!")
+            return False
+
+        headers = ["Username", "Followed by your followees", "Books read in common"]
+        table = tabulate(suggestions, headers=headers, tablefmt="grid")
+        print(table)
+
+        return True
+
+    def cache_stats(self) -> bool:
+        """
+        Show hit, miss and eviction counts of the query cache
+
+        :return: If successful
+        """
+        stats = self.database.get_cache_stats()
+
+        table = tabulate(stats.items(), headers=["Statistic", "Value"], tablefmt="simple")
+        print(table)
+
+        return True
+
+    def stats(self) -> bool:
+        """
+        Show latency, row and error statistics of every database method called this session
+
+        :return: If successful
+        """
+        stats = self.database.get_query_stats()
+
+        if len(stats) == 0:
+            print("No statements executed yet.")
+            return True
+
+        headers = ["Method", "Calls", "Errors", "Timeouts", "Cancels", "Mean ms", "p50 ms", "p95 ms", "p99 ms",
+                   "Max ms", "Rows", "Bytes", "Last error"]
+        table = tabulate(stats, headers=headers, tablefmt="simple")
+        print(table)
+
+        return True
+
     def shutdown(self):
         self.database.shutdown()
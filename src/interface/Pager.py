@@ -0,0 +1,64 @@
+import shutil
+import sys
+
+MORE_PROMPT = "-- More -- (Enter for next page, a number for that many lines, q to quit) "
+
+
+class Pager:
+    """
+    Print lines a screen at a time like less
+    -- Only pages when the output is a terminal, otherwise every line is written straight through
+    """
+    __slots__ = ["__prompt", "__output", "__page_lines"]
+
+    def __init__(self, prompt = input, output = None, page_lines: int = None):
+        """
+        :param prompt: Function reading the answer to the more prompt
+        :param output: Stream to write to, sys.stdout at the time of paging if None
+        :param page_lines: Lines per page, the terminal height if None
+        """
+        self.__prompt = prompt
+        self.__output = output
+        self.__page_lines = page_lines
+
+    def page(self, lines) -> int:
+        """
+        Write lines, pausing after every page until the reader asks for more
+
+        :param lines: Iterable of lines without line endings, consumed lazily
+        :return: Number of lines written
+        """
+        output = sys.stdout if self.__output is None else self.__output
+        interactive = output.isatty()
+
+        # Leave a line for the prompt
+        page_lines = self.__page_lines
+        if page_lines is None:
+            page_lines = max(1, shutil.get_terminal_size().lines - 1)
+
+        written = 0
+        remaining = page_lines
+
+        try:
+            for line in lines:
+                if interactive and remaining == 0:
+                    output.flush()
+                    answer = str(self.__prompt(MORE_PROMPT)).strip().lower()
+
+                    if answer == "q":
+                        break
+
+                    remaining = int(answer) if answer.isdigit() and int(answer) > 0 else page_lines
+
+                output.write(line + "\n")
+                written += 1
+                remaining -= 1
+        finally:
+            close = getattr(lines, "close", None)
+
+            if close is not None:
+                close()
+
+            output.flush()
+
+        return written
@@ -0,0 +1,94 @@
+from itertools import islice
+
+# Rows read ahead to size the columns, bounds the time to the first printed row
+SAMPLE_SIZE = 50
+
+TRUNCATION_MARK = "..."
+
+
+class TableRenderer:
+    """
+    Grid table written one row at a time, in the look of tabulate's "grid" format
+    -- Column widths are fixed before the first row from the headers, the first SAMPLE_SIZE rows and per column caps
+    -- Cells wider than their column are truncated, so rows never need to be measured in advance
+    """
+    __slots__ = ["__headers", "__max_widths", "__sample_size"]
+
+    def __init__(self, headers: list[str], max_widths: list[int | None], sample_size: int = SAMPLE_SIZE):
+        """
+        :param headers: Column headers
+        :param max_widths: Widest each column may get, None for no limit
+        :param sample_size: Number of rows read ahead to size the columns
+        """
+        self.__headers = headers
+        self.__max_widths = max_widths
+        self.__sample_size = sample_size
+
+    @staticmethod
+    def __cell(value) -> str:
+        if value is None:
+            return ""
+
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(item) for item in value)
+
+        return str(value)
+
+    @staticmethod
+    def __fit(text: str, width: int, right: bool) -> str:
+        if len(text) > width:
+            text = text[:max(0, width - len(TRUNCATION_MARK))] + TRUNCATION_MARK[:width]
+
+        return text.rjust(width) if right else text.ljust(width)
+
+    def __widths(self, sample: list[tuple]) -> list[int]:
+        widths = []
+
+        for column, header in enumerate(self.__headers):
+            width = max([len(header)] + [len(self.__cell(row[column])) for row in sample if column < len(row)])
+            limit = self.__max_widths[column]
+
+            widths.append(width if limit is None else min(width, max(limit, len(header))))
+
+        return widths
+
+    def lines(self, rows):
+        """
+        Render rows as table lines
+
+        :param rows: Iterable of row tuples, consumed lazily
+        :return: Iterator of lines without line endings
+        """
+        rows = iter(rows)
+
+        try:
+            sample = list(islice(rows, self.__sample_size))
+            widths = self.__widths(sample)
+
+            border = "+" + "+".join("-" * (width + 2) for width in widths) + "+"
+            yield border
+            yield "| " + " | ".join(self.__fit(header, width, False) for header, width in zip(self.__headers, widths)) + " |"
+            yield border.replace("-", "=")
+
+            for row in sample:
+                yield self.__row(row, widths)
+                yield border
+
+            for row in rows:
+                yield self.__row(row, widths)
+                yield border
+        finally:
+            # Let a generator of rows run its cleanup when the table is abandoned early
+            close = getattr(rows, "close", None)
+
+            if close is not None:
+                close()
+
+    def __row(self, row: tuple, widths: list[int]) -> str:
+        # Rows shorter than the headers, e.g. top lists without an isbn, leave the last cells empty
+        values = list(row) + [None] * (len(widths) - len(row))
+
+        return "| " + " | ".join(
+            self.__fit(self.__cell(value), width, isinstance(value, (int, float)))
+            for value, width in zip(values, widths)
+        ) + " |"
@@ -1,7 +1,48 @@
+import argparse
+import sys
+
+import psycopg2.extensions
+
+from data_interaction.QueryStats import cancel_on_interrupt
+from interface.BatchInterface import BatchInterface
 from interface.Interface import Interface
 
 
+def run_batch(script_filename: str, stop_on_error: bool) -> int:
+    """
+    Run a script of commands on one connection, writing JSON lines to stdout
+
+    :param script_filename: Script file, '-' for stdin
+    :param stop_on_error: If the script stops at the first failed command
+    :return: Exit status, 1 if any command failed
+    """
+    batch = BatchInterface(sys.stdout, stop_on_error = stop_on_error)
+
+    try:
+        if script_filename == "-":
+            failures = batch.run(sys.stdin)
+        else:
+            with open(script_filename, "r") as script:
+                failures = batch.run(script)
+    finally:
+        batch.shutdown()
+
+    return 1 if failures else 0
+
+
 def main():
+    parser = argparse.ArgumentParser(description="BadReads")
+    parser.add_argument("--batch", metavar="SCRIPT", default=None,
+                        help="Run a JSON lines script of commands ('-' for stdin) instead of the prompt")
+    parser.add_argument("--stop-on-error", action="store_true", help="Stop the script at the first failed command")
+    args = parser.parse_args()
+
+    # Ctrl-C cancels the running statement on the server instead of waiting for it
+    psycopg2.extensions.set_wait_callback(cancel_on_interrupt)
+
+    if args.batch is not None:
+        sys.exit(run_batch(args.batch, args.stop_on_error))
+
     interface = Interface()
 
     print("Welcome to BadReads! Type `help` for a list of commands.")
@@ -0,0 +1,35 @@
+from data_interaction.DataInteraction import DataInteraction
+
+
+def main():
+    database = DataInteraction()
+
+    try:
+        print("Applying migrations...")
+        if not database.migrate():
+            print("Failed to apply migrations.")
+            return
+
+        # Bulk jobs that (re)build the derived tables from the base tables
+        jobs = (
+            ("following feed", database.rebuild_following_feed),
+            ("local catalog", database.sync_catalog),
+            ("catalog log", database.prune_catalog_log),
+            ("genre closure", database.rebuild_genre_closure),
+            ("collection counters", database.rebuild_collection_counters),
+            ("user counters", database.rebuild_user_counters),
+        )
+
+        for name, job in jobs:
+            print(f"Rebuilding {name}...")
+
+            if not job():
+                print(f"Failed to rebuild {name}.")
+    finally:
+        database.shutdown()
+
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
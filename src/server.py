@@ -0,0 +1,32 @@
+import argparse
+
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME
+from interface.ApiServer import ApiServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BadReads HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=32, help="Worker threads handling requests")
+    parser.add_argument("--connections", type=int, default=8, help="Database connections shared by the workers")
+    parser.add_argument("--config", default=CONFIG_FILENAME)
+    args = parser.parse_args()
+
+    print("Connecting to the database...")
+    server = ApiServer((args.host, args.port), DataInteraction(args.config, args.connections), args.workers)
+
+    print(f"Serving on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print("Exiting...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+import time
+
+from data_interaction.DataInteraction import CONFIG_FILENAME
+from data_interaction.TunnelManager import TUNNELS, TUNNEL_FILENAME, publish, tunnel_settings, unpublish
+
+# Seconds between checks that the tunnel is still up
+HEALTH_CHECK_INTERVAL = 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep one SSH tunnel to the database open for every BadReads "
+                                                 "process on this host")
+    parser.add_argument("--config", default=CONFIG_FILENAME)
+    parser.add_argument("--compression", action="store_true", default=None,
+                        help="Compress the SSH transport, \"ssh_compression\" from the config if not given")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as file:
+        settings = tunnel_settings(json.load(file))
+
+    if args.compression is not None:
+        settings["compression"] = args.compression
+
+    print("Opening the tunnel...")
+    tunnel = TUNNELS.acquire(**settings)
+
+    try:
+        address = (tunnel.local_bind_host, tunnel.local_bind_port)
+        publish(tunnel, settings)
+        print(f"Tunnel listening on {address[0]}:{address[1]}, published in {TUNNEL_FILENAME}")
+
+        while True:
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+            try:
+                TUNNELS.ensure_active(tunnel)
+            except Exception as e:
+                # Tried again at the next check, clients back off meanwhile
+                print(f"Failed to restart the tunnel: {e}")
+                continue
+
+            # A restarted tunnel listens on a new port
+            if (tunnel.local_bind_host, tunnel.local_bind_port) != address:
+                address = (tunnel.local_bind_host, tunnel.local_bind_port)
+                publish(tunnel, settings)
+                print(f"Tunnel restarted on {address[0]}:{address[1]}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        unpublish()
+        TUNNELS.release(tunnel)
+
+    print("Exiting...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Time every public DataInteraction method against a generated dataset
+
+Usage (from src/, like main.py):
+    python ../tools/benchmark.py --config ../local_config.json --scales 10000,1000000,10000000
+
+With --scales the dataset is regenerated by generate_data.py at each number of reads before timing, without it the
+current contents of the database are used. Results are written as JSON and summarized per scale.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_interaction.BookResultSet import BookResultSet
+from data_interaction.CachedDataInteraction import CachedDataInteraction
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME, SearchMethods, SortOptions, CollectionOperations
+import generate_data
+
+# Methods that manage the session or the process rather than serve a user action
+NOT_BENCHMARKED = {"login", "logout", "shutdown", "open_connection", "get_current_user", "get_query_stats",
+                   "get_cache_stats", "invalidate", "migrate", "capture_statements", "bind"}
+
+# Bulk jobs run a handful of times instead of --iterations
+BULK_ITERATIONS = 3
+
+
+class Samples:
+    """
+    Real keys drawn from the database so the benchmarked calls hit data
+    """
+
+    def __init__(self, database: DataInteraction, generator: random.Random):
+        connection = database.open_connection()
+        cursor = connection.cursor()
+
+        def column(query: str) -> list:
+            cursor.execute(query)
+            return [row[0] for row in cursor.fetchall()]
+
+        try:
+            # Seeded so the same data gives the same samples, e.g. for check_plans
+            cursor.execute("SELECT setseed(%s);", (generator.random(),))
+
+            self.isbns = column(f"""
+                SELECT isbn FROM book TABLESAMPLE SYSTEM (10) REPEATABLE ({generator.randrange(2 ** 31)}) LIMIT 1000;
+            """) \
+                or column("SELECT isbn FROM book LIMIT 1000;")
+            self.usernames = column("SELECT username FROM users ORDER BY RANDOM() LIMIT 1000;")
+            self.emails = column("SELECT email FROM users ORDER BY RANDOM() LIMIT 100;")
+            self.authors = column("SELECT DISTINCT name FROM contributor JOIN authors USING (contributorid) LIMIT 100;")
+            self.publishers = column("SELECT DISTINCT name FROM contributor JOIN publishes USING (contributorid) LIMIT 100;")
+            self.genres = column("SELECT name FROM genre;")
+            self.dates = [str(date) for date in column("SELECT DISTINCT releasedate FROM book LIMIT 100;")]
+            # Last word of each title, single word titles included
+            self.words = [title.split()[-1] for title in column("SELECT title FROM book LIMIT 100;") if title.split()]
+
+            # Benchmark as the user with the most collections so collection methods have data
+            self.user = column("""
+                SELECT username FROM creates GROUP BY username ORDER BY COUNT(*) DESC, username LIMIT 1;
+            """)[0]
+            self.collections = column(f"""
+                SELECT name FROM collections JOIN creates USING (collectionid) WHERE username = '{self.user}';
+            """)
+        finally:
+            cursor.close()
+            connection.close()
+
+        self.__generator = generator
+
+    def pick(self, values: list):
+        return self.__generator.choice(values)
+
+
+def first_row(rows):
+    """
+    Read only the first row of a stream so its benchmark measures the time to first row
+
+    :return: List of at most one row or False on failure
+    """
+    if rows is False:
+        return False
+
+    if rows is None:
+        return []
+
+    row = next(rows, None)
+    close = getattr(rows, "close", None)
+
+    if close is not None:
+        close()
+
+    return [] if row is None else [row]
+
+
+def benchmarks(database: DataInteraction, samples: Samples, generator: random.Random) -> dict:
+    """
+    :return: Dict of method name -> tuple(function taking the iteration number, iterations or None for the default)
+    """
+    sort_options = list(SortOptions)
+    pick = samples.pick
+
+    return {
+        "create_account": (lambda i: database.create_account(f"bench{time.time_ns()}", "Bench", "bench@example.com",
+                                                             generate_data.BENCHMARK_PASSWORD_HASH), None),
+        "sync_catalog": (lambda i: database.sync_catalog(), BULK_ITERATIONS),
+        "build_isbn_filter": (lambda i: database.build_isbn_filter(), BULK_ITERATIONS),
+        "book_exists": (lambda i: database.book_exists(pick(samples.isbns)), None),
+        "get_book_by_isbn": (lambda i: database.get_book_by_isbn(pick(samples.isbns)), None),
+        "search_for_users": (lambda i: database.search_for_users(pick(samples.emails)), None),
+        "follow_user": (lambda i: database.follow_user(pick(samples.usernames)), None),
+        "unfollow_user": (lambda i: database.unfollow_user(pick(samples.usernames)), None),
+        "list_followers": (lambda i: database.list_followers(pick(samples.usernames)), None),
+        "list_following": (lambda i: database.list_following(pick(samples.usernames)), None),
+        "build_follow_graph": (lambda i: database.build_follow_graph(), BULK_ITERATIONS),
+        "get_follow_counts": (lambda i: database.get_follow_counts(pick(samples.usernames)), None),
+        "suggest_follows": (lambda i: database.suggest_follows(), None),
+        "create_collection": (lambda i: database.create_collection(f"bench {i}", generator.sample(samples.isbns, 5)), None),
+        "add_books_to_collection": (lambda i: database.add_books_to_collection(f"bench {i}", generator.sample(samples.isbns, 5)), None),
+        "remove_books_from_collection": (lambda i: database.remove_books_from_collection(f"bench {i}", generator.sample(samples.isbns, 5)), None),
+        "rename_collection": (lambda i: database.rename_collection(f"bench {i}", f"bench renamed {i}"), None),
+        "delete_collection": (lambda i: database.delete_collection(f"bench renamed {i}"), None),
+        "clone_collection": (lambda i: database.clone_collection(samples.user, pick(samples.collections), f"bench clone {time.time_ns()}"), None),
+        "combine_collections": (lambda i: database.combine_collections(
+            generator.choice(list(CollectionOperations)), generator.sample(samples.collections, min(3, len(samples.collections))),
+            f"bench combined {time.time_ns()}"
+        ), None),
+        "list_collections": (lambda i: database.list_collections(), None),
+        "get_collection_contents": (lambda i: database.get_collection_contents(pick(samples.collections)), None),
+        "load_genres": (lambda i: database.load_genres(), BULK_ITERATIONS),
+        "autocomplete_genres": (lambda i: database.autocomplete_genres(pick(samples.genres)[:3]), None),
+        "rebuild_genre_closure": (lambda i: database.rebuild_genre_closure(), BULK_ITERATIONS),
+        "search_for_book": (lambda i: database.search_for_book(*generator.choice((
+            (SearchMethods.BOOK_NAME, pick(samples.words)),
+            (SearchMethods.RELEASE_DATE, pick(samples.dates)),
+            (SearchMethods.AUTHOR, pick(samples.authors)),
+            (SearchMethods.PUBLISHER, pick(samples.publishers)),
+            (SearchMethods.GENRE, pick(samples.genres).strip()),
+        )), generator.choice(sort_options), generator.random() < 0.5), None),
+        "stream_search_for_book": (lambda i: first_row(database.stream_search_for_book(
+            SearchMethods.BOOK_NAME, pick(samples.words), generator.choice(sort_options), generator.random() < 0.5
+        )), None),
+        "rate_book": (lambda i: database.rate_book(pick(samples.isbns), generator.randint(1, 5)), None),
+        "read_book_by_isbn": (lambda i: database.read_book_by_isbn(pick(samples.isbns), 1, 10), None),
+        "read_random_book_by_collection": (lambda i: database.read_random_book_by_collection(pick(samples.collections), 1, 10), None),
+        "read_random_books_by_collection": (lambda i: database.read_random_books_by_collection(pick(samples.collections), 10, 1, 10), None),
+        "get_top_books": (lambda i: database.get_top_books(pick(samples.usernames)), None),
+        "get_profile_summary": (lambda i: database.get_profile_summary(pick(samples.usernames)), None),
+        "get_reading_stats": (lambda i: database.get_reading_stats(pick(samples.usernames)), None),
+        "get_top_recent_books": (lambda i: database.get_top_recent_books(), None),
+        "get_top_following_books": (lambda i: database.get_top_following_books(), None),
+        "rebuild_following_feed": (lambda i: database.rebuild_following_feed(), BULK_ITERATIONS),
+        "rebuild_collection_counters": (lambda i: database.rebuild_collection_counters(), BULK_ITERATIONS),
+        "rebuild_user_counters": (lambda i: database.rebuild_user_counters(), BULK_ITERATIONS),
+        "prune_catalog_log": (lambda i: database.prune_catalog_log(), BULK_ITERATIONS),
+        "get_top_new_releases": (lambda i: database.get_top_new_releases(), None),
+        "get_recommendations": (lambda i: database.get_recommendations(), None),
+        "build_similarity_index": (lambda i: database.build_similarity_index(), BULK_ITERATIONS),
+        "refresh_similarity_index": (lambda i: database.refresh_similarity_index(generator.sample(samples.isbns, 10)), None),
+        "get_similar_books": (lambda i: database.get_similar_books(pick(samples.isbns)), None),
+    }
+
+
+def measure(function, iterations: int) -> dict:
+    """
+    Call a benchmark repeatedly
+
+    :param function: Function taking the iteration number
+    :param iterations: Number of calls
+    :return: Latency percentiles, error count and throughput
+    """
+    latencies = []
+    rows = 0
+    errors = 0
+
+    for i in range(iterations):
+        start = time.perf_counter()
+
+        try:
+            result = function(i)
+        except Exception:
+            result = False
+
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if result is False:
+            errors += 1
+        elif isinstance(result, (list, tuple, BookResultSet)):
+            rows += len(result)
+        else:
+            rows += 1
+
+    latencies = np.array(latencies)
+    total_seconds = latencies.sum() / 1000
+
+    return {
+        "calls": iterations,
+        "errors": errors,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "rows_per_second": round(rows / total_seconds, 1) if total_seconds > 0 else 0.0,
+    }
+
+
+def run(config_filename: str, iterations: int, cached: bool, seed: int) -> dict:
+    """
+    Benchmark every public method on the current dataset
+
+    :return: Dict of method name -> measurements
+    """
+    generator = random.Random(seed)
+    database = CachedDataInteraction(config_filename = config_filename) if cached else DataInteraction(config_filename)
+
+    try:
+        samples = Samples(database, generator)
+
+        if not database.login(samples.user, generate_data.BENCHMARK_PASSWORD_HASH):
+            raise RuntimeError(f"Could not log in as {samples.user}")
+
+        cases = benchmarks(database, samples, generator)
+
+        public = set(name for name in dir(DataInteraction) if not name.startswith("_") and callable(getattr(DataInteraction, name)))
+        for name in sorted(public - set(cases) - NOT_BENCHMARKED):
+            print(f"Warning: {name} is not benchmarked")
+
+        results = dict()
+
+        for name, (function, count) in cases.items():
+            results[name] = measure(function, iterations if count is None else count)
+            print(f"  {name}: p50 {results[name]['p50_ms']} ms, p99 {results[name]['p99_ms']} ms")
+
+        return results
+    finally:
+        database.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DataInteraction methods")
+    parser.add_argument("--config", default=CONFIG_FILENAME, help="Config file of the local database")
+    parser.add_argument("--scales", default=None, help="Comma separated numbers of reads to regenerate the data at")
+    parser.add_argument("--iterations", type=int, default=100, help="Calls per method")
+    parser.add_argument("--cached", action="store_true", help="Benchmark CachedDataInteraction instead")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", default="../benchmark_results.json", help="File the JSON results are written to")
+    args = parser.parse_args()
+
+    report = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "cached": args.cached, "scales": []}
+    scales = [None] if args.scales is None else [int(scale) for scale in args.scales.split(",")]
+
+    for scale in scales:
+        counts = None
+
+        if scale is not None:
+            print(f"Generating {scale} reads...")
+            counts = generate_data.generate(args.config, seed=args.seed, follows_per_user=20, collections_per_user=2,
+                                            **generate_data.scale_arguments(scale))
+
+        print(f"Benchmarking{'' if scale is None else f' {scale} reads'}...")
+        report["scales"].append({"reads": scale, "rows": counts,
+                                 "methods": run(args.config, args.iterations, args.cached, args.seed)})
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+
+    for result in report["scales"]:
+        scale = "current data" if result["reads"] is None else f"{result['reads']} reads"
+        print(f"\nScale: {scale}")
+        print(tabulate(
+            [(name, m["calls"], m["errors"], m["mean_ms"], m["p50_ms"], m["p95_ms"], m["p99_ms"], m["rows_per_second"])
+             for name, m in result["methods"].items()],
+            headers=["Method", "Calls", "Errors", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Rows/s"]
+        ))
+
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
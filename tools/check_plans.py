@@ -0,0 +1,232 @@
+"""
+Query plan regression check for the DataInteraction queries
+
+Usage (from src/, like main.py):
+    python ../tools/check_plans.py --config ../local_config.json --scale 100000 --update    # record snapshots
+    python ../tools/check_plans.py --config ../local_config.json --scale 100000             # check against them
+
+Every benchmarked method is called once with representative arguments while its statements are captured, each
+statement is then planned with EXPLAIN (FORMAT JSON). The check fails (exit status 1) when a plan scans one of the
+large tables sequentially or when its estimated cost grows past the tolerance over the snapshot. Plan shape changes
+are reported without failing. Checking without a snapshot file or at another scale than it was recorded at fails.
+
+The committed plan_snapshots.json was recorded at SNAPSHOT_SCALE reads with the default seed on PostgreSQL 16.
+Larger scales skew the synthetic follow graph enough that rebuilding the following feed alone takes tens of minutes.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME
+from benchmark import Samples, benchmarks, BULK_ITERATIONS
+import generate_data
+
+SNAPSHOT_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_snapshots.json")
+
+# Number of reads the committed snapshots were recorded at
+SNAPSHOT_SCALE = 100_000
+
+# Tables that must never be scanned sequentially by a user facing query
+WATCHED_TABLES = ("reads", "rates", "follows", "belongs_to")
+
+# Statements that can be planned, DDL and transaction control cannot be explained
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def plan_nodes(node: dict):
+    """
+    :param node: Plan node of EXPLAIN (FORMAT JSON)
+    :return: Generator of every node in the plan tree, depth first
+    """
+    yield node
+
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def describe(node: dict) -> str:
+    """
+    :return: Node type with the relation and index it reads, e.g. "Index Scan reads using reads_isbn"
+    """
+    text = node["Node Type"]
+
+    if "Relation Name" in node:
+        text += f" {node['Relation Name']}"
+
+    if "Index Name" in node:
+        text += f" using {node['Index Name']}"
+
+    return text
+
+
+def capture_plans(config_filename: str, seed: int) -> dict:
+    """
+    Run every benchmarked method once and plan the statements it executed
+
+    :return: Dict of "method #n" -> dict(query, shape, cost, seq_scans)
+    """
+    generator = random.Random(seed)
+    database = DataInteraction(config_filename)
+
+    try:
+        samples = Samples(database, generator)
+
+        if not database.login(samples.user, generate_data.BENCHMARK_PASSWORD_HASH):
+            raise RuntimeError(f"Could not log in as {samples.user}")
+
+        # In-memory indexes load whole tables by design, build them before the first method would
+        for build in (database.build_isbn_filter, database.load_genres, database.build_follow_graph,
+                      database.build_similarity_index):
+            if not build():
+                raise RuntimeError(f"Could not run {build.__name__}")
+
+        # Bulk jobs read whole tables by design
+        cases = [(name, function) for name, (function, count) in benchmarks(database, samples, generator).items()
+                 if count != BULK_ITERATIONS]
+
+        statements = []
+
+        for name, function in cases:
+            database.capture_statements()
+            function(0)
+            statements.extend((name, query, vars) for _, query, vars in database.capture_statements(False))
+
+        connection = database.open_connection()
+        cursor = connection.cursor()
+        plans = dict()
+        numbers = dict()
+
+        try:
+            for name, query, vars in statements:
+                text = query.decode() if isinstance(query, bytes) else query
+
+                if not text.lstrip().upper().startswith(EXPLAINABLE):
+                    continue
+
+                numbers[name] = numbers.get(name, 0) + 1
+                key = f"{name} #{numbers[name]}"
+
+                try:
+                    cursor.execute("EXPLAIN (FORMAT JSON) " + text, vars)
+                except Exception as e:
+                    plans[key] = {"query": " ".join(text.split()), "error": str(e).strip()}
+                    continue
+
+                plan = cursor.fetchone()[0][0]["Plan"]
+                nodes = list(plan_nodes(plan))
+
+                plans[key] = {
+                    "query": " ".join(text.split()),
+                    "shape": [describe(node) for node in nodes],
+                    "cost": plan["Total Cost"],
+                    "seq_scans": sorted(set(
+                        node["Relation Name"] for node in nodes
+                        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in WATCHED_TABLES
+                    )),
+                }
+        finally:
+            cursor.close()
+            connection.close()
+
+        return plans
+    finally:
+        database.shutdown()
+
+
+def compare(plans: dict, snapshots: dict, tolerance: float) -> tuple[list[str], list[str]]:
+    """
+    :return: tuple(failures, warnings) as messages
+    """
+    failures = []
+    warnings = []
+
+    for key, plan in plans.items():
+        if "error" in plan:
+            failures.append(f"{key}: EXPLAIN failed: {plan['error']}")
+            continue
+
+        for table in plan["seq_scans"]:
+            failures.append(f"{key}: Seq Scan on {table}")
+
+        snapshot = snapshots.get(key)
+
+        if snapshot is None:
+            warnings.append(f"{key}: no snapshot")
+            continue
+
+        if snapshot["query"] != plan["query"]:
+            warnings.append(f"{key}: statement changed since the snapshot")
+
+        if plan["cost"] > snapshot["cost"] * (1 + tolerance):
+            failures.append(f"{key}: estimated cost {plan['cost']} is over {tolerance:.0%} above {snapshot['cost']}")
+
+        if snapshot["shape"] != plan["shape"]:
+            warnings.append(f"{key}: plan changed from [{', '.join(snapshot['shape'])}] to [{', '.join(plan['shape'])}]")
+
+    for key in snapshots:
+        if key not in plans:
+            warnings.append(f"{key}: statement no longer executed")
+
+    return failures, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of the DataInteraction methods")
+    parser.add_argument("--config", default=CONFIG_FILENAME, help="Config file of the local database")
+    parser.add_argument("--scale", type=int, default=None, help="Regenerate the data with this many reads first")
+    parser.add_argument("--snapshots", default=SNAPSHOT_FILENAME, help="Snapshot file")
+    parser.add_argument("--update", action="store_true", help="Record the current plans as the snapshots")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative increase of estimated cost")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    if args.update and args.scale is None:
+        parser.error("--update needs --scale, snapshots record the scale they were taken at")
+
+    if args.scale is not None:
+        print(f"Generating {args.scale} reads...")
+        generate_data.generate(args.config, seed=args.seed, follows_per_user=20, collections_per_user=2,
+                               **generate_data.scale_arguments(args.scale))
+
+    plans = capture_plans(args.config, args.seed)
+
+    if args.update:
+        with open(args.snapshots, "w") as file:
+            json.dump({"scale": args.scale, "plans": plans}, file, indent=4)
+
+        print(f"Recorded {len(plans)} plans to {args.snapshots}")
+
+    if not os.path.exists(args.snapshots):
+        print(f"FAIL no snapshots in {args.snapshots}, record them with --scale {SNAPSHOT_SCALE} --update")
+        sys.exit(1)
+
+    with open(args.snapshots, "r") as file:
+        recorded = json.load(file)
+
+    failures, warnings = compare(plans, recorded["plans"], args.tolerance)
+
+    # Estimated costs grow with the data, they only compare at the scale the snapshots were recorded at
+    if args.scale is None:
+        warnings.append(f"data not regenerated, snapshots are for --scale {recorded['scale']}")
+    elif args.scale != recorded["scale"]:
+        failures.append(f"snapshots were recorded at --scale {recorded['scale']}, not {args.scale}")
+
+    for message in warnings:
+        print(f"WARNING {message}")
+
+    for message in failures:
+        print(f"FAIL {message}")
+
+    print(f"{len(plans)} plans checked, {len(failures)} failures, {len(warnings)} warnings")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+Fill a local Postgres database with a synthetic BadReads dataset at a configurable scale
+
+Usage (from src/, like main.py, since the client keeps its files relative to it):
+    python ../tools/generate_data.py --config ../local_config.json --reads 1000000
+
+The config is the same format as config.json with "use_ssh": false and the local "sql_host", "sql_port" and
+"database". Generating always drops and recreates the public schema, so it refuses to run over ssh.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME
+from interface.Interface import Interface
+
+GENRES_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "genres.csv")
+
+# Password of every generated user, DataInteraction.login takes the stored hash while Interface takes the plaintext
+BENCHMARK_PASSWORD = "benchmark"
+BENCHMARK_PASSWORD_HASH = Interface.hash_password(BENCHMARK_PASSWORD)
+
+# Rows written per COPY batch
+COPY_BATCH = 500_000
+
+BASE_SCHEMA = """
+    DROP SCHEMA public CASCADE;
+    CREATE SCHEMA public;
+
+    CREATE TABLE users
+    (
+        username VARCHAR PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        email VARCHAR NOT NULL,
+        password VARCHAR NOT NULL,
+        datecreated TIMESTAMP NOT NULL,
+        lastaccessed TIMESTAMP NOT NULL
+    );
+
+    CREATE TABLE book
+    (
+        isbn VARCHAR PRIMARY KEY,
+        title VARCHAR NOT NULL,
+        length INT NOT NULL,
+        audience INT NOT NULL,
+        releasedate DATE NOT NULL
+    );
+
+    CREATE TABLE contributor
+    (
+        contributorid SERIAL PRIMARY KEY,
+        name VARCHAR NOT NULL
+    );
+
+    CREATE TABLE authors
+    (
+        isbn VARCHAR REFERENCES book (isbn),
+        contributorid INT REFERENCES contributor (contributorid),
+        PRIMARY KEY (isbn, contributorid)
+    );
+
+    CREATE TABLE publishes
+    (
+        isbn VARCHAR REFERENCES book (isbn),
+        contributorid INT REFERENCES contributor (contributorid),
+        PRIMARY KEY (isbn, contributorid)
+    );
+
+    CREATE TABLE genre
+    (
+        genreid INT PRIMARY KEY,
+        name VARCHAR NOT NULL
+    );
+
+    CREATE TABLE category
+    (
+        isbn VARCHAR REFERENCES book (isbn),
+        genreid INT REFERENCES genre (genreid),
+        PRIMARY KEY (isbn, genreid)
+    );
+
+    CREATE TABLE collections
+    (
+        collectionid SERIAL PRIMARY KEY,
+        name VARCHAR NOT NULL
+    );
+
+    CREATE TABLE creates
+    (
+        username VARCHAR REFERENCES users (username),
+        collectionid INT REFERENCES collections (collectionid),
+        PRIMARY KEY (username, collectionid)
+    );
+
+    CREATE TABLE belongs_to
+    (
+        collectionid INT REFERENCES collections (collectionid),
+        isbn VARCHAR REFERENCES book (isbn),
+        PRIMARY KEY (collectionid, isbn)
+    );
+
+    CREATE TABLE follows
+    (
+        followerusername VARCHAR REFERENCES users (username),
+        followeeusername VARCHAR REFERENCES users (username),
+        PRIMARY KEY (followerusername, followeeusername)
+    );
+
+    CREATE TABLE reads
+    (
+        username VARCHAR REFERENCES users (username),
+        isbn VARCHAR REFERENCES book (isbn),
+        starttime TIMESTAMP NOT NULL,
+        endtime TIMESTAMP NOT NULL,
+        startpage INT NOT NULL,
+        endpage INT NOT NULL
+    );
+
+    CREATE TABLE rates
+    (
+        username VARCHAR REFERENCES users (username),
+        isbn VARCHAR REFERENCES book (isbn),
+        rates INT NOT NULL,
+        PRIMARY KEY (username, isbn)
+    );
+"""
+
+# Created after loading so COPY does not maintain them row by row, the migrations add the query indexes
+BASE_INDEXES = """
+    CREATE INDEX users_email ON users (email);
+    CREATE INDEX book_releasedate ON book (releasedate);
+    CREATE INDEX book_title ON book (title);
+    CREATE INDEX contributor_name ON contributor (name);
+    CREATE INDEX authors_contributor ON authors (contributorid);
+    CREATE INDEX publishes_contributor ON publishes (contributorid);
+    CREATE INDEX category_genre ON category (genreid);
+    CREATE INDEX creates_collection ON creates (collectionid);
+    ANALYZE;
+"""
+
+
+def zipf_choice(generator: np.random.Generator, size: int, count: int, exponent: float = 1.1) -> np.ndarray:
+    """
+    Draw ids in [0, size) where low ids are power-law more popular
+
+    :param generator: Random generator
+    :param size: Number of distinct ids
+    :param count: Number of draws
+    :param exponent: Power-law exponent
+    :return: Array of ids
+    """
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    weights /= weights.sum()
+
+    return generator.choice(size, size=count, p=weights)
+
+
+def copy_rows(cursor, table: str, columns: tuple[str, ...], rows) -> int:
+    """
+    Bulk load rows with COPY in batches
+
+    :param cursor: Database cursor
+    :param table: Table to load
+    :param columns: Column names in row order
+    :param rows: Iterable of row tuples
+    :return: Number of rows loaded
+    """
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+
+        if pending == COPY_BATCH:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            total += pending
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            pending = 0
+
+    if pending != 0:
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        total += pending
+
+    return total
+
+
+def load_genres() -> list[tuple[int, str]]:
+    with open(GENRES_FILENAME, encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        next(reader)
+
+        return [(int(genreid), name) for name, genreid in reader]
+
+
+def generate(config_filename: str, books: int, contributors: int, users: int, reads: int, ratings: int,
+             follows_per_user: float, collections_per_user: float, seed: int = 13) -> dict[str, int]:
+    """
+    Drop the public schema and fill it with a synthetic dataset, then apply the migrations and bulk jobs
+
+    :return: Number of rows of every table
+    """
+    with open(config_filename, "r") as file:
+        if json.load(file).get("use_ssh", True):
+            raise ValueError("Refusing to wipe a database reached over ssh, set \"use_ssh\": false for a local database")
+
+    generator = np.random.default_rng(seed)
+    database = DataInteraction(config_filename)
+    connection = database.open_connection()
+    cursor = connection.cursor()
+
+    counts = dict()
+
+    try:
+        cursor.execute(BASE_SCHEMA)
+
+        isbns = [f"978{i:010d}" for i in range(books)]
+        usernames = [f"user{i}" for i in range(users)]
+        words = ("Night", "River", "Shadow", "Garden", "Empire", "Secret", "Winter", "Machine", "Song", "House",
+                 "Stone", "Light", "Ocean", "Fire", "Letters", "City", "Dream", "Crown", "Road", "Silence")
+
+        now = np.datetime64("now", "s")
+        day = np.timedelta64(1, "D")
+
+        genres = load_genres()
+        counts["genre"] = copy_rows(cursor, "genre", ("genreid", "name"), genres)
+
+        counts["contributor"] = copy_rows(cursor, "contributor", ("contributorid", "name"),
+                                          ((i + 1, f"Contributor {i}") for i in range(contributors)))
+        cursor.execute(f"SELECT setval('contributor_contributorid_seq', {contributors});")
+
+        # A quarter of the books came out in the last 90 days so the top lists have data
+        ages = np.where(generator.random(books) < 0.25, generator.integers(0, 90, books),
+                        generator.integers(90, 30 * 365, books))
+        release_dates = (now - ages * day).astype("datetime64[D]")
+        lengths = generator.integers(50, 1200, books)
+        audiences = generator.integers(0, 3, books)
+        title_words = generator.integers(0, len(words), (books, 3))
+
+        counts["book"] = copy_rows(cursor, "book", ("isbn", "title", "length", "audience", "releasedate"), (
+            (isbns[i], f"The {words[title_words[i, 0]]} of {words[title_words[i, 1]]} {words[title_words[i, 2]]} {i}",
+             int(lengths[i]), int(audiences[i]), str(release_dates[i]))
+            for i in range(books)
+        ))
+
+        # Authors are the first 95% of contributors, publishers the rest
+        num_publishers = max(1, contributors // 20)
+        num_authors = max(1, contributors - num_publishers)
+
+        author_counts = generator.integers(1, 4, books)
+        author_books = np.repeat(np.arange(books), author_counts)
+        author_ids = zipf_choice(generator, num_authors, len(author_books), 0.8) + 1
+        counts["authors"] = copy_rows(cursor, "authors", ("isbn", "contributorid"),
+                                      set((isbns[b], int(a)) for b, a in zip(author_books, author_ids)))
+
+        publisher_ids = zipf_choice(generator, num_publishers, books, 0.8) + num_authors + 1
+        counts["publishes"] = copy_rows(cursor, "publishes", ("isbn", "contributorid"),
+                                        ((isbns[b], int(publisher_ids[b])) for b in range(books)))
+
+        genre_ids = np.array([genreid for genreid, _ in genres])
+        genre_counts = generator.integers(1, 4, books)
+        genre_books = np.repeat(np.arange(books), genre_counts)
+        genre_choices = genre_ids[zipf_choice(generator, len(genre_ids), len(genre_books), 0.7)]
+        counts["category"] = copy_rows(cursor, "category", ("isbn", "genreid"),
+                                       set((isbns[b], int(g)) for b, g in zip(genre_books, genre_choices)))
+
+        # A few users share an email address
+        emails = generator.integers(0, max(1, int(users * 0.9)), users)
+        created = now - generator.integers(1, 5 * 365, users) * day
+        counts["users"] = copy_rows(cursor, "users", ("username", "name", "email", "password", "datecreated", "lastaccessed"), (
+            (usernames[i], f"User {i}", f"reader{emails[i]}@example.com", BENCHMARK_PASSWORD_HASH, str(created[i]), str(now))
+            for i in range(users)
+        ))
+
+        # Power-law follow graph: Pareto out-degrees and preferential followees
+        out_degrees = np.minimum(generator.pareto(1.5, users) * (follows_per_user - 1) / 2 + 1, users - 1).astype(int)
+        followers = np.repeat(np.arange(users), out_degrees)
+        followees = zipf_choice(generator, users, len(followers), 1.0)
+        keep = followers != followees
+        counts["follows"] = copy_rows(cursor, "follows", ("followerusername", "followeeusername"),
+                                      set((usernames[f], usernames[t]) for f, t in zip(followers[keep], followees[keep])))
+
+        # Reading sessions by power-law active users over power-law popular books
+        read_users = zipf_choice(generator, users, reads, 0.9)
+        read_books = zipf_choice(generator, books, reads, 0.9)
+        starts = now - generator.integers(0, 2 * 365 * 24 * 60, reads) * np.timedelta64(1, "m")
+        durations = generator.integers(15, 300, reads) * np.timedelta64(1, "m")
+        start_pages = (generator.random(reads) * lengths[read_books] * 0.9).astype(int)
+        end_pages = np.minimum(start_pages + generator.integers(1, 80, reads), lengths[read_books])
+        counts["reads"] = copy_rows(cursor, "reads", ("username", "isbn", "starttime", "endtime", "startpage", "endpage"), (
+            (usernames[read_users[i]], isbns[read_books[i]], str(starts[i]), str(starts[i] + durations[i]),
+             int(start_pages[i]), int(end_pages[i]))
+            for i in range(reads)
+        ))
+
+        rate_users = zipf_choice(generator, users, ratings, 0.9)
+        rate_books = zipf_choice(generator, books, ratings, 0.9)
+        rate_values = generator.integers(1, 6, ratings)
+        rated = dict(((usernames[u], isbns[b]), int(r)) for u, b, r in zip(rate_users, rate_books, rate_values))
+        counts["rates"] = copy_rows(cursor, "rates", ("username", "isbn", "rates"),
+                                    ((u, b, r) for (u, b), r in rated.items()))
+
+        collection_owners = np.repeat(np.arange(users), generator.poisson(collections_per_user, users))
+        num_collections = len(collection_owners)
+        counts["collections"] = copy_rows(cursor, "collections", ("collectionid", "name"),
+                                          ((i + 1, f"Collection {i}") for i in range(num_collections)))
+        cursor.execute(f"SELECT setval('collections_collectionid_seq', {max(num_collections, 1)});")
+        counts["creates"] = copy_rows(cursor, "creates", ("username", "collectionid"),
+                                      ((usernames[owner], i + 1) for i, owner in enumerate(collection_owners)))
+
+        collection_sizes = generator.geometric(0.05, num_collections)
+        member_collections = np.repeat(np.arange(num_collections), collection_sizes)
+        member_books = zipf_choice(generator, books, len(member_collections), 0.7)
+        counts["belongs_to"] = copy_rows(cursor, "belongs_to", ("collectionid", "isbn"),
+                                         set((int(c) + 1, isbns[b]) for c, b in zip(member_collections, member_books)))
+
+        cursor.execute(BASE_INDEXES)
+    finally:
+        cursor.close()
+        connection.close()
+
+    try:
+        if not database.migrate():
+            raise RuntimeError("Failed to apply migrations")
+
+        database.rebuild_following_feed()
+        database.rebuild_genre_closure()
+        database.rebuild_collection_counters()
+        database.rebuild_user_counters()
+    finally:
+        database.shutdown()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic BadReads dataset in a local database")
+    parser.add_argument("--config", default=CONFIG_FILENAME, help="Config file of the local database")
+    parser.add_argument("--reads", type=int, default=100_000, help="Number of reading sessions")
+    parser.add_argument("--books", type=int, default=None, help="Number of books (default reads / 10)")
+    parser.add_argument("--contributors", type=int, default=None, help="Number of contributors (default books / 2)")
+    parser.add_argument("--users", type=int, default=None, help="Number of users (default reads / 20)")
+    parser.add_argument("--ratings", type=int, default=None, help="Number of ratings (default reads / 4)")
+    parser.add_argument("--follows-per-user", type=float, default=20, help="Mean follows per user")
+    parser.add_argument("--collections-per-user", type=float, default=2, help="Mean collections per user")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.config, **scale_arguments(args.reads, args.books, args.contributors, args.users,
+                                                     args.ratings), follows_per_user=args.follows_per_user,
+                      collections_per_user=args.collections_per_user, seed=args.seed)
+
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+
+    print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+
+def scale_arguments(reads: int, books: int = None, contributors: int = None, users: int = None,
+                    ratings: int = None) -> dict[str, int]:
+    """
+    Derive table sizes from the number of reads where they are not given
+
+    :return: Keyword arguments for generate()
+    """
+    books = books if books is not None else max(100, reads // 10)
+
+    return {
+        "reads": reads,
+        "books": books,
+        "contributors": contributors if contributors is not None else max(40, books // 2),
+        "users": users if users is not None else max(50, reads // 20),
+        "ratings": ratings if ratings is not None else max(10, reads // 4),
+    }
+
+
+if __name__ == "__main__":
+    main()
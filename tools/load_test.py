@@ -0,0 +1,297 @@
+"""
+Simulate many concurrent users driving the Interface commands against a generated dataset
+
+Usage (from src/, like main.py):
+    python ../tools/load_test.py --config ../local_config.json --sessions 200 --duration 60
+
+Every session is a thread running its own Interface and Session over one shared DataInteraction, so the sessions
+multiplex over --connections pooled connections. Each logs in as a generated user and then runs commands picked
+from a weighted mix, pausing for a random think time between them. Prompts are answered from a script instead of
+input().
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_interaction.CachedDataInteraction import CachedDataInteraction
+from data_interaction.DataInteraction import DataInteraction, CONFIG_FILENAME
+from data_interaction.Session import Session
+from interface.Interface import Interface
+from benchmark import Samples
+import generate_data
+
+DEFAULT_MIX = "search books=30,read book=20,rate book=15,top books=15,recommendations=10,login=10"
+
+# Seconds between samples of the database lock waits
+LOCK_SAMPLE_INTERVAL = 0.5
+
+LOCK_WAITS = """
+    SELECT COUNT(*)
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND wait_event_type = 'Lock';
+"""
+
+DEADLOCKS = "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database();"
+
+
+class ScriptExhausted(Exception):
+    """
+    Raised when a command asks for more input than its script holds, e.g. re-prompting after an invalid answer
+    """
+
+
+class Script:
+    """
+    Answers to the prompts of one command, shared by input and password prompts
+    """
+
+    def __init__(self):
+        self.__answers = []
+
+    def load(self, answers: list) -> None:
+        self.__answers = [str(answer) for answer in answers]
+        self.__answers.reverse()
+
+    def __call__(self, prompt: str = "") -> str:
+        if len(self.__answers) == 0:
+            raise ScriptExhausted(prompt)
+
+        return self.__answers.pop()
+
+
+def command_script(command: str, samples: Samples, username: str, generator: random.Random) -> list:
+    """
+    :return: Answers to the prompts of a command with sampled values
+    """
+    if command == "login":
+        return [username, generate_data.BENCHMARK_PASSWORD]
+    elif command == "search books":
+        method, value = generator.choice((
+            ("name", samples.pick(samples.words)),
+            ("release_date", samples.pick(samples.dates)),
+            ("author", samples.pick(samples.authors)),
+            ("publisher", samples.pick(samples.publishers)),
+            ("genre", samples.pick(samples.genres).strip()),
+        ))
+        return [method, value, generator.choice(("name", "publisher", "genre", "release year")), generator.choice("ad")]
+    elif command == "read book":
+        return [samples.pick(samples.isbns), 1, generator.randint(2, 50)]
+    elif command == "rate book":
+        return [samples.pick(samples.isbns), generator.randint(1, 5)]
+
+    return []
+
+
+class LoadResults:
+    """
+    Per-command latencies and errors collected from every session
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.latencies = dict()
+        self.errors = dict()
+        self.error_messages = dict()
+
+    def record(self, command: str, elapsed_ms: float, error: str = None) -> None:
+        with self.__lock:
+            self.latencies.setdefault(command, []).append(elapsed_ms)
+
+            if error is not None:
+                self.errors[command] = self.errors.get(command, 0) + 1
+                self.error_messages[error] = self.error_messages.get(error, 0) + 1
+
+
+def think_time(distribution: str, mean_ms: float, generator: random.Random) -> float:
+    """
+    :return: Seconds to pause between commands
+    """
+    if distribution == "fixed":
+        return mean_ms / 1000
+    elif distribution == "uniform":
+        return generator.uniform(0, 2 * mean_ms) / 1000
+
+    return generator.expovariate(1000 / mean_ms) if mean_ms > 0 else 0.0
+
+
+def run_session(number: int, args, database: DataInteraction, samples: Samples, mix: list[tuple[str, float]],
+                results: LoadResults, stop: threading.Event, ready: threading.Barrier) -> None:
+    generator = random.Random(args.seed + number)
+    username = samples.usernames[number % len(samples.usernames)]
+    script = Script()
+    interface = Interface(database.bind(Session()), prompt = script, secret_prompt = script)
+
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        return
+
+    commands = [command for command, _ in mix]
+    weights = [weight for _, weight in mix]
+    first = True
+
+    try:
+        while not stop.is_set():
+            # Every session starts by logging in so the other commands pass the login check
+            command = "login" if first else generator.choices(commands, weights)[0]
+            first = False
+
+            script.load(command_script(command, samples, username, generator))
+            start = time.perf_counter()
+            error = None
+
+            try:
+                if interface.command_mapping[command]() == False:
+                    error = "command failed"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+            results.record(command, (time.perf_counter() - start) * 1000, error)
+
+            stop.wait(think_time(args.think, args.think_ms, generator))
+    finally:
+        interface.shutdown()
+
+
+def monitor_locks(database: DataInteraction, stop: threading.Event, samples: list) -> None:
+    """
+    Sample the number of backends waiting on a lock until stopped
+    """
+    connection = database.open_connection()
+    cursor = connection.cursor()
+
+    try:
+        while not stop.wait(LOCK_SAMPLE_INTERVAL):
+            cursor.execute(LOCK_WAITS)
+            samples.append(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent simulated BadReads sessions")
+    parser.add_argument("--config", default=CONFIG_FILENAME, help="Config file of the local database")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent sessions")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run for")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma separated command=weight pairs")
+    parser.add_argument("--think", choices=("exponential", "uniform", "fixed"), default="exponential",
+                        help="Distribution of the pause between commands")
+    parser.add_argument("--think-ms", type=float, default=1000, help="Mean pause between commands")
+    parser.add_argument("--connections", type=int, default=8, help="Pooled connections shared by the sessions")
+    parser.add_argument("--cached", action="store_true", help="Use a CachedDataInteraction like main.py")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    mix = []
+    for pair in args.mix.split(","):
+        command, weight = pair.split("=")
+        mix.append((command.strip(), float(weight)))
+
+    if args.cached:
+        database = CachedDataInteraction(config_filename = args.config, pool_size = args.connections)
+    else:
+        database = DataInteraction(args.config, args.connections)
+
+    # Fail before starting any session on a typo in the mix
+    unknown = [command for command, _ in mix if command not in Interface(database).command_mapping]
+    if unknown:
+        database.shutdown()
+        parser.error(f"Unknown commands in mix: {', '.join(unknown)}")
+
+    # Sampling and lock monitoring use their own connections outside of the shared pool
+    samples = Samples(database, random.Random(args.seed))
+
+    connection = database.open_connection()
+    cursor = connection.cursor()
+    cursor.execute(DEADLOCKS)
+    deadlocks_before = cursor.fetchone()[0]
+
+    results = LoadResults()
+    stop = threading.Event()
+    ready = threading.Barrier(args.sessions + 1)
+    lock_samples = []
+
+    print(f"Starting {args.sessions} sessions...")
+
+    # Commands print their results, silence them while the sessions run
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    threads = [
+        threading.Thread(target=run_session, args=(i, args, database, samples, mix, results, stop, ready), daemon=True)
+        for i in range(args.sessions)
+    ]
+
+    try:
+        for thread in threads:
+            thread.start()
+
+        ready.wait()
+        monitor = threading.Thread(target=monitor_locks, args=(database, stop, lock_samples), daemon=True)
+        monitor.start()
+
+        start = time.perf_counter()
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        elapsed = time.perf_counter() - start if "start" in locals() else 0.0
+
+        for thread in threads:
+            thread.join()
+
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    cursor.execute(DEADLOCKS)
+    deadlocks = cursor.fetchone()[0] - deadlocks_before
+    cursor.close()
+    connection.close()
+    database.shutdown()
+
+    rows = []
+    total = 0
+    total_errors = 0
+
+    for command, latencies in sorted(results.latencies.items()):
+        latencies = np.array(latencies)
+        errors = results.errors.get(command, 0)
+        total += len(latencies)
+        total_errors += errors
+
+        rows.append((
+            command, len(latencies), round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            f"{errors / len(latencies):.1%}", round(float(latencies.mean()), 2),
+            round(float(np.percentile(latencies, 50)), 2), round(float(np.percentile(latencies, 95)), 2),
+            round(float(np.percentile(latencies, 99)), 2)
+        ))
+
+    print(tabulate(rows, headers=["Command", "Count", "Per second", "Errors", "Mean ms", "p50 ms", "p95 ms", "p99 ms"]))
+    print()
+    print(f"{total} commands in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s), "
+          f"{total_errors / total if total else 0:.1%} errors")
+
+    if lock_samples:
+        print(f"Backends waiting on locks: mean {np.mean(lock_samples):.2f}, max {max(lock_samples)}")
+
+    print(f"Deadlocks: {deadlocks}")
+
+    if results.error_messages:
+        print()
+        print(tabulate(sorted(results.error_messages.items(), key=lambda item: -item[1]), headers=["Error", "Count"]))
+
+
+if __name__ == "__main__":
+    main()
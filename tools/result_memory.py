@@ -0,0 +1,90 @@
+"""
+Compare the memory of a book result held as a list of tuples and as a BookResultSet
+
+Usage (from src/, like main.py):
+    python ../tools/result_memory.py --rows 1000000
+
+Rows are synthetic but shaped like search_for_book results: unique titles and isbns, power-law popular author lists
+and publishers, and a fresh string object per cell like psycopg2 returns. No database is needed.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_interaction.BookResultSet import AUDIENCES, BookResultSet
+import generate_data
+
+
+def synthetic_rows(rows: int, authors: int, publishers: int, seed: int):
+    """
+    Yield rows as tuple(name, authors, publisher, length, audience, rating, isbn)
+    """
+    generator = np.random.default_rng(seed)
+    author_ids = generate_data.zipf_choice(generator, authors, rows)
+    publisher_ids = generate_data.zipf_choice(generator, publishers, rows)
+    lengths = generator.integers(50, 1200, rows)
+    audiences = generator.integers(0, len(AUDIENCES), rows)
+    ratings = generator.integers(0, 6, rows)
+
+    for number in range(rows):
+        # Formatted at runtime so equal values are separate objects, as they are when decoded from the wire
+        yield (
+            f"Book {number}", f"Author {author_ids[number]}, Author {author_ids[number] + 1}",
+            f"Publisher {publisher_ids[number]}", int(lengths[number]), f"{AUDIENCES[audiences[number]]}",
+            int(ratings[number]) or None, f"{9780000000000 + number}"
+        )
+
+
+def measure(build, rows) -> tuple[float, int]:
+    """
+    :return: Seconds to build and bytes still allocated by the built result
+    -- The row generator's id arrays are freed once it is exhausted so only the result is left
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    result = build(rows)
+
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del result
+
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory of book results")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of books in the result")
+    parser.add_argument("--authors", type=int, default=50_000, help="Number of distinct author lists")
+    parser.add_argument("--publishers", type=int, default=2_000, help="Number of distinct publishers")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    results = []
+
+    for name, build in (("list of tuples", list), ("BookResultSet", BookResultSet)):
+        elapsed, size = measure(build, synthetic_rows(args.rows, args.authors, args.publishers, args.seed))
+        results.append((name, size, elapsed))
+
+    baseline = results[0][1]
+
+    print(tabulate(
+        [(name, f"{size / 2 ** 20:.1f}", f"{size / args.rows:.0f}", f"{size / baseline:.0%}", f"{elapsed:.2f}")
+         for name, size, elapsed in results],
+        headers=["Container", "MiB", "Bytes per row", "Of tuples", "Build s"]
+    ))
+
+
+if __name__ == "__main__":
+    main()